@@ -0,0 +1,177 @@
+# ============================================
+# admin_jobs.py – Hintergrund-Jobs für die Admin-Seite (Exporte, Löschen)
+# ============================================
+#
+# Excel-Dateien, Chat-Export, Studien-Archiv und Löschen liefen im Script-Run
+# des Admins – auf denselben Server-Threads, die auch die Participants bedienen.
+# Jetzt:
+#   - ein Job pro Aktion, gestartet per Button; Status, Fortschritt und Ergebnis
+#     (Download) bleiben im Prozess (st.cache_resource), der Admin-Run kehrt sofort zurück
+#   - DB-Arbeit (COPY, DELETE, Abfragen) in einem kleinen Thread-Pool
+#     (ADMIN_JOB_THREADS, Standard 1: Jobs laufen nacheinander)
+#   - CPU-lastiges pandas/openpyxl in einem eigenen Prozess mit niedriger
+#     Priorität (ADMIN_JOB_PROCESSES), der GIL des Streamlit-Prozesses bleibt frei
+#
+# Die Funktionen für den Prozess-Pool (excel_bytes, chats_to_txt) bekommen nur
+# DataFrames und liefern bytes/str – kein Streamlit, keine DB.
+
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from ui_common import format_ts
+
+# fertige Jobs (inkl. Ergebnis-Bytes) bleiben bis zu dieser Anzahl im Speicher
+MAX_FINISHED_JOBS = 20
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+# -----------------------------
+# Arbeit im Prozess-Pool
+# -----------------------------
+def _lower_priority():
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+
+def excel_bytes(df: pd.DataFrame) -> bytes:
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def chats_to_txt(df: pd.DataFrame) -> str:
+    """df: session_id, role, text, ts (nach session_id, msg_index sortiert)."""
+    if df.empty:
+        return "Keine Chatverläufe vorhanden."
+
+    out = []
+    for session_id, group in df.groupby("session_id", sort=False):
+        out.append(f"Session-ID: {session_id}")
+        out.append("-" * 50)
+        for role, text, ts in zip(group["role"], group["text"], group["ts"]):
+            role = "USER" if role == "user" else "BOT"
+            out.append(f"[{format_ts(ts)}] {role}: {text}")
+        out.append("\n" + "=" * 60 + "\n")
+
+    return "\n".join(out)
+
+
+# -----------------------------
+# Jobs
+# -----------------------------
+class Job:
+    __slots__ = (
+        "id", "label", "study_id", "status", "progress", "message",
+        "result", "file_name", "mime", "error", "created", "finished",
+    )
+
+    def __init__(self, label: str, study_id: str | None, file_name: str | None, mime: str | None):
+        self.id = uuid.uuid4().hex[:8]
+        self.label = label
+        self.study_id = study_id
+        self.status = "wartend"  # wartend | läuft | fertig | fehler
+        self.progress = 0.0
+        self.message = ""
+        self.result: bytes | str | None = None
+        self.file_name = file_name
+        self.mime = mime
+        self.error: str | None = None
+        self.created = time.time()
+        self.finished: float | None = None
+
+    def update(self, progress: float, message: str = ""):
+        self.progress = min(max(progress, 0.0), 1.0)
+        self.message = message
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("fertig", "fehler")
+
+
+class JobRunner:
+    def __init__(self, threads: int = 1, processes: int = 1):
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="admin-job")
+        self._n_processes = processes
+        self._processes: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.jobs: dict[str, Job] = {}
+
+    def submit(self, label: str, fn, *args, study_id: str | None = None,
+               file_name: str | None = None, mime: str | None = None) -> Job:
+        """fn(job, *args) läuft im Thread-Pool; Rückgabewert = Ergebnis zum Download."""
+        job = Job(label, study_id, file_name, mime)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        # Script-Kontext mitgeben, damit st.secrets/st.cache_* im Job greifen (wie warmup.py)
+        ctx = get_script_run_ctx()
+        self._threads.submit(self._run, job, ctx, fn, args)
+        return job
+
+    def _run(self, job: Job, ctx, fn, args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        job.status = "läuft"
+        try:
+            job.result = fn(job, *args)
+            job.status = "fertig"
+            job.update(1.0, job.message)
+        except Exception as e:
+            job.status = "fehler"
+            job.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            add_script_run_ctx(threading.current_thread(), None)
+
+    def run_cpu(self, fn, *args):
+        """fn(*args) im Prozess-Pool ausführen und auf das Ergebnis warten (aus einem Job heraus)."""
+        with self._lock:
+            if self._processes is None:
+                # spawn statt fork: der Streamlit-Prozess hat viele Threads
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self._n_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_lower_priority,
+                )
+        return self._processes.submit(fn, *args).result()
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self.jobs.pop(job_id, None)
+
+    def running(self, label: str, study_id: str | None = None) -> Job | None:
+        """Noch nicht abgeschlossener Job gleicher Art (Doppelklick -> kein zweiter Job)."""
+        for job in self.list():
+            if job.label == label and job.study_id == study_id and not job.done:
+                return job
+        return None
+
+    def _prune(self):
+        finished = sorted((j for j in self.jobs.values() if j.done), key=lambda j: j.finished)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    return JobRunner(
+        threads=int(st.secrets.get("ADMIN_JOB_THREADS", 1)),
+        processes=int(st.secrets.get("ADMIN_JOB_PROCESSES", 1)),
+    )
@@ -0,0 +1,255 @@
+# ============================================
+# batch_offer_features.py – Preis-/Zusage-/Beleidigungs-Features für den ganzen Korpus
+# ============================================
+#
+# Wendet die Logik aus offer_parsing.py (extract_user_offer, user_accepts_price,
+# Beleidigungs-Check) vektorisiert mit pandas-String-Operationen auf
+# chat_messages an. Die Zeilen kommen in Chunks über einen serverseitigen
+# Cursor, es liegt also nie der ganze Korpus im Speicher.
+#
+# Ergebnis: eine Feature-Tabelle pro Nachricht (CSV, Kompression nach Endung)
+# und ein Abgleich mit den Einzelfunktionen: jede Abweichung zwischen
+# vektorisierter und Pro-Nachricht-Implementierung wird gezählt und mit
+# Beispielen ausgegeben. So lassen sich historische Sessions nachrechnen und
+# Extraktor-Änderungen vor dem Deployment gegen echte Formulierungen prüfen.
+#
+# Beispiele:
+#   python batch_offer_features.py --db "$PROD_DB" --study wave1 --out features.csv.gz
+#   python batch_offer_features.py --synthetic 1000000 --no-check     # nur Durchsatz
+
+import argparse
+import random
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from offer_parsing import (
+    ACCEPT_WORDS, INSULT_RE, OFFER_KEYWORDS, PLAIN_OFFER_RE, PRICE_MAX, PRICE_MIN,
+    PRICE_TOKEN_RE, SPEC_NUMBERS, TOO_MUCH_PATTERNS, UNIT_WORDS_AFTER_NUMBER,
+    contains_insult, extract_user_offer, user_accepts_price,
+)
+
+FEATURE_COLUMNS = [
+    "session_id", "msg_index", "role", "user_price", "too_much", "has_offer_hint",
+    "accept_word", "first_number", "last_bot_offer", "accepts_last_offer", "insult",
+]
+
+# Kandidat + die 12 Zeichen danach (Lookahead, damit nahe Zahlen nicht verschluckt werden)
+_CANDIDATE_RE = PRICE_TOKEN_RE.pattern + r"(?=([\s\S]{0,12}))"
+_OFFER_HINT_RE = "|".join(re.escape(k) for k in OFFER_KEYWORDS + ["€", " eur", " euro"])
+_ACCEPT_RE = "|".join(re.escape(w) for w in ACCEPT_WORDS)
+
+
+def _to_int(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce")
+
+
+def _noncapturing(pattern: str) -> str:
+    # str.contains warnt bei Gruppen; für Ja/Nein-Tests reichen (?:...)
+    return re.sub(r"(?<!\\)\((?!\?)", "(?:", pattern)
+
+
+# -----------------------------
+# Vektorisierte Features
+# -----------------------------
+def offer_features(df: pd.DataFrame) -> pd.DataFrame:
+    """df: session_id, msg_index, role, text[, last_bot_offer] -> Feature-Tabelle."""
+    text = df["text"].fillna("").astype(str)
+    t = text.str.strip().str.lower()
+    out = df[["session_id", "msg_index", "role"]].copy()
+
+    # 1) reine Zahl (contains/replace laufen bei Arrow-Strings in re2, extract nicht)
+    is_plain = t.str.contains(_noncapturing(PLAIN_OFFER_RE.pattern), regex=True)
+    plain = _to_int(t.where(is_plain).str.replace(r"^\s*(\d{2,5})[\s\S]*$", r"\1", regex=True))
+    plain = plain.where(plain.between(PRICE_MIN, PRICE_MAX))
+
+    # 2) "zu teuer"
+    too_much = np.zeros(len(df), dtype=bool)
+    for pat in TOO_MUCH_PATTERNS:
+        too_much |= t.str.contains(_noncapturing(pat), regex=True).to_numpy()
+
+    hint = t.str.contains(_OFFER_HINT_RE, regex=True).to_numpy()
+
+    # Kandidaten aus dem Originaltext (Groß-/Kleinschreibung wie im Einzelaufruf);
+    # findall + explode ist hier deutlich schneller als extractall
+    found = text.str.findall(_CANDIDATE_RE).explode().dropna()
+    cand = pd.DataFrame(found.tolist(), index=found.index, columns=["num", "after"])
+    cand["num"] = cand["num"].astype(np.int64)
+    cand["after"] = cand["after"].astype("str")
+    keep = (
+        cand["num"].between(PRICE_MIN, PRICE_MAX)
+        & ~cand["after"].str.contains(_noncapturing(UNIT_WORDS_AFTER_NUMBER.pattern), case=False, regex=True)
+        & ~cand["num"].isin(SPEC_NUMBERS)
+    )
+    cand = cand.loc[keep, "num"]
+    by_msg = cand.groupby(level=0)
+    last_cand = by_msg.last().reindex(df.index)
+    n_cand = by_msg.size().reindex(df.index, fill_value=0)
+    only_cand = last_cand.where(n_cand == 1)
+
+    price = np.where(hint, last_cand, only_cand)
+    price = np.where(too_much, np.nan, price)
+    price = np.where(plain.notna(), plain, price)
+    price = np.where(text == "", np.nan, price)
+    out["user_price"] = pd.array(price, dtype="Int64")
+    out["too_much"] = too_much
+    out["has_offer_hint"] = hint
+
+    # Deal per Nachricht: Zusage-Wort und erste Zahl (dann muss sie dem Angebot entsprechen)
+    accept_word = t.str.contains(_ACCEPT_RE, regex=True)
+    has_number = t.str.contains(r"\d{2}", regex=True)
+    first_number = _to_int(t.where(has_number).str.replace(r"^[\s\S]*?(\d{2,5})[\s\S]*$", r"\1", regex=True))
+    out["accept_word"] = accept_word.to_numpy()
+    out["first_number"] = pd.array(first_number, dtype="Int64")
+    offer = df["last_bot_offer"] if "last_bot_offer" in df else pd.Series(np.nan, index=df.index)
+    out["last_bot_offer"] = pd.array(pd.to_numeric(offer, errors="coerce"), dtype="Int64")
+    accepts = accept_word & (first_number.isna() | (first_number == offer))
+    out["accepts_last_offer"] = accepts.where(offer.notna()).astype("boolean")
+
+    out["insult"] = t.str.contains(_noncapturing(INSULT_RE.pattern), regex=True).to_numpy()
+    return out[FEATURE_COLUMNS]
+
+
+# -----------------------------
+# Abgleich mit den Einzelfunktionen
+# -----------------------------
+def disagreements(df: pd.DataFrame, feats: pd.DataFrame) -> pd.DataFrame:
+    rows = []
+    for text, f in zip(df["text"].tolist(), feats.itertuples(index=False)):
+        ref_price = extract_user_offer(text)
+        vec_price = None if pd.isna(f.user_price) else int(f.user_price)
+        if ref_price != vec_price:
+            rows.append((f.session_id, f.msg_index, "user_price", text, ref_price, vec_price))
+
+        ref_insult = contains_insult(text)
+        if ref_insult != bool(f.insult):
+            rows.append((f.session_id, f.msg_index, "insult", text, ref_insult, bool(f.insult)))
+
+        if not pd.isna(f.last_bot_offer):
+            ref_acc = user_accepts_price(text, int(f.last_bot_offer))
+            if ref_acc != bool(f.accepts_last_offer):
+                rows.append((f.session_id, f.msg_index, "accepts_last_offer", text, ref_acc, bool(f.accepts_last_offer)))
+    return pd.DataFrame(rows, columns=["session_id", "msg_index", "feature", "text", "per_message", "vectorized"])
+
+
+# -----------------------------
+# Eingaben
+# -----------------------------
+def iter_db_chunks(dsn: str, study: str | None, chunk_size: int):
+    """chat_messages in Chunks; last_bot_offer aus negotiation_events, falls vorhanden."""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor(name="offer_features")  # serverseitiger Cursor
+    cur.itersize = chunk_size
+    cur.execute("""
+        SELECT m.session_id, m.msg_index, m.role, m.text, e.last_bot_offer
+        FROM chat_messages m
+        LEFT JOIN LATERAL (
+            SELECT last_bot_offer FROM negotiation_events e
+            WHERE e.session_id = m.session_id AND e.study_id = m.study_id
+              AND m.role = 'user'
+              AND e.turn_index = (
+                  SELECT COUNT(*) FROM chat_messages u
+                  WHERE u.session_id = m.session_id AND u.study_id = m.study_id
+                    AND u.role = 'user' AND u.msg_index <= m.msg_index
+              )
+            LIMIT 1
+        ) e ON TRUE
+        WHERE (%s::text IS NULL OR m.study_id = %s)
+        ORDER BY m.session_id, m.msg_index
+    """, (study, study))
+    columns = ["session_id", "msg_index", "role", "text", "last_bot_offer"]
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield pd.DataFrame(rows, columns=columns)
+    conn.close()
+
+
+SYNTHETIC_PHRASES = [
+    "{p}", "{p} €", "Ich biete {p} Euro.", "Mein Angebot: {p}€", "Wie wäre es mit {p}?",
+    "{p} ist mir zu teuer", "Zu teuer, {p} wäre ok", "Deal", "ok, {p} passt", "Einverstanden!",
+    "Hat das iPad 256 GB?", "Ist der Pencil 2. Gen dabei? {p}", "Ich zahle {p} für das 13 Zoll Modell",
+    "Hallo, was ist der Zustand?", "Du Arschloch", "Verstanden, dann {p} und nicht mehr",
+    "Würde {p} oder {q} geben", "Für {p} nehme ich es sofort", "M5 chip für {p}?", "okay",
+]
+
+
+def synthetic_chunks(n: int, chunk_size: int, seed: int = 0):
+    # Lasttest ohne DB: Phrasen mit echten Preisbereichen und Spec-Zahlen
+    rnd = random.Random(seed)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        texts = [
+            rnd.choice(SYNTHETIC_PHRASES).format(p=rnd.choice([rnd.randint(500, 1000), 256, 13, 64]),
+                                                 q=rnd.randint(500, 1000))
+            for _ in range(size)
+        ]
+        yield pd.DataFrame({
+            "session_id": [f"syn-{(start + i) // 12}" for i in range(size)],
+            "msg_index": [(start + i) % 12 for i in range(size)],
+            "role": "user",
+            "text": texts,
+            "last_bot_offer": [rnd.choice([None, 850, 900, 950]) for _ in range(size)],
+        }, index=range(start, start + size))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Vektorisierte Preis-/Zusage-/Beleidigungs-Features für chat_messages.")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--db", help="DB mit chat_messages (nur lesend)")
+    src.add_argument("--synthetic", type=int, metavar="N", help="N synthetische Nachrichten statt DB")
+    ap.add_argument("--study", default=None, help="nur diese study_id")
+    ap.add_argument("--chunk-size", type=int, default=100_000)
+    ap.add_argument("--out", default=None, help="Feature-Tabelle als CSV (.gz/.zip/.bz2 werden komprimiert)")
+    ap.add_argument("--no-check", action="store_true", help="Abgleich mit den Einzelfunktionen überspringen")
+    ap.add_argument("--disagreements", default=None, help="alle Abweichungen als CSV")
+    ap.add_argument("--examples", type=int, default=10, help="Beispiele pro Feature in der Ausgabe")
+    args = ap.parse_args()
+
+    chunks = (synthetic_chunks(args.synthetic, args.chunk_size) if args.synthetic
+              else iter_db_chunks(args.db, args.study, args.chunk_size))
+
+    n_rows = 0
+    t_vec = t_check = 0.0
+    diff_frames = []
+    first = True
+    for df in chunks:
+        t0 = time.perf_counter()
+        feats = offer_features(df)
+        t_vec += time.perf_counter() - t0
+        n_rows += len(df)
+
+        if args.out:
+            feats.to_csv(args.out, mode="w" if first else "a", header=first, index=False)
+        first = False
+
+        if not args.no_check:
+            t0 = time.perf_counter()
+            diff_frames.append(disagreements(df, feats))
+            t_check += time.perf_counter() - t0
+
+    rate = n_rows / t_vec if t_vec else 0.0
+    print(f"{n_rows} Nachrichten, vektorisiert {t_vec:.2f} s ({rate:,.0f} Nachrichten/s)")
+    if args.no_check:
+        return 0
+
+    diffs = pd.concat(diff_frames, ignore_index=True) if diff_frames else pd.DataFrame()
+    print(f"Abgleich mit den Einzelfunktionen: {t_check:.2f} s, {len(diffs)} Abweichungen")
+    if not diffs.empty:
+        for feature, group in diffs.groupby("feature"):
+            print(f"\n{feature}: {len(group)} Abweichungen")
+            for row in group.head(args.examples).itertuples(index=False):
+                print(f"  {row.session_id}#{row.msg_index}: einzeln={row.per_message!r} "
+                      f"vektorisiert={row.vectorized!r} | {row.text[:100]!r}")
+        if args.disagreements:
+            diffs.to_csv(args.disagreements, index=False)
+    return 1 if len(diffs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# ============================================
+# bench_cold_start.py – erste Seite + erster Turn: kalter vs. warmer Prozess
+# ============================================
+#
+# Jede Wiederholung startet einen frischen Interpreter (= frisch geweckte App)
+# und misst dort über Streamlit AppTest:
+#   kalt: erste Session im Prozess (Imports, Pool, Warmup laufen mit)
+#   warm: zweite Session im selben Prozess (Module, Pool, Caches schon da)
+# jeweils "erste Seite" (erster Script-Run bis zur Begrüßung) und "erster
+# Turn" (erste Nachricht bis zur Bot-Antwort). --no-prewarm setzt PREWARM=false
+# für den Vergleich ohne Warmup.
+#
+# Beispiel:
+#   python benchmarks/bench_cold_start.py --db postgresql://localhost/bench --runs 5
+#   python benchmarks/bench_cold_start.py --db ... --secret LLM_PROVIDER=openai_compatible \
+#       --secret LLM_BASE_URL=http://localhost:8080/v1
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_MESSAGE = "Ich biete 750 €"
+
+
+def measure_session(secrets: dict, pid: str) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "chat.py"), default_timeout=120)
+    for k, v in secrets.items():
+        at.secrets[k] = v
+    at.query_params["pid"] = pid
+
+    t0 = time.perf_counter()
+    at.run()
+    paint_ms = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    t0 = time.perf_counter()
+    at.chat_input[0].set_value(FIRST_MESSAGE).run()
+    turn_ms = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return {"paint_ms": paint_ms, "turn_ms": turn_ms}
+
+
+def child(secrets: dict):
+    # läuft im frischen Interpreter; Ergebnis als JSON auf stdout
+    cold = measure_session(secrets, "p-bench-cold")
+    warm = measure_session(secrets, "p-bench-warm")
+    print(json.dumps({"cold": cold, "warm": warm}))
+
+
+def summarize(label: str, values: list[float]):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    print(f"{label}: median {statistics.median(values):.1f} ms, p95 {p95:.1f} ms, n={len(values)}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Cold-Start-Benchmark: erste Seite und erster Turn, kalt vs. warm.")
+    ap.add_argument("--db", default=os.environ.get("DATABASE_URL"), help="Wegwerf-DB für AppTest-Runs")
+    ap.add_argument("--runs", type=int, default=5, help="Anzahl frischer Interpreter")
+    ap.add_argument("--no-prewarm", action="store_true", help="PREWARM=false setzen")
+    ap.add_argument("--secret", action="append", default=[], metavar="KEY=VALUE",
+                    help="zusätzliche Secrets, z. B. LLM_PROVIDER=openai_compatible")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if not args.db:
+        print("Kein --db / DATABASE_URL gesetzt.", file=sys.stderr)
+        return 2
+
+    secrets = {"DATABASE_URL": args.db, "LLM_PROVIDER": "template"}
+    secrets.update(dict(s.split("=", 1) for s in args.secret))
+    if args.no_prewarm:
+        secrets["PREWARM"] = "false"
+
+    if args.child:
+        child(secrets)
+        return 0
+
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--db", args.db]
+    cmd += [f"--secret={k}={v}" for k, v in secrets.items() if k != "DATABASE_URL"]
+
+    results = {"cold": {"paint_ms": [], "turn_ms": []}, "warm": {"paint_ms": [], "turn_ms": []}}
+    for _ in range(args.runs):
+        out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        data = json.loads(out.strip().splitlines()[-1])
+        for phase in results:
+            for key in results[phase]:
+                results[phase][key].append(data[phase][key])
+
+    print(f"Warmup: {'aus' if args.no_prewarm else 'an'}, Backend: {secrets['LLM_PROVIDER']}")
+    summarize("Erste Seite kalt ", results["cold"]["paint_ms"])
+    summarize("Erste Seite warm ", results["warm"]["paint_ms"])
+    summarize("Erster Turn kalt ", results["cold"]["turn_ms"])
+    summarize("Erster Turn warm ", results["warm"]["turn_ms"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+# ============================================
+# bench_hot_paths.py – Micro-Benchmarks der Funktionen pro Nachricht/LLM-Kandidat
+# ============================================
+#
+# Misst den Durchsatz (Aufrufe/s) der Funktionen, die bei jeder Nachricht bzw.
+# jedem LLM-Kandidaten laufen, auf einem festen, repräsentativen Korpus:
+#   extract_user_offer, user_accepts_price, check_abort_conditions,
+#   euro_numbers_in_text, enforce_allowed_prices, contains_power_primes,
+#   generate_reply (Preislogik + Guard, LLM = Vorlage mit eingestreuten
+#   Regelverstößen) und das Rendern eines Verlaufs als Chat-Bubbles.
+#
+# chat.py ist ein Streamlit-Script; die Funktionen daraus werden per ast
+# herausgelöst und mit einem Session-Dict statt st.session_state ausgeführt.
+#
+# Gegen benchmarks/baselines/hot_paths.json wird verglichen: fällt der
+# Durchsatz einer Funktion um mehr als --threshold unter die Baseline, endet
+# das Script mit Exit-Code 1. Verglichen wird relativ zu einer festen
+# Kalibrier-Schleife, damit die Baseline auch auf anderen Rechnern taugt:
+# Kalibrierung und Benchmark laufen abwechselnd, jede Runde liefert ein
+# Verhältnis, gewertet wird der Median über --rounds Runden. So treffen
+# Frequenz-/Turbo-Schwankungen beide Messungen gleich, Ausreißer-Runden
+# zählen nicht. Auf einer geteilten 1-Kern-VM schwankte der Median zwischen
+# identischen Läufen trotzdem um bis zu ~30 % (Spalte "Streuung": Spannweite
+# innerhalb eines Laufs); daher --threshold 0.35. Echte Regressionen im Hot
+# Path (Regex-Backtracking, O(n²) im Verlauf) liegen deutlich darüber.
+#
+# Beispiel:
+#   python benchmarks/bench_hot_paths.py                    # Vergleich mit Baseline
+#   python benchmarks/bench_hot_paths.py --update-baseline  # nach gewollter Änderung
+#   python benchmarks/bench_hot_paths.py --only generate_reply --rounds 15
+
+import argparse
+import ast
+import json
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from conversation import Conversation  # noqa: E402
+from llm_providers import TemplateProvider, empty_result  # noqa: E402
+from llm_scheduler import PRIORITY_NORMAL, PRIORITY_TERMINAL  # noqa: E402
+from offer_parsing import contains_insult, extract_user_offer, user_accepts_price  # noqa: E402
+from variants import VARIANTS, contains_bad_pattern, system_prompt  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "hot_paths.json")
+
+# Funktionen + Konstanten aus chat.py, die die Benchmarks brauchen
+CHAT_NAMES = [
+    "check_abort_conditions", "contains_power_primes",
+    "EURO_NUM_RE", "euro_numbers_in_text", "enforce_allowed_prices",
+    "REPLY_INTENTS", "STRUCTURED_RESPONSE_FORMAT", "STRUCTURED_INSTRUCTION", "parse_structured_reply",
+    "REPLY_FIELD_RE", "recover_reply_text", "SENTENCE_SPLIT_RE", "repair_reply", "fallback_reply",
+    "PRICE_CORRECTION", "FORMAT_CORRECTION",
+    "llm_with_price_guard", "llm_no_price_reply", "note_turn", "generate_reply",
+]
+
+USER_PHRASES = [
+    "{p}", "{p} €", "Ich biete {p} Euro.", "Mein Angebot: {p}€", "Wie wäre es mit {p}?",
+    "{p} ist mir zu teuer", "Zu teuer, {p} wäre ok", "Deal", "ok, {p} passt", "Einverstanden!",
+    "Hat das iPad 256 GB?", "Ist der Pencil 2. Gen dabei? {p}", "Ich zahle {p} für das 13 Zoll Modell",
+    "Hallo, was ist der Zustand?", "Du Arschloch", "Verstanden, dann {p} und nicht mehr",
+    "Würde {p} oder {q} geben", "Für {p} nehme ich es sofort", "M5 chip für {p}?", "okay",
+]
+
+# Zusätze, die echte LLM-Kandidaten gelegentlich enthalten (Streu-Zahl, Machtprime)
+STRAY_SENTENCES = [
+    " Viele zahlen sonst 1100 € dafür.",
+    " Es gibt weitere Interessenten.",
+    " Der Marktpreis liegt deutlich höher.",
+]
+
+
+class SessionDict(dict):
+    """Ersatz für st.session_state: dict mit Attributzugriff."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+def load_chat_functions(names: list[str], env: dict) -> dict:
+    """Top-Level-Definitionen aus chat.py per Name in env ausführen (ohne das Script zu starten)."""
+    path = os.path.join(ROOT, "chat.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    wanted = set(names)
+    body = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in wanted:
+            body.append(node)
+            wanted.discard(node.name)
+        elif isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id in wanted for t in node.targets):
+            body.append(node)
+            wanted.difference_update(t.id for t in node.targets if isinstance(t, ast.Name))
+    if wanted:
+        raise RuntimeError(f"In chat.py nicht gefunden: {', '.join(sorted(wanted))}")
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), env)
+    return env
+
+
+class MockLLM:
+    """Vorlagen-Antwort wie TemplateProvider; jede n-te Antwort mit Regelverstoß (Repair-/Retry-Pfad)."""
+
+    def __init__(self, phrases: dict, every: int = 4):
+        self.provider = TemplateProvider(phrases=phrases)
+        self.every = every
+        self.calls = 0
+
+    def __call__(self, messages, **kwargs) -> dict:
+        self.calls += 1
+        result = self.provider.complete(messages)
+        result["status"] = "ok"
+        if self.calls % self.every == 0:
+            result["content"] += STRAY_SENTENCES[(self.calls // self.every) % len(STRAY_SENTENCES)]
+        return result
+
+
+def build_env(variant: str, seed: int = 0) -> dict:
+    variant_cfg = VARIANTS[variant]
+    session = SessionDict()
+    rnd = random.Random(seed)
+    env = {
+        "__name__": "chat_bench",
+        "re": re, "json": json, "time": time,
+        "st": types.SimpleNamespace(session_state=session),
+        "VARIANT": variant_cfg, "BOT_VARIANT": variant, "SID": "bench",
+        "LLM_STRUCTURED_OUTPUT": False, "LLM_TURN_BUDGET_S": 20.0,
+        "PRIORITY_NORMAL": PRIORITY_NORMAL, "PRIORITY_TERMINAL": PRIORITY_TERMINAL,
+        "system_prompt": system_prompt, "contains_bad_pattern": contains_bad_pattern,
+        "contains_insult": contains_insult, "extract_user_offer": extract_user_offer,
+        "TemplateProvider": TemplateProvider, "empty_result": empty_result,
+        "call_llm": MockLLM(variant_cfg["template_phrases"]),
+        "run_async": lambda fn, *args, **kwargs: None,
+        "log_llm_call": lambda *args, **kwargs: None,
+        "rng": lambda: rnd,
+    }
+    return load_chat_functions(CHAT_NAMES, env)
+
+
+# -----------------------------
+# Korpus
+# -----------------------------
+def user_corpus(n: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(USER_PHRASES).format(p=rnd.choice([rnd.randint(500, 1000), 256, 13, 64]), q=rnd.randint(500, 1000))
+        for _ in range(n)
+    ]
+
+
+def bot_corpus(n: int, seed: int = 2) -> list[str]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        phrases = VARIANTS[rnd.choice(list(VARIANTS))]["template_phrases"]
+        text = phrases[rnd.choice(list(phrases))].format(price=rnd.randint(800, 990))
+        if rnd.random() < 0.3:
+            text += rnd.choice(STRAY_SENTENCES)
+        out.append(text)
+    return out
+
+
+# Verhandlungsverläufe für generate_reply / check_abort_conditions
+SESSION_SCRIPTS = [
+    ["Hallo, ist das iPad neu?", "650", "Ich biete 720 €", "780", "Mein Angebot: 830€", "860", "880", "890"],
+    ["500", "Wie wäre es mit 700?", "750", "800 ist mein Maximum", "820", "850", "870", "900"],
+    ["900", "920", "ok, 940?", "950 €"],
+    ["800", "800", "810", "811", "812"],
+]
+
+
+def session_turns(n_sessions: int) -> list[list[str]]:
+    return [SESSION_SCRIPTS[i % len(SESSION_SCRIPTS)] for i in range(n_sessions)]
+
+
+def reset_negotiation(session: SessionDict, greeting: str):
+    session.clear()
+    conv = Conversation()
+    conv.append("assistant", greeting, None)
+    session.update({
+        "history": conv, "bot_offer": None, "last_bot_offer": None, "snap_to_user": False,
+        "last_user_price": None, "repeat_offer_count": 0, "warning_given": False, "small_step_count": 0,
+        "turn_event": {},
+    })
+
+
+# -----------------------------
+# Benchmarks: jede Funktion liefert (Anzahl Aufrufe, Callable für eine Runde)
+# -----------------------------
+def bench_extract_user_offer():
+    texts = user_corpus(4000)
+    return len(texts), lambda: [extract_user_offer(t) for t in texts]
+
+
+def bench_user_accepts_price():
+    texts = user_corpus(4000)
+    return len(texts), lambda: [user_accepts_price(t, 900) for t in texts]
+
+
+def bench_check_abort_conditions():
+    env = build_env("friendly")
+    check = env["check_abort_conditions"]
+    session = env["st"].session_state
+    sessions = [[(t, extract_user_offer(t)) for t in script] for script in session_turns(200)]
+    n = sum(len(s) for s in sessions)
+
+    def run():
+        for turns in sessions:
+            reset_negotiation(session, "")
+            session["last_bot_offer"] = 950
+            for text, price in turns:
+                check(text, price)
+    return n, run
+
+
+def bench_euro_numbers_in_text():
+    env = build_env("friendly")
+    fn = env["euro_numbers_in_text"]
+    replies = bot_corpus(4000)
+    return len(replies), lambda: [fn(r) for r in replies]
+
+
+def bench_enforce_allowed_prices():
+    env = build_env("friendly")
+    fn = env["enforce_allowed_prices"]
+    replies = bot_corpus(4000)
+    return len(replies), lambda: [fn(r, {850, 900}, False) for r in replies]
+
+
+def bench_contains_power_primes():
+    env = build_env("friendly")
+    fn = env["contains_power_primes"]
+    replies = bot_corpus(4000)
+    return len(replies), lambda: [fn(r) for r in replies]
+
+
+def bench_generate_reply():
+    env = build_env("friendly")
+    generate = env["generate_reply"]
+    session = env["st"].session_state
+    greeting = VARIANTS["friendly"]["greeting"].format(list_price=1000)
+    params = VARIANTS["friendly"]["params"]
+    sessions = session_turns(60)
+    n = sum(len(s) for s in sessions)
+
+    def run():
+        for turns in sessions:
+            reset_negotiation(session, greeting)
+            conv = session["history"]
+            for text in turns:
+                conv.append("user", text, None)
+                session["turn_event"] = {}
+                conv.append("assistant", generate(conv.llm_messages(), params), None)
+    return n, run
+
+
+def bench_render_transcript():
+    from datetime import datetime, timezone
+
+    from ui_common import chat_bubble_html
+
+    now = datetime.now(timezone.utc)
+    conv = Conversation()
+    for user_text, bot_text in zip(user_corpus(6), bot_corpus(6)):
+        conv.append("assistant", bot_text, now)
+        conv.append("user", user_text, now)
+    transcripts = [conv] * 20
+
+    def run():
+        # Ergebnis nicht sammeln: jede Bubble trägt den Avatar als Base64 (mehrere MB pro Verlauf)
+        for c in transcripts:
+            "".join(chat_bubble_html(m.role, m.text, m.ts) for m in c)
+    return len(transcripts), run
+
+
+BENCHMARKS = {
+    "extract_user_offer": bench_extract_user_offer,
+    "user_accepts_price": bench_user_accepts_price,
+    "check_abort_conditions": bench_check_abort_conditions,
+    "euro_numbers_in_text": bench_euro_numbers_in_text,
+    "enforce_allowed_prices": bench_enforce_allowed_prices,
+    "contains_power_primes": bench_contains_power_primes,
+    "generate_reply": bench_generate_reply,
+    "render_transcript": bench_render_transcript,
+}
+
+
+def calibration():
+    # feste reine Python-Arbeit (Regex + Strings + Dicts) als Rechner-Maßstab
+    pattern = re.compile(r"(\d{2,5})\s*(€|euro)?")
+    texts = [f"Angebot {i} für {i * 7 % 1000} euro" for i in range(20000)]
+
+    def run():
+        counts = {}
+        for t in texts:
+            m = pattern.search(t.lower())
+            counts[m.group(1) if m else ""] = counts.get(m.group(1) if m else "", 0) + 1
+        return counts
+    return len(texts), run
+
+
+# kürzere Runden werden wiederholt: Scheduler-Hänger von wenigen ms fallen sonst voll ins Gewicht
+MIN_ROUND_S = 0.1
+
+
+def _timed(run, reps: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        run()
+    return time.perf_counter() - t0
+
+
+def _reps(run) -> int:
+    return max(1, math.ceil(MIN_ROUND_S / _timed(run)))  # zugleich Aufwärmrunde
+
+
+def measure(setup, rounds: int) -> tuple[float, float, float]:
+    """Median über rounds Runden nach einer Aufwärmrunde, je Runde Kalibrierung direkt vor
+    dem Benchmark: (Aufrufe/s, relativ zur Kalibrierung, Spannweite der Verhältnisse / Median)."""
+    n, run = setup()
+    n_calib, run_calib = calibration()
+    reps, reps_calib = _reps(run), _reps(run_calib)
+    ops, ratios = [], []
+    for _ in range(rounds):
+        calib = n_calib * reps_calib / _timed(run_calib, reps_calib)
+        ops.append(n * reps / _timed(run, reps))
+        ratios.append(ops[-1] / calib)
+    rel = statistics.median(ratios)
+    return statistics.median(ops), rel, (max(ratios) - min(ratios)) / rel
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Micro-Benchmarks der Hot-Path-Funktionen mit Baseline-Vergleich.")
+    ap.add_argument("--rounds", type=int, default=21, help="Messrunden pro Benchmark (Median zählt)")
+    ap.add_argument("--threshold", type=float, default=0.35,
+                    help="erlaubter Durchsatz-Verlust ggü. Baseline (0.35 = 35 %%, über dem Messrauschen)")
+    ap.add_argument("--only", action="append", choices=list(BENCHMARKS), help="nur diese Benchmarks")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true", help="Ergebnisse als neue Baseline speichern")
+    args = ap.parse_args()
+
+    os.chdir(ROOT)  # Bilder für render_transcript
+    names = args.only or list(BENCHMARKS)
+
+    results = {name: measure(BENCHMARKS[name], args.rounds) for name in names}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'Benchmark':<24}{'Aufrufe/s':>14}{'relativ':>10}{'Streuung':>10}{'Baseline':>10}{'Änderung':>10}")
+    for name, (ops, rel, spread) in results.items():
+        base = baseline.get("benchmarks", {}).get(name, {}).get("relative")
+        change = f"{(rel / base - 1) * 100:+.0f} %" if base else "–"
+        flag = ""
+        if base and rel < base * (1 - args.threshold):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24}{ops:>14,.0f}{rel:>10.4g}{spread:>10.0%}{base or 0:>10.4g}{change:>10}{flag}")
+
+    if args.update_baseline:
+        merged = baseline.get("benchmarks", {})
+        merged.update({name: {"ops_per_s": round(ops), "relative": float(f"{rel:.4g}")}
+                       for name, (ops, rel, _) in results.items()})
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "rounds": args.rounds,
+                "benchmarks": dict(sorted(merged.items())),
+            }, f, indent=2)
+            f.write("\n")
+        print(f"Baseline gespeichert: {os.path.relpath(args.baseline, ROOT)}")
+        return 0
+
+    if regressions:
+        print(f"\nDurchsatz mehr als {args.threshold:.0%} unter Baseline: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# ============================================
+# bench_participant_path.py – Import- und Rerun-Zeit des Participant-Pfads
+# ============================================
+#
+# Misst (1) die Importzeit der Module, die chat.py lädt, in einem frischen
+# Interpreter, und (2) die Dauer eines Script-Reruns von chat.py über
+# Streamlit AppTest (Template-Backend, kein LLM-Netzwerk). Prüft außerdem,
+# dass pandas/openpyxl im Participant-Pfad nicht geladen werden.
+#
+# Beispiel:
+#   python benchmarks/bench_participant_path.py --db postgresql://localhost/bench --reruns 30
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARTICIPANT_MODULES = [
+    "streamlit", "pytz", "requests", "psycopg2",
+    "db_common", "llm_cassette", "llm_providers", "llm_scheduler", "survey", "ui_common", "variants",
+    "conversation", "warmup",
+]
+HEAVY_MODULES = ["pandas", "openpyxl"]
+
+
+def bench_imports(repeats: int) -> list[float]:
+    code = (
+        "import sys, time\n"
+        "t0 = time.perf_counter()\n"
+        + "".join(f"import {m}\n" for m in PARTICIPANT_MODULES)
+        + "print(time.perf_counter() - t0)\n"
+        + f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(','.join(heavy))\n"
+    )
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        times.append(float(out[0]) * 1000)
+        if len(out) > 1 and out[1]:
+            print(f"WARNUNG: schwere Module im Participant-Import geladen: {out[1]}")
+    return times
+
+
+def bench_reruns(db: str, reruns: int) -> tuple[float, list[float]]:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "chat.py"), default_timeout=60)
+    at.secrets["DATABASE_URL"] = db
+    at.secrets["LLM_PROVIDER"] = "template"
+    at.query_params["pid"] = "p-bench"
+
+    t0 = time.perf_counter()
+    at.run()
+    first_ms = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    times = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        times.append((time.perf_counter() - t0) * 1000)
+
+    heavy = [m for m in HEAVY_MODULES if m in sys.modules]
+    if heavy:
+        print(f"WARNUNG: schwere Module während der Reruns geladen: {', '.join(heavy)}")
+    return first_ms, times
+
+
+def summarize(label: str, values: list[float]):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    print(f"{label}: median {statistics.median(values):.1f} ms, p95 {p95:.1f} ms, n={len(values)}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Import-/Rerun-Benchmark für den Participant-Pfad.")
+    ap.add_argument("--db", default=os.environ.get("DATABASE_URL"), help="Wegwerf-DB für AppTest-Runs")
+    ap.add_argument("--imports", type=int, default=5, help="Anzahl frischer Interpreter")
+    ap.add_argument("--reruns", type=int, default=20)
+    args = ap.parse_args()
+
+    summarize("Import Participant-Module", bench_imports(args.imports))
+
+    if not args.db:
+        print("Kein --db / DATABASE_URL gesetzt: Rerun-Messung übersprungen.")
+        return 0
+
+    first_ms, times = bench_reruns(args.db, args.reruns)
+    print(f"Erster Run (inkl. init_db + Begrüßung): {first_ms:.1f} ms")
+    summarize("Rerun chat.py", times)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,32 @@
 # ============================================
-# iPad-Verhandlung – Kontrollbedingung (ohne Machtprimes)
+# iPad-Verhandlung – beide Bot-Varianten in einer Instanz
+# (Variante pro Participant aus order/step, siehe variants.py)
 # KI-Antworten nach Parametern, Deal/Abbruch, private Ergebnisse
 # ============================================
 
-import os, re, uuid, random, requests
+import re, json, time, uuid, random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import streamlit as st
-import pandas as pd
-import base64
-import pytz
-from db_common import get_conn, init_db
+from db_common import current_study, get_conn, init_db, run_async, utc_now
+from llm_cassette import Cassette
+from llm_providers import LLMProvider, TemplateProvider, build_provider, complete_hedged, empty_result
+from llm_scheduler import PRIORITY_NORMAL, PRIORITY_TERMINAL, LLMScheduler, get_scheduler
 
 from survey import show_survey
+from ui_common import CHAT_CSS, chat_bubble_html, img_to_base64
+from conversation import Conversation, restore_state, snapshot_state
+from offer_parsing import contains_insult, extract_user_offer, user_accepts_price
+from scoreboard import render_scoreboard
+from session_reaper import HEARTBEAT_S, TIMEOUT_NOTE, get_live_sessions
+from state_store import get_state_store
+from warmup import start_warmup
+from variants import (
+    DEFAULT_VARIANT, ORDER_SEQUENCE,
+    contains_bad_pattern, get_variant, is_served, resolve_variant, system_prompt,
+)
 
-# -----------------------------
-# Helpers
-# -----------------------------
-def img_to_base64(path: str) -> str:
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
-
-st.set_page_config(page_title="iPad-Verhandlung – Kontrollbedingung", page_icon="💬")
+st.set_page_config(page_title="iPad-Verhandlung", page_icon="💬")
 
 # -----------------------------
 # Session State initialisieren
@@ -29,7 +35,7 @@ if "session_id" not in st.session_state:
     st.session_state["session_id"] = str(uuid.uuid4())
 
 if "history" not in st.session_state:
-    st.session_state["history"] = []  # Chat-Verlauf als Liste von Dicts
+    st.session_state["history"] = Conversation()  # Chat-Verlauf (Slots, Zähler, LLM-Sicht)
 
 if "agreed_price" not in st.session_state:
     st.session_state["agreed_price"] = None
@@ -100,6 +106,44 @@ PID = st.session_state["participant_id"]
 
 ORDER = str(st.query_params.get("order", "")).strip()
 STEP  = str(st.query_params.get("step", "")).strip()
+STUDY_ID = current_study()
+STATE_STORE = get_state_store()  # STATE_BACKEND: local | postgres | redis
+
+# vom Reaper als inaktiv verdrängt: eigenen State leeren, der neue Run setzt per ?sid fort
+if get_live_sessions(STUDY_ID, STATE_STORE).take_evicted(st.session_state["session_id"]):
+    st.session_state.clear()
+    st.rerun()
+
+# -----------------------------
+# Reconnect: Verhandlung fortsetzen (?sid=... bzw. letzte Session dieses Schritts)
+# -----------------------------
+def resume_session(session_id: str, pid: str) -> bool:
+    state = STATE_STORE.load(STUDY_ID, session_id, pid)
+    if state is None:
+        return False
+    if "messages" not in state:
+        # lokaler Snapshot ohne Verlauf: Verlauf aus chat_messages
+        init_db()
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT role, text, ts FROM chat_messages
+            WHERE session_id = %s
+            ORDER BY msg_index ASC
+        """, (session_id,))
+        st.session_state["history"] = Conversation.from_rows(cur.fetchall())
+        conn.close()
+
+    st.session_state["session_id"] = session_id
+    restore_state(st.session_state, state)
+    return True
+
+if "resume_checked" not in st.session_state:
+    st.session_state["resume_checked"] = True
+    url_sid = st.query_params.get("sid") or STATE_STORE.latest_session(STUDY_ID, PID, STEP)
+    if url_sid and url_sid != st.session_state["session_id"]:
+        resume_session(str(url_sid), PID)
+    st.query_params["sid"] = st.session_state["session_id"]
 
 if STEP == "2":
     init_db()
@@ -107,9 +151,9 @@ if STEP == "2":
     cur = conn.cursor()
     cur.execute("""
         SELECT 1 FROM survey
-        WHERE participant_id = %s AND step = '1'
+        WHERE participant_id = %s AND step = '1' AND study_id = %s
         LIMIT 1
-    """, (PID,))
+    """, (PID, STUDY_ID))
     ok = cur.fetchone() is not None
     conn.close()
 
@@ -117,32 +161,103 @@ if STEP == "2":
         st.error("Bitte schließen Sie zuerst Verhandlung 1 inklusive Fragebogen ab.")
         st.stop()
 
-BOT_VARIANT = "friendly"
+# ?variant=... nur mit Secret ALLOW_VARIANT_OVERRIDE (Tests, replay_session.py) – sonst
+# könnten Participants ihre Bedingung selbst wählen
+ALLOW_VARIANT_OVERRIDE = str(st.secrets.get("ALLOW_VARIANT_OVERRIDE", "false")).lower() in ("1", "true", "yes")
+_drafts = st.secrets.get("SERVE_DRAFT_VARIANTS", "")
+DRAFT_VARIANTS = {str(v).strip() for v in (_drafts if isinstance(_drafts, (list, tuple)) else str(_drafts).split(","))}
+
+# Varianten, die (noch) auf einer eigenen Deployment-Instanz laufen
+EXTERNAL_URLS = {
+    "power": st.secrets.get("BOT_A_URL", "https://verhandlung123.streamlit.app"),
+}
+
+# Variante einmal pro Session festlegen (order/step)
+if "bot_variant" not in st.session_state:
+    st.session_state["bot_variant"] = resolve_variant(
+        ORDER, STEP,
+        override=st.query_params.get("variant") if ALLOW_VARIANT_OVERRIDE else None,
+        default=st.secrets.get("DEFAULT_BOT_VARIANT", DEFAULT_VARIANT),
+    )
+
+BOT_VARIANT = st.session_state["bot_variant"]
+
+# nicht freigegebene Variante: zur bestehenden Instanz weiterleiten, sonst nichts ausliefern
+if not is_served(BOT_VARIANT, DRAFT_VARIANTS):
+    external = EXTERNAL_URLS.get(BOT_VARIANT)
+    if external:
+        st.link_button("➡️ Zur Verhandlung", f"{external}?pid={PID}&order={ORDER}&step={STEP}",
+                       use_container_width=True)
+        st.caption("Bitte klicken Sie auf den Button, um zur Verhandlung zu gelangen.")
+    else:
+        st.error("Diese Verhandlung ist derzeit nicht verfügbar.")
+    st.stop()
+
+VARIANT = get_variant(BOT_VARIANT)
 
 PID = st.session_state["participant_id"]
 SID = st.session_state["session_id"]
 
-BOT_A_URL = "https://verhandlung123.streamlit.app"
-BOT_B_URL = "https://verhandlung.streamlit.app"
-SCOREBOARD_URL = "https://botscoreboard.streamlit.app"
+# Heartbeat: jeder Run + alle HEARTBEAT_S s, solange der Tab offen ist (Idle-Timeout, siehe session_reaper.py)
+def heartbeat():
+    live = get_live_sessions(STUDY_ID, STATE_STORE)
+    if live.is_evicted(SID):
+        st.rerun(scope="app")  # Tab wieder aktiv: ganzer Run räumt oben auf
+    live.heartbeat(SID, PID, STEP)
 
-def get_scoreboard_url(pid: str, order: str) -> str:
-    return f"{SCOREBOARD_URL}?pid={pid}&order={order}"
+st.fragment(heartbeat, run_every=HEARTBEAT_S)()
 
+# Schritt 2 in dieser App (APP_URL, step=2), außer die Variante läuft noch extern (EXTERNAL_URLS)
+APP_URL = st.secrets.get("APP_URL", "")
 def get_next_url(pid: str, order: str, bot_variant: str) -> str:
-    # bot_variant: "power" = Bot A, "friendly" = Bot B
-    if bot_variant == "power":
-        return f"{BOT_B_URL}?pid={pid}&order={order}&step=2"
-    else:
-        return f"{BOT_A_URL}?pid={pid}&order={order}&step=2"
+    # bot_variant: "power" = Bot A, "friendly" = Bot B; ohne gültige order folgt die jeweils andere Variante
+    if order not in ORDER_SEQUENCE:
+        order = "AB" if bot_variant == "power" else "BA"
+    next_variant = ORDER_SEQUENCE[order][1]
+    base = APP_URL if is_served(next_variant, DRAFT_VARIANTS) else EXTERNAL_URLS.get(next_variant, APP_URL)
+    return f"{base}?pid={pid}&order={order}&step=2"
 
 # ----------------------------
-# Secrets & Model
+# Secrets & LLM-Backend
 # ----------------------------
-API_KEY = st.secrets["OPENAI_API_KEY"]
-MODEL  = st.secrets.get("OPENAI_MODEL", "gpt-4o-mini")
 ADMIN_PASSWORD = st.secrets.get("ADMIN_PASSWORD")
 
+# LLM-Backend pro Deployment: LLM_PROVIDER = openai | openai_compatible | template
+@st.cache_resource
+def get_provider() -> LLMProvider:
+    return build_provider(st.secrets)
+
+# Cold Start: DB-Pool, LLM-Verbindung, Bilder im Hintergrund vorwärmen (einmal pro Prozess)
+start_warmup(get_provider())
+
+# Latenz-Budget pro Turn: nach LLM_HEDGE_AFTER_S geht eine zweite Anfrage raus,
+# nach LLM_TURN_BUDGET_S antwortet die lokale Vorlage (gleiche Preisregeln).
+LLM_TURN_BUDGET_S = float(st.secrets.get("LLM_TURN_BUDGET_S", 20))
+LLM_HEDGE_AFTER_S = float(st.secrets.get("LLM_HEDGE_AFTER_S", 6))
+
+@st.cache_resource
+def get_llm_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=int(st.secrets.get("LLM_POOL_SIZE", 16)), thread_name_prefix="llm")
+
+@st.cache_resource
+def get_cassette() -> Cassette:
+    return Cassette(
+        st.secrets.get("LLM_CASSETTE_PATH", "llm_cassette.jsonl"),
+        st.secrets.get("LLM_CASSETTE_MODE", "off"),
+    )
+
+# Preis-Zufall pro Session reproduzierbar: gleicher Seed + gleiche Session-ID => gleiche Gegenangebote
+if "rng" not in st.session_state:
+    st.session_state["rng"] = random.Random(f"{st.secrets.get('PRICING_SEED', '')}:{SID}")
+
+def rng() -> random.Random:
+    return st.session_state["rng"]
+
+def persist_state():
+    # Snapshot im Script-Thread; local schreibt im Hintergrund, postgres/redis sofort
+    # (inkl. Verlauf), damit eine andere Replica den Turn beim nächsten Request sieht
+    STATE_STORE.save(STUDY_ID, SID, PID, STEP, snapshot_state(st.session_state, with_messages=STATE_STORE.shared))
+
 # ----------------------------
 # Survey (nur nach Abschluss)
 # ----------------------------
@@ -172,6 +287,10 @@ def run_survey_and_stop():
 
     st.markdown("---")
 
+    # Fragebogen schon abgeschickt (z. B. Reconnect auf anderer Replica): direkt weiter
+    if st.session_state.get("survey_done"):
+        show_next_step()
+
     survey_data = show_survey()
 
     if isinstance(survey_data, dict):
@@ -180,7 +299,7 @@ def run_survey_and_stop():
         survey_data["bot_variant"] = BOT_VARIANT
         survey_data["order"] = ORDER
         survey_data["step"] = STEP
-        survey_data["survey_ts_utc"] = datetime.utcnow().isoformat()
+        survey_data["survey_ts_utc"] = utc_now()
 
         init_db()
         conn = get_conn()
@@ -188,18 +307,18 @@ def run_survey_and_stop():
 
         cur.execute("""
             INSERT INTO survey (
-                survey_ts_utc, participant_id, session_id, bot_variant, order_id, step,
+                study_id, survey_ts_utc, participant_id, session_id, bot_variant, order_id, step,
                 age, gender, education, field, field_other,
                 satisfaction_outcome, satisfaction_process, fairness, better_result,
                 deviation, willingness, again
             ) VALUES (
-                %s,%s,%s,%s,%s,%s,
+                %s,%s,%s,%s,%s,%s,%s,
                 %s,%s,%s,%s,%s,
                 %s,%s,%s,%s,
                 %s,%s,%s
             )
         """, (
-            survey_data["survey_ts_utc"], PID, SID, BOT_VARIANT, ORDER, STEP,
+            STUDY_ID, survey_data["survey_ts_utc"], PID, SID, BOT_VARIANT, ORDER, STEP,
             survey_data.get("age"), survey_data.get("gender"), survey_data.get("education"),
             survey_data.get("field"), survey_data.get("field_other"),
             survey_data.get("satisfaction_outcome"), survey_data.get("satisfaction_process"),
@@ -211,29 +330,30 @@ def run_survey_and_stop():
         conn.commit()
         conn.close()
 
+        st.session_state["survey_done"] = True
+        persist_state()
+
         st.success("Vielen Dank! Ihre Antworten wurden gespeichert.")
+        show_next_step()
 
-        if STEP == "1":
-            st.link_button(
-                "➡️ Weiter zu Verhandlung 2",
-                get_next_url(PID, ORDER, BOT_VARIANT),
-                use_container_width=True
-            )
-            st.caption("Bitte klicken Sie auf den Button, um zur zweiten Verhandlung zu gelangen.")
-            st.stop()
-
-        elif STEP == "2":
-            st.link_button(
-                "🏆 Zum Scoreboard",
-                get_scoreboard_url(PID, ORDER),
-                use_container_width=True
-            )
-            st.caption("Danke! Sie können jetzt das Scoreboard ansehen.")
-            st.stop()
+def show_next_step():
+    if STEP == "1":
+        st.link_button(
+            "➡️ Weiter zu Verhandlung 2",
+            get_next_url(PID, ORDER, BOT_VARIANT),
+            use_container_width=True
+        )
+        st.caption("Bitte klicken Sie auf den Button, um zur zweiten Verhandlung zu gelangen.")
+        st.stop()
 
-        else:
-            st.error("Ungültiger Step in der URL.")
-            st.stop()
+    elif STEP == "2":
+        st.markdown("---")
+        render_scoreboard(STUDY_ID, PID)
+        st.stop()
+
+    else:
+        st.error("Ungültiger Step in der URL.")
+        st.stop()
 
                 
 # Wenn bereits geschlossen: sofort Survey und sonst nichts mehr rendern
@@ -277,138 +397,30 @@ st.markdown(f"""
 
 st.caption("Deine Rolle: Käufer")
 
-CHAT_CSS = """
-<style>
-.row { display:flex; align-items:flex-start; margin:8px 0; }
-.row.left { justify-content:flex-start; }
-.row.right { justify-content:flex-end; }
-.chat-bubble { padding:10px 14px; border-radius:16px; line-height:1.45; max-width:75%;
-              box-shadow:0 1px 2px rgba(0,0,0,.08); font-size:15px; }
-.msg-user { background:#23A455; color:white; border-top-right-radius:4px; }
-.msg-bot { background:#F1F1F1; color:#222; border-top-left-radius:4px; }
-.avatar { width:34px; height:34px; border-radius:50%; object-fit:cover; margin:0 8px;
-          box-shadow:0 1px 2px rgba(0,0,0,.15); }
-.meta { font-size:.75rem; color:#7A7A7A; margin-top:2px; }
-</style>
-"""
 st.markdown(CHAT_CSS, unsafe_allow_html=True)
 
 # -----------------------------
 # Experiment Parameter
 # -----------------------------
-DEFAULT_PARAMS = {
-    "scenario_text": "Sie verhandeln über ein iPad Pro (neu, 13 Zoll, M5 Chip, 256 GB, Space Grey) inklusive Apple Pencil (2. Gen).",
-    "list_price": 1000,
-    "min_price": 800,
-    "tone": "freundlich, respektvoll, auf Augenhöhe, sachlich",
-    "max_sentences": 4,
-}
+DEFAULT_PARAMS = VARIANT["params"]
 
 if "params" not in st.session_state:
     st.session_state.params = DEFAULT_PARAMS.copy()
 
-# -----------------------------
-# USER-OFFER EXTRAKTION (ANGLEICHUNG AN POWER-BOT)
-# -----------------------------
-PRICE_TOKEN_RE = re.compile(r"(?<!\d)(\d{2,5})(?!\d)")
-
-OFFER_KEYWORDS = [
-    "ich biete", "biete", "mein angebot", "angebot", "zahle", "ich zahle",
-    "würde geben", "ich würde geben", "kann geben", "gebe", "preis wäre", "mein preis",
-    "für", "bei", "mach"
-]
-
-UNIT_WORDS_AFTER_NUMBER = re.compile(
-    r"^\s*(gb|tb|zoll|inch|hz|gen|generation|chip|m\d+)\b|^\s*['\"]",
-    re.IGNORECASE
-)
-
-def extract_user_offer(text: str) -> int | None:
-    if not text:
-        return None
-
-    t = text.strip().lower()
-
-    # 1) reine Zahl => Angebot
-    m_plain = re.match(r"^\s*(\d{2,5})\s*(€|eur|euro)?\s*[!?.,]?\s*$", t)
-    if m_plain:
-        val = int(m_plain.group(1))
-        if 100 <= val <= 5000:
-            return val
-
-    # 2) "X ist mir zu teuer" => kein Angebot
-    too_much_patterns = [
-        r"\b(\d{2,5})\b.*\b(zu viel|zu teuer|zu hoch|ist mir zu viel|ist mir zu teuer)\b",
-        r"\b(zu viel|zu teuer|zu hoch|ist mir zu viel|ist mir zu teuer)\b.*\b(\d{2,5})\b",
-    ]
-    for pat in too_much_patterns:
-        if re.search(pat, t):
-            return None
-
-    has_euro_hint = ("€" in t) or (" eur" in t) or (" euro" in t)
-    has_offer_intent = any(k in t for k in OFFER_KEYWORDS)
-
-    # ✅ Power-Bot Fallback: wenn genau eine plausible Zahl im Text vorkommt, nimm sie trotzdem
-    if not (has_euro_hint or has_offer_intent):
-        nums = []
-        for m in PRICE_TOKEN_RE.finditer(text):
-            val = int(m.group(1))
-            if not (100 <= val <= 5000):
-                continue
-
-            after = text[m.end(): m.end() + 12]
-            if UNIT_WORDS_AFTER_NUMBER.search(after):
-                continue
-
-            if val in (13, 32, 64, 128, 256, 512, 1024, 2048):
-                continue
-
-            nums.append(val)
-
-        if len(nums) == 1:
-            return nums[0]
-
-        return None
-
-    candidates = []
-    for m in PRICE_TOKEN_RE.finditer(text):
-        val = int(m.group(1))
-        if not (100 <= val <= 5000):
-            continue
-
-        after = text[m.end(): m.end() + 12]
-        if UNIT_WORDS_AFTER_NUMBER.search(after):
-            continue
-
-        # typische Specs ausschließen
-        if val in (13, 32, 64, 128, 256, 512, 1024, 2048):
-            continue
-
-        candidates.append(val)
-
-    return candidates[-1] if candidates else None
-
 # -----------------------------
 # Abort Conditions
 # -----------------------------
-INSULT_PATTERNS = [
-    r"\b(fotze|hurensohn|wichser|arschloch|missgeburt)\b",
-    r"\b(verpiss dich|halt die fresse)\b",
-    r"\b(drecks(?:bot|kerl|typ))\b",
-]
-
 def is_close_enough_deal(user_price: int | None, bot_price: int | None, tol: int = 5) -> bool:
     if user_price is None or bot_price is None:
         return False
     return abs(user_price - bot_price) <= tol
 
 def check_abort_conditions(user_text: str, user_price: int | None):
-    for pat in INSULT_PATTERNS:
-        if re.search(pat, (user_text or "").lower()):
-            return "abort", (
-                "Ich beende die Verhandlung an dieser Stelle. "
-                "Ein respektvoller Umgang ist für mich Voraussetzung."
-            )
+    if contains_insult(user_text):
+        return "abort", (
+            "Ich beende die Verhandlung an dieser Stelle. "
+            "Ein respektvoller Umgang ist für mich Voraussetzung."
+        )
 
     if user_price is None:
         return "ok", None
@@ -476,102 +488,88 @@ def check_abort_conditions(user_text: str, user_price: int | None):
     return "ok", None
 
 # -----------------------------
-# Deal acceptance (message) – wie Power-Bot
-# -----------------------------
-def user_accepts_price(user_text: str, bot_price: int) -> bool:
-    if bot_price is None:
-        return False
-
-    text = (user_text or "").lower()
-
-    accept_words = [
-        "deal", "einverstanden", "passt", "ok", "okay",
-        "nehme ich", "akzeptiere", "verstanden"
-    ]
-
-    if not any(w in text for w in accept_words):
-        return False
-
-    nums = re.findall(r"\d{2,5}", text)
-    return (not nums) or (int(nums[0]) == bot_price)
-
+# Anti-Power-Primes (Pattern-Liste der Variante; "power" hat keine)
 # -----------------------------
-# Anti-Power-Primes (Friendly)
-# -----------------------------
-BAD_PATTERNS = [
-    r"\balternative(n)?\b", r"\bweitere(n)?\s+interessent(en|in)\b", r"\bknapp(e|heit)\b",
-    r"\bdeadline\b", r"\bletzte chance\b", r"\bbranchen(üblich|standard)\b",
-    r"\bmarktpreis\b", r"\bneupreis\b", r"\bschmerzgrenze\b", r"\bsonst geht es\b"
-]
 def contains_power_primes(text: str) -> bool:
-    t = (text or "").lower()
-    return any(re.search(p, t) for p in BAD_PATTERNS)
-
-# -----------------------------
-# System Prompt
-# -----------------------------
-def system_prompt(params: dict) -> str:
-    return f"""
-Du bist die Verkäuferperson eines neuen iPad (256 GB, Space Grey) inkl. Apple Pencil 2.
-Ausgangspreis: 1000 €
-Mindestpreis, unter dem du nicht verkaufen möchtest: 800 € (dieser Wert wird NIEMALS erwähnt).
-
-WICHTIGE REGELN FÜR DIE VERHANDLUNG:
-1. Du verwendest ausschließlich echte iPad-Daten (256 GB).
-2. Du erwähnst NIEMALS deine Untergrenze und sagst nie Sätze wie "800 € ist das Minimum".
-3. Du bleibst freundlich, sachlich und verhandelst realistisch.
-4. Keine Macht-, Druck- oder Knappheitsstrategien.
-5. Maximal {params['max_sentences']} Sätze.
-"""
+    return contains_bad_pattern(BOT_VARIANT, text)
 
 # -----------------------------
-# OpenAI Call (REST)
+# LLM Call (Provider + Cassette)
 # -----------------------------
-def call_openai(messages, temperature=0.3, max_tokens=240):
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
-
-    try:
-        r = requests.post(url, headers=headers, json=payload, timeout=60)
-    except requests.RequestException as e:
-        st.error(f"Netzwerkfehler zur OpenAI-API: {e}")
-        return None
-
-    try:
-        data = r.json()
-    except Exception:
-        data = None
-
-    if r.status_code != 200:
-        err_msg = None
-        err_type = None
-        if isinstance(data, dict):
-            err = data.get("error") or {}
-            err_msg = err.get("message")
-            err_type = err.get("type")
-        st.error(
-            f"OpenAI-API-Fehler {r.status_code}"
-            f"{' ('+err_type+')' if err_type else ''}"
-            f": {err_msg or (r.text[:500] if r.text else '')}"
-        )
-        st.caption("Tipp: Prüfe MODEL / API-Key / Quota / Nachrichtenformat.")
-        return None
-
-    try:
-        return data["choices"][0]["message"]["content"]
-    except Exception:
-        st.error("Antwortformat unerwartet. Rohdaten:")
-        st.code((r.text or "")[:1000])
-        return None
+def call_llm(messages, temperature=0.3, max_tokens=240, deadline: float | None = None, on_discard=None,
+             response_format: dict | None = None, priority: int = PRIORITY_NORMAL) -> dict:
+    """Ruft das konfigurierte LLM-Backend auf und liefert Antworttext + Usage/Latenz als Dict.
+
+    "content" ist None, wenn der Aufruf fehlgeschlagen ist; "status" sagt warum
+    ("timeout" = Latenz-Budget bis deadline aufgebraucht, wird nicht angezeigt).
+    Netzwerk-Backends laufen über den prozessweiten Scheduler (RPM/TPM-Limits).
+    """
+    provider = get_provider()
+
+    cassette = get_cassette()
+    if cassette.mode == "replay":
+        result = empty_result(provider.model)
+        recorded = cassette.lookup(messages)
+        if recorded is None:
+            result["status"] = "cassette_miss"
+            st.error("Replay-Modus: keine passende Aufnahme in der Cassette gefunden.")
+            return result
+        result.update(recorded)
+        result["status"] = "replay"
+        result["latency_ms"] = 0
+        return result
+
+    if isinstance(provider, TemplateProvider):
+        result = provider.complete(messages, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+    else:
+        scheduler = get_scheduler()
+        est_tokens = LLMScheduler.estimate_tokens(messages, max_tokens)
+        if not scheduler.acquire(SID, est_tokens, priority=priority, deadline=deadline):
+            result = empty_result(provider.model)
+            result["status"] = "timeout"
+            result["error"] = "Latenz-Budget in der LLM-Warteschlange aufgebraucht."
+            return result
+
+        def used_tokens(call: dict) -> int | None:
+            # abgelehnte/nicht angekommene Anfragen verbrauchen nichts; sonst None = Schätzung behalten
+            if call["status"] == "network_error" or call["status"].startswith("http_"):
+                return 0
+            return call.get("total_tokens")
+
+        def settle_discarded(call: dict):
+            # jede Anfrage (auch die Hedge-Anfrage) hat est_tokens reserviert und wird einzeln abgerechnet
+            scheduler.settle(est_tokens, used_tokens(call))
+            if on_discard is not None:
+                on_discard(call)
+
+        if deadline is None:
+            result = provider.complete(messages, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+        else:
+            result = complete_hedged(
+                provider, get_llm_pool(), messages, temperature, max_tokens,
+                deadline=deadline, hedge_after_s=LLM_HEDGE_AFTER_S, on_discard=settle_discarded,
+                response_format=response_format,
+                can_hedge=lambda: scheduler.try_acquire(SID, est_tokens),
+            )
+        scheduler.settle(est_tokens, used_tokens(result))
+
+        if result["status"] == "http_429":
+            # Rate-Limit: Warteschlange kurz anhalten; der Guard versucht es danach erneut
+            scheduler.penalize(float(st.secrets.get("LLM_429_PAUSE_S", 5)))
+            return result
+
+    if result["status"] == "timeout":
+        return result
+    if result["status"] != "ok":
+        st.error(result["error"])
+        st.caption("Tipp: Prüfe LLM_PROVIDER / Modell / API-Key / Quota / Nachrichtenformat.")
+        return result
+
+    if cassette.mode == "record":
+        cassette.record(messages, {
+            k: result[k] for k in ("content", "model", "prompt_tokens", "completion_tokens", "total_tokens")
+        })
+    return result
 
 # ============================================
 # PREISLOGIK – EINMALIG (keine Duplikate!)
@@ -588,7 +586,120 @@ def enforce_allowed_prices(reply: str, allowed_prices: set[int], allow_no_price:
         return allow_no_price
     return all(p in allowed_prices for p in prices)
 
-def llm_with_price_guard(history_msgs, params: dict, user_price: int | None, counter: int | None, allow_no_price: bool) -> str:
+# -----------------------------
+# Strukturierte Antworten (optional, LLM_STRUCTURED_OUTPUT = true)
+# -----------------------------
+# Das Modell liefert JSON mit Antworttext, den genannten Preisen und einer Absicht.
+# Die deklarierten Preise werden per Set-Vergleich geprüft (kein Text-Scan nötig)
+# und nur gegen euro_numbers_in_text gegengeprüft.
+LLM_STRUCTURED_OUTPUT = str(st.secrets.get("LLM_STRUCTURED_OUTPUT", "false")).lower() in ("1", "true", "yes")
+
+REPLY_INTENTS = ["counter", "accept", "reject", "ask", "other"]
+
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "negotiation_reply",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "reply": {"type": "string"},
+                "prices": {"type": "array", "items": {"type": "integer"}},
+                "intent": {"type": "string", "enum": REPLY_INTENTS},
+            },
+            "required": ["reply", "prices", "intent"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+STRUCTURED_INSTRUCTION = (
+    "AUSGABEFORMAT: Antworte ausschließlich als JSON-Objekt mit den Feldern "
+    '"reply" (deine Nachricht an den Käufer), '
+    '"prices" (Liste ALLER Euro-Beträge, die in reply vorkommen, als ganze Zahlen) und '
+    '"intent" (counter = Gegenangebot, accept = Annahme, reject = Ablehnung ohne Gegenangebot, '
+    "ask = Nachfrage nach einem Preis, other = sonstiges)."
+)
+
+def parse_structured_reply(content: str) -> dict | None:
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("reply"), str) or not data["reply"].strip():
+        return None
+    prices = data.get("prices")
+    if not isinstance(prices, list) or not all(isinstance(p, int) and not isinstance(p, bool) for p in prices):
+        return None
+    intent = data.get("intent") if data.get("intent") in REPLY_INTENTS else "other"
+    return {"reply": data["reply"], "prices": prices, "intent": intent}
+
+REPLY_FIELD_RE = re.compile(r'"reply"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def recover_reply_text(content: str) -> str | None:
+    """Antworttext aus ungültigem JSON retten (abgeschnitten, falsche Typen, Markdown-Zaun).
+
+    Reiner Text ohne JSON (Provider ignoriert response_format) zählt als Antwort;
+    sonst None – das rohe JSON wird nie angezeigt.
+    """
+    content = content or ""
+    m = REPLY_FIELD_RE.search(content)
+    if m:
+        try:
+            text = json.loads(f'"{m.group(1)}"')
+        except ValueError:
+            return None
+        return text.strip() or None
+    if "{" not in content and content.strip():
+        return content.strip()
+    return None
+
+# Satzgrenze nach Satzzeichen; nach einer Zahl nur, wenn ein Großbuchstabe folgt
+# ("950. Viele ..." wird getrennt, "2. Gen" und "3. oktober" bleiben zusammen)
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[^\d][.!?])\s+|(?<=\d[.!?])\s+(?!Gen)(?=[A-ZÄÖÜ])")
+
+def repair_reply(reply: str, allowed_prices: set[int], allow_no_price: bool) -> str | None:
+    """Entfernt nur die Sätze mit Machtprimes oder unerlaubten Euro-Zahlen.
+
+    Gibt None zurück, wenn die Reparatur die Antwort kaputt machen würde
+    (mehr als die Hälfte weg, nichts übrig oder der Pflicht-Preis fehlt danach) –
+    dann muss neu generiert werden.
+    """
+    sentences = [x for x in SENTENCE_SPLIT_RE.split(reply.strip()) if x.strip()]
+    kept = [
+        x for x in sentences
+        if not contains_power_primes(x) and all(p in allowed_prices for p in euro_numbers_in_text(x))
+    ]
+    if not kept or len(kept) * 2 < len(sentences):
+        return None
+
+    repaired = " ".join(kept)
+    if contains_power_primes(repaired) or not enforce_allowed_prices(repaired, allowed_prices, allow_no_price):
+        return None
+    return repaired
+
+def fallback_reply(msgs, allowed: set[int], counter: int | None, allow_no_price: bool) -> str:
+    # lokale Vorlage liest die Preis-Anweisung aus msgs; muss dieselben Regeln erfüllen wie das LLM
+    reply = TemplateProvider(phrases=VARIANT["template_phrases"]).complete(msgs)["content"]
+    if not contains_power_primes(reply) and enforce_allowed_prices(reply, allowed_prices=allowed, allow_no_price=allow_no_price):
+        return reply
+    if counter is None:
+        return "Alles klar. Damit wir weiter verhandeln können: Welchen konkreten Preis möchtest du als Zahl in € anbieten?"
+    return f"Ich kann dir {counter} € anbieten."
+
+PRICE_CORRECTION = (
+    "REGELVERSTOSS: Unerlaubte Zahlen/Preise. Formuliere neu und nutze ausschließlich "
+    "die erlaubten Euro-Zahlen. Nenne sonst gar keine Zahl."
+)
+
+FORMAT_CORRECTION = (
+    "FORMATFEHLER: Antworte ausschließlich mit einem vollständigen JSON-Objekt mit den Feldern "
+    '"reply", "prices" (ganze Zahlen) und "intent". Halte reply kurz.'
+)
+
+def llm_with_price_guard(history_msgs, params: dict, instruction: str, user_price: int | None, counter: int | None,
+                         allow_no_price: bool, priority: int = PRIORITY_NORMAL) -> str:
     WRONG_CAPACITY_PATTERN = r"\b(32|64|128|512|1024|2048)\s?gb\b|\b(1|2)\s?tb\b"
 
     allowed: set[int] = set()
@@ -597,52 +708,138 @@ def llm_with_price_guard(history_msgs, params: dict, user_price: int | None, cou
     if isinstance(counter, int):
         allowed.add(int(counter))
 
+    # Prompt-Cache der Provider: vorne nur, was über alle Turns der Session gleich bleibt
+    # (System-Prompt, feste Regeln, wachsender Verlauf); Turn-Anweisung, erlaubte Preise
+    # und Korrekturen nach Regelverstößen kommen ans Ende.
     guard = (
         "HARTE REGEL:\n"
-        "- Du darfst als Euro-Beträge NUR diese Zahlen verwenden: "
-        + (", ".join(str(x) for x in sorted(allowed)) if allowed else "KEINE") + ".\n"
+        "- Nenne als Euro-Beträge NUR die Zahlen, die in der letzten Anweisung erlaubt sind.\n"
         "- Nenne KEINE weiteren Preise/Eurobeträge, keine alternativen Zahlenangebote.\n"
-        "- Keine Macht-/Druck-/Knappheitsstrategien.\n"
+        + VARIANT["guard_rule"] +
         f"- Maximal {params['max_sentences']} Sätze.\n"
         "- Keine Listen. Keine Rechenbeispiele.\n"
     )
 
+    if LLM_STRUCTURED_OUTPUT:
+        guard += STRUCTURED_INSTRUCTION + "\n"
+
+    turn_rule = (
+        f"{instruction}\n"
+        "HARTE REGEL für diese Antwort: Du darfst als Euro-Beträge NUR diese Zahlen verwenden: "
+        + (", ".join(str(x) for x in sorted(allowed)) if allowed else "KEINE") + "."
+    )
     base_msgs = (
-        [{"role": "system", "content": system_prompt(params)}]
+        [{"role": "system", "content": system_prompt(BOT_VARIANT, params)}]
         + [{"role": "system", "content": guard}]
         + history_msgs
+        + [{"role": "system", "content": turn_rule}]
     )
 
-    for _ in range(3):
-        reply = call_openai(base_msgs, temperature=0.3, max_tokens=240)
-        if not isinstance(reply, str):
-            reply = ""
-
-        if contains_power_primes(reply):
-            base_msgs = (
-                [{"role": "system", "content": "REGELVERSTOSS: Keine Macht-/Knappheits-/Autoritäts-Frames. Formuliere neu."}]
-                + base_msgs
+    turn_index = len(st.session_state["history"])
+    deadline = time.monotonic() + LLM_TURN_BUDGET_S
+    fallback_reason = "retries_exhausted"
+
+    def log_discarded(call: dict, attempt: int):
+        run_async(log_llm_call, SID, call, turn_index, attempt, violation="hedge_discarded", accepted=False)
+
+    attempt = 0
+    for attempt in range(1, 4):
+        fallback_reason = "retries_exhausted"  # Grund des letzten Versuchs zählt
+        call = call_llm(
+            base_msgs, temperature=0.3, max_tokens=240, deadline=deadline,
+            on_discard=lambda c, a=attempt: log_discarded(c, a),
+            response_format=STRUCTURED_RESPONSE_FORMAT if LLM_STRUCTURED_OUTPUT else None,
+            priority=priority,
+        )
+        if call["status"] == "timeout":
+            run_async(log_llm_call, SID, call, turn_index, attempt, violation="budget_exhausted", accepted=False)
+            fallback_reason = "budget_exhausted"
+            break
+
+        reply = call["content"]
+        if call["status"] not in ("ok", "replay") or not isinstance(reply, str) or not reply.strip():
+            # Fehler (429, HTTP, Cassette) oder leere Antwort: nie eine leere Blase zeigen,
+            # sondern neuer Versuch (nach 429 wartet der Scheduler) und sonst die Vorlage
+            run_async(
+                log_llm_call, SID, call, turn_index, attempt,
+                violation="empty_reply" if call["status"] in ("ok", "replay") else call["status"],
+                accepted=False,
             )
+            fallback_reason = "llm_error"
+            if time.monotonic() >= deadline:
+                fallback_reason = "budget_exhausted"
+                break
             continue
 
+        meta = parse_structured_reply(reply) if LLM_STRUCTURED_OUTPUT else None
+        format_violation = None
+        if LLM_STRUCTURED_OUTPUT and meta is None:
+            # ungültiges JSON (z. B. bei max_tokens abgeschnitten): lesbaren reply-Text retten,
+            # sonst Fehlversuch mit Format-Korrektur – nie das rohe JSON anzeigen
+            recovered = recover_reply_text(reply)
+            if recovered is None:
+                run_async(log_llm_call, SID, call, turn_index, attempt, violation="bad_json", accepted=False)
+                base_msgs = base_msgs + [{"role": "system", "content": FORMAT_CORRECTION}]
+                if time.monotonic() >= deadline:
+                    fallback_reason = "budget_exhausted"
+                    break
+                continue
+            reply = recovered
+            format_violation = "bad_json"
+        if meta is not None:
+            reply = meta["reply"]
+            # deklarierte Preise: reiner Set-Vergleich, verwirft falsche Antworten ohne Text-Scan
+            if not set(meta["prices"]) <= allowed or (not allow_no_price and not meta["prices"]):
+                run_async(log_llm_call, SID, call, turn_index, attempt, violation="declared_prices", accepted=False, meta=meta)
+                base_msgs = base_msgs + [{"role": "system", "content": PRICE_CORRECTION}]
+                if time.monotonic() >= deadline:
+                    fallback_reason = "budget_exhausted"
+                    break
+                continue
         reply = re.sub(WRONG_CAPACITY_PATTERN, "256 GB", reply, flags=re.IGNORECASE)
 
-        if enforce_allowed_prices(reply, allowed_prices=allowed, allow_no_price=allow_no_price):
+        has_primes = contains_power_primes(reply)
+        if not has_primes and enforce_allowed_prices(reply, allowed_prices=allowed, allow_no_price=allow_no_price):
+            violation = format_violation
+            if meta is not None and not set(euro_numbers_in_text(reply)) <= set(meta["prices"]):
+                # Text ist regelkonform, nur die Deklaration unvollständig: Metadaten korrigieren
+                violation = "undeclared_prices"
+                meta["prices"] = sorted(set(meta["prices"]) | set(euro_numbers_in_text(reply)))
+            run_async(log_llm_call, SID, call, turn_index, attempt, violation=violation, accepted=True, meta=meta)
             return reply
 
-        base_msgs = (
-            [{"role": "system",
-              "content": "REGELVERSTOSS: Unerlaubte Zahlen/Preise. Formuliere neu und nutze ausschließlich die erlaubten Euro-Zahlen. Nenne sonst gar keine Zahl."}]
-            + base_msgs
-        )
+        # meist nur ein Satz mit Streu-Zahl oder Prime: lokal entfernen statt neuer Round-Trip
+        repaired = repair_reply(reply, allowed, allow_no_price)
+        if repaired is not None:
+            violation = "power_primes_repaired" if has_primes else "disallowed_prices_repaired"
+            run_async(log_llm_call, SID, call, turn_index, attempt, violation=violation, accepted=True, meta=meta)
+            return repaired
+
+        if has_primes:
+            run_async(log_llm_call, SID, call, turn_index, attempt, violation="power_primes", accepted=False)
+            base_msgs = base_msgs + [{"role": "system", "content": VARIANT["bad_pattern_correction"]}]
+            if time.monotonic() >= deadline:
+                fallback_reason = "budget_exhausted"
+                break
+            continue
 
-    if counter is None:
-        return "Alles klar. Damit wir weiter verhandeln können: Welchen konkreten Preis möchtest du als Zahl in € anbieten?"
-    return f"Ich kann dir {counter} € anbieten."
+        run_async(log_llm_call, SID, call, turn_index, attempt, violation="disallowed_prices", accepted=False)
+        base_msgs = base_msgs + [{"role": "system", "content": PRICE_CORRECTION}]
+
+        if time.monotonic() >= deadline:
+            fallback_reason = "budget_exhausted"
+            break
+
+    reply = fallback_reply(base_msgs, allowed, counter, allow_no_price)
+    fallback_call = empty_result("template")
+    fallback_call["status"] = "fallback"
+    fallback_call["latency_ms"] = 0
+    run_async(log_llm_call, SID, fallback_call, turn_index, attempt + 1, violation=fallback_reason, accepted=True)
+    return reply
 
 def llm_no_price_reply(history_msgs, params: dict, reason: str = "") -> str:
     instruct = (
-        "Du bist ein freundlicher, sachlicher Verkäufer.\n"
+        f"{VARIANT['persona']}\n"
         "Antworte 2–4 Sätze.\n"
         "Aufgabe: Reagiere INHALTLICH auf die letzte Nachricht (Einwand, Nachfrage, Kommentar).\n"
         "Dann führe die Verhandlung zurück zum Preis: Bitte um ein konkretes Angebot in €.\n"
@@ -650,12 +847,17 @@ def llm_no_price_reply(history_msgs, params: dict, reason: str = "") -> str:
         "- Nenne KEINE Zahlen, KEINE Eurobeträge, KEINE Preis-Spannen und KEINE Prozentangaben.\n"
         f"Kontext/Grund: {reason}."
     )
-    history2 = [{"role": "system", "content": instruct}] + history_msgs
-    return llm_with_price_guard(history2, params, user_price=None, counter=None, allow_no_price=True)
+    return llm_with_price_guard(history_msgs, params, instruct, user_price=None, counter=None, allow_no_price=True)
 
 # -----------------------------
 # Generate Reply (Preislogik identisch zum Power-Bot; nur Ton anders)
 # -----------------------------
+def note_turn(**fields):
+    # Entscheidungen der Preislogik für negotiation_events sammeln (von process_turn angelegt)
+    event = st.session_state.get("turn_event")
+    if event is not None:
+        event.update(fields)
+
 def generate_reply(history_msgs, params: dict) -> str:
     last_user_msg = next((m["content"] for m in reversed(history_msgs) if m["role"] == "user"), "")
     user_price = extract_user_offer(last_user_msg)
@@ -663,7 +865,7 @@ def generate_reply(history_msgs, params: dict) -> str:
     # ✅ wichtig: pro Turn resetten, damit snap_to_user nicht "hängen bleibt"
     st.session_state["snap_to_user"] = False
 
-    msg_count = sum(1 for m in history_msgs if m["role"] == "assistant")
+    msg_count = st.session_state["history"].n_assistant
     last_bot_offer = st.session_state.get("last_bot_offer", None)
 
     LIST = int(params["list_price"])
@@ -677,7 +879,7 @@ def generate_reply(history_msgs, params: dict) -> str:
         if last_bot_offer is None:
             return max(new_price, MIN)
         if new_price >= last_bot_offer:
-            return max(last_bot_offer - random.randint(5, 15), MIN)
+            return max(last_bot_offer - rng().randint(5, 15), MIN)
         return max(new_price, MIN)
 
     def clamp_counter_vs_user(counter: int, user_price_: int):
@@ -706,47 +908,51 @@ def generate_reply(history_msgs, params: dict) -> str:
 
     def concession_step(base: int, min_price: int) -> int:
         if base > 930:
-            step = random.randint(15, 30)
+            step = rng().randint(15, 30)
         elif base > 880:
-            step = random.randint(10, 20)
+            step = rng().randint(10, 20)
         else:
-            step = random.randint(5, 12)
+            step = rng().randint(5, 12)
         return max(base - step, min_price)
 
     # Kein Preis erkannt
     if user_price is None:
+        note_turn(branch="no_price")
         return llm_no_price_reply(history_msgs, params, reason="no_price_detected")
 
     # A) < 600: Ablehnen ohne Gegenangebot
     if user_price < 600:
+        note_turn(branch="A")
         instruct = (
             f"Der Nutzer bietet {user_price} €. "
-            "Lehne freundlich, aber klar ab. Kein Gegenangebot. "
+            f"{VARIANT['reject_style']} Kein Gegenangebot. "
             "Bitte um ein realistischeres neues Angebot. 2–4 Sätze."
         )
-        history2 = [{"role": "system", "content": instruct}] + history_msgs
-        return llm_with_price_guard(history2, params, user_price=user_price, counter=None, allow_no_price=True)
+        return llm_with_price_guard(history_msgs, params, instruct,
+                                    user_price=user_price, counter=None, allow_no_price=True)
 
     # B) 600–700
     if 600 <= user_price < 700:
-        raw = random.randint(920, 990) if last_bot_offer is None else concession_step(last_bot_offer, MIN)
+        raw = rng().randint(920, 990) if last_bot_offer is None else concession_step(last_bot_offer, MIN)
         counter = ensure_not_higher(human_price(raw, user_price))
         counter = clamp_counter_vs_user(counter, user_price)
 
         st.session_state["bot_offer"] = counter
         st.session_state["last_bot_offer"] = counter
+        note_turn(branch="B", raw_counter=raw, counter=counter,
+                  snap_to_user=st.session_state["snap_to_user"])
 
         instruct = (
             f"Der Nutzer bietet {user_price} €. "
-            f"Setze ein Gegenangebot: {counter} €. 2–4 freundliche, sachliche Sätze."
+            f"Setze ein Gegenangebot: {counter} €. {VARIANT['reply_style']}."
         )
-        history2 = [{"role": "system", "content": instruct}] + history_msgs
-        return llm_with_price_guard(history2, params, user_price=user_price, counter=counter, allow_no_price=False)
+        return llm_with_price_guard(history_msgs, params, instruct,
+                                    user_price=user_price, counter=counter, allow_no_price=False)
 
     # C) 700–801
     if 700 <= user_price < 801:
         if last_bot_offer is None:
-            raw = random.randint(910, 960) if msg_count < 3 else random.randint(850, 930)
+            raw = rng().randint(910, 960) if msg_count < 3 else rng().randint(850, 930)
         else:
             raw = concession_step(last_bot_offer, MIN)
 
@@ -755,18 +961,20 @@ def generate_reply(history_msgs, params: dict) -> str:
 
         st.session_state["bot_offer"] = counter
         st.session_state["last_bot_offer"] = counter
+        note_turn(branch="C", raw_counter=raw, counter=counter,
+                  snap_to_user=st.session_state["snap_to_user"])
 
         instruct = (
             f"Der Nutzer bietet {user_price} €. "
-            f"Setze ein Gegenangebot: {counter} €. 2–4 freundliche, sachliche Sätze."
+            f"Setze ein Gegenangebot: {counter} €. {VARIANT['reply_style']}."
         )
-        history2 = [{"role": "system", "content": instruct}] + history_msgs
-        return llm_with_price_guard(history2, params, user_price=user_price, counter=counter, allow_no_price=False)
+        return llm_with_price_guard(history_msgs, params, instruct,
+                                    user_price=user_price, counter=counter, allow_no_price=False)
 
     # D) 801–900
     if 801 <= user_price < 900:
         if last_bot_offer is None:
-            raw = user_price + (random.randint(60, 110) if msg_count < 5 else random.randint(20, 55))
+            raw = user_price + (rng().randint(60, 110) if msg_count < 5 else rng().randint(20, 55))
         else:
             raw = concession_step(last_bot_offer, MIN)
 
@@ -775,26 +983,29 @@ def generate_reply(history_msgs, params: dict) -> str:
 
         st.session_state["bot_offer"] = counter
         st.session_state["last_bot_offer"] = counter
+        note_turn(branch="D", raw_counter=raw, counter=counter,
+                  snap_to_user=st.session_state["snap_to_user"])
 
         if st.session_state.get("snap_to_user"):
             instruct = (
                 f"Der Nutzer bietet {user_price} €. "
-                f"Nimm das Angebot an. Bestätige kurz, freundlich und verbindlich. "
+                f"Nimm das Angebot an. {VARIANT['accept_style']} "
                 f"Nenne GENAU {counter} € und keine weitere Zahl."
             )
         else:
             instruct = (
                 f"Der Nutzer bietet {user_price} €. "
-                f"Setze ein Gegenangebot: {counter} €. 2–4 freundliche, sachliche Sätze."
+                f"Setze ein Gegenangebot: {counter} €. {VARIANT['reply_style']}."
             )
 
-        history2 = [{"role": "system", "content": instruct}] + history_msgs
-        return llm_with_price_guard(history2, params, user_price=user_price, counter=counter, allow_no_price=False)
+        priority = PRIORITY_TERMINAL if st.session_state.get("snap_to_user") else PRIORITY_NORMAL
+        return llm_with_price_guard(history_msgs, params, instruct,
+                                    user_price=user_price, counter=counter, allow_no_price=False, priority=priority)
 
     # E) >= 900
     if user_price >= 900:
         if last_bot_offer is None:
-            raw = user_price + (random.randint(30, 70) if msg_count < 5 else random.randint(10, 40))
+            raw = user_price + (rng().randint(30, 70) if msg_count < 5 else rng().randint(10, 40))
         else:
             raw = concession_step(last_bot_offer, MIN)
 
@@ -804,130 +1015,156 @@ def generate_reply(history_msgs, params: dict) -> str:
 
         st.session_state["bot_offer"] = counter
         st.session_state["last_bot_offer"] = counter
+        note_turn(branch="E", raw_counter=raw, counter=counter,
+                  snap_to_user=st.session_state["snap_to_user"])
 
         if st.session_state.get("snap_to_user"):
             instruct = (
                 f"Der Nutzer bietet {user_price} €. "
-                f"Nimm das Angebot an. Bestätige kurz, freundlich und verbindlich. "
+                f"Nimm das Angebot an. {VARIANT['accept_style']} "
                 f"Nenne GENAU {counter} € und keine weitere Zahl."
             )
         else:
             instruct = (
                 f"Der Nutzer bietet {user_price} €. "
-                f"Setze ein Gegenangebot: {counter} €. 2–4 freundliche, sachliche Sätze."
+                f"Setze ein Gegenangebot: {counter} €. {VARIANT['reply_style']}."
             )
 
-        history2 = [{"role": "system", "content": instruct}] + history_msgs
-        return llm_with_price_guard(history2, params, user_price=user_price, counter=counter, allow_no_price=False)
+        priority = PRIORITY_TERMINAL if st.session_state.get("snap_to_user") else PRIORITY_NORMAL
+        return llm_with_price_guard(history_msgs, params, instruct,
+                                    user_price=user_price, counter=counter, allow_no_price=False, priority=priority)
 
     # Fallback (sollte nie laufen)
     new_price = max(concession_step(last_bot_offer or LIST, MIN), MIN)
+    note_turn(branch="fallback", raw_counter=new_price, counter=new_price)
     st.session_state["bot_offer"] = new_price
     st.session_state["last_bot_offer"] = new_price
     instruct = (
         f"Der Nutzer bietet {user_price} €. "
-        f"Setze das Gegenangebot {new_price} € freundlich und klar. 2–4 Sätze."
+        f"Setze das Gegenangebot {new_price} € {VARIANT['fallback_style']}. 2–4 Sätze."
     )
-    history2 = [{"role": "system", "content": instruct}] + history_msgs
-    return llm_with_price_guard(history2, params, user_price=user_price, counter=new_price, allow_no_price=False)
+    return llm_with_price_guard(history_msgs, params, instruct,
+                                user_price=user_price, counter=new_price, allow_no_price=False)
 
 # -----------------------------
 # Logging (SQLite)
 # -----------------------------
 
-def log_result(session_id: str, deal: bool, price: int | None, msg_count: int, ended_by: str, ended_via: str | None = None):
+def log_result(session_id: str, deal: bool, price: int | None, msg_count: int, ended_by: str,
+               ended_via: str | None = None) -> bool:
+    """False: Session schon vom Reaper per Timeout beendet (Tab war zu lange ohne Heartbeat) –
+    dann keine zweite results-Zeile; der Aufrufer zeigt den Timeout-Abschluss (close_by_timeout)."""
     init_db()
     conn = get_conn()
     cur = conn.cursor()
+    cur.execute("SELECT ended_via FROM sessions WHERE session_id = %s FOR UPDATE", (session_id,))
+    row = cur.fetchone()
+    if row is not None and row[0] == "timeout":
+        conn.close()  # Rollback gibt die Zeilensperre frei
+        return False
     cur.execute("""
         INSERT INTO results (
-            ts, session_id, participant_id, bot_variant, order_id, step,
+            study_id, ts, session_id, participant_id, bot_variant, order_id, step,
             deal, price, msg_count, ended_by, ended_via
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
     """, (
-        datetime.utcnow().isoformat(),
+        STUDY_ID, utc_now(),
         session_id, PID, BOT_VARIANT, ORDER, STEP,
         1 if deal else 0, price, msg_count, ended_by, ended_via
     ))
+    cur.execute("""
+        UPDATE sessions SET
+            ended_ts = %s, outcome = %s, price = %s, ended_by = %s, ended_via = %s,
+            msg_count = GREATEST(msg_count, %s)
+        WHERE session_id = %s
+    """, (
+        utc_now(), "deal" if deal else "abort", price, ended_by, ended_via,
+        msg_count, session_id,
+    ))
     conn.commit()
     conn.close()
-
-def log_chat_message(session_id: str, role: str, text: str, ts: str, msg_index: int):
+    # Verhandlung beendet: Fairness-Zähler der LLM-Warteschlange freigeben
+    get_scheduler().forget_session(session_id)
+    return True
+
+def close_by_timeout():
+    st.session_state["end_kind"] = "abort"
+    st.session_state["end_price"] = None
+    st.session_state["end_note"] = TIMEOUT_NOTE
+    st.session_state["closed"] = True
+    persist_state()
+    st.rerun()
+
+def start_session(session_id: str):
+    now = utc_now()
     init_db()
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("""
-        INSERT INTO chat_messages (
-            session_id, participant_id, bot_variant, role, text, ts, msg_index
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s)
-    """, (session_id, PID, BOT_VARIANT, role, text, ts, msg_index))
+        INSERT INTO sessions (session_id, study_id, participant_id, bot_variant, order_id, step, started_ts, last_seen_ts)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+        ON CONFLICT (session_id) DO NOTHING
+    """, (session_id, STUDY_ID, PID, BOT_VARIANT, ORDER, STEP, now, now))
     conn.commit()
     conn.close()
 
-def load_chat_for_session(session_id: str) -> pd.DataFrame:
+def log_chat_message(session_id: str, role: str, text: str, ts: datetime, msg_index: int):
     init_db()
     conn = get_conn()
-    df = pd.read_sql_query("""
-        SELECT participant_id, bot_variant, role, text, ts
-        FROM chat_messages
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO chat_messages (study_id, session_id, role, text, ts, msg_index)
+        VALUES (%s,%s,%s,%s,%s,%s)
+    """, (STUDY_ID, session_id, role, text, ts, msg_index))
+    cur.execute("""
+        UPDATE sessions SET msg_count = GREATEST(msg_count, %s)
         WHERE session_id = %s
-        ORDER BY msg_index ASC
-    """, conn, params=(session_id,))
+    """, (msg_index + 1, session_id))
+    conn.commit()
     conn.close()
-    return df
 
-def load_results_df() -> pd.DataFrame:
+def log_turn_event(session_id: str, turn_index: int, msg_index: int | None, event: dict):
     init_db()
     conn = get_conn()
-    df = pd.read_sql_query("""
-        SELECT
-            ts, participant_id, session_id, bot_variant, order_id, step,
-            deal, price, msg_count, ended_by, ended_via
-        FROM results
-        ORDER BY id ASC
-    """, conn)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO negotiation_events (
+            study_id, ts, session_id, turn_index, msg_index, decision, branch,
+            user_price, last_bot_offer, raw_counter, counter, snap_to_user, deal_price
+        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    """, (
+        STUDY_ID, utc_now(), session_id, turn_index, msg_index,
+        event.get("decision"), event.get("branch"),
+        event.get("user_price"), event.get("last_bot_offer"), event.get("raw_counter"), event.get("counter"),
+        None if event.get("snap_to_user") is None else int(event["snap_to_user"]),
+        event.get("deal_price"),
+    ))
+    conn.commit()
     conn.close()
 
-    if not df.empty:
-        df["deal"] = df["deal"].map({1: "Deal", 0: "Abgebrochen"})
-        df["ended_by"] = df["ended_by"].map({"user": "User", "bot": "Bot"}).fillna("Unbekannt")
-        df["ended_via"] = df["ended_via"].fillna("")
-    return df
-
-def export_all_chats_to_txt(bot_variant: str | None = None) -> str:
+def log_llm_call(session_id: str, call: dict, turn_index: int, attempt: int, violation: str | None, accepted: bool,
+                 meta: dict | None = None):
     init_db()
     conn = get_conn()
-
-    if bot_variant:
-        df = pd.read_sql_query("""
-            SELECT session_id, role, text, ts, msg_index
-            FROM chat_messages
-            WHERE bot_variant = %s
-            ORDER BY session_id, msg_index ASC
-        """, conn, params=(bot_variant,))
-    else:
-        df = pd.read_sql_query("""
-            SELECT session_id, role, text, ts, msg_index
-            FROM chat_messages
-            ORDER BY session_id, msg_index ASC
-        """, conn)
-
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO llm_calls (
+            study_id, ts, session_id, participant_id, bot_variant, model, turn_index, attempt,
+            status, violation, accepted, prompt_tokens, completion_tokens, total_tokens, cached_tokens,
+            latency_ms, intent, declared_prices
+        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    """, (
+        STUDY_ID, utc_now(),
+        session_id, PID, BOT_VARIANT, call.get("model"), turn_index, attempt,
+        call.get("status"), violation, 1 if accepted else 0,
+        call.get("prompt_tokens"), call.get("completion_tokens"), call.get("total_tokens"),
+        call.get("cached_tokens"), call.get("latency_ms"),
+        meta["intent"] if meta else None,
+        ",".join(str(p) for p in meta["prices"]) if meta else None,
+    ))
+    conn.commit()
     conn.close()
 
-    if df.empty:
-        return "Keine Chatverläufe vorhanden."
-
-    out = []
-    for session_id, group in df.groupby("session_id"):
-        out.append(f"Session-ID: {session_id}")
-        out.append("-" * 50)
-        for _, row in group.iterrows():
-            role = "USER" if row["role"] == "user" else "BOT"
-            out.append(f"[{row['ts']}] {role}: {row['text']}")
-        out.append("\n" + "=" * 60 + "\n")
-
-    return "\n".join(out)
-
 # -----------------------------
 # Szenario Kopf
 # -----------------------------
@@ -942,56 +1179,66 @@ st.caption(f"Session-ID: `{st.session_state['session_id']}`")
 # Chat UI
 # -----------------------------
 st.subheader("💬 iPad Verhandlungs-Bot")
-tz = pytz.timezone("Europe/Berlin")
 
 # initial bot message
 if len(st.session_state["history"]) == 0:
-    first_msg = (
-        "Hi! Ich biete ein neues iPad (256 GB, Space Grey) inklusive Apple Pencil (2. Gen) "
-        f"mit M5-Chip an. Der Ausgangspreis liegt bei {DEFAULT_PARAMS['list_price']} €. "
-        "Was schwebt dir preislich vor?"
-    )
-    bot_ts = datetime.now(tz).strftime("%d.%m.%Y %H:%M")
-    st.session_state["history"].append({
-        "role": "assistant",
-        "text": first_msg,
-        "ts": bot_ts,
-    })
-    msg_index = len(st.session_state["history"]) - 1
-    log_chat_message(st.session_state["session_id"], "assistant", first_msg, bot_ts, msg_index)
-
-user_input = st.chat_input("Deine Nachricht", disabled=st.session_state["closed"])
+    first_msg = VARIANT["greeting"].format(list_price=DEFAULT_PARAMS["list_price"])
+    bot_ts = utc_now()
+    msg_index = st.session_state["history"].append("assistant", first_msg, bot_ts)
+    # gleicher Writer-Thread: die Session-Zeile steht vor der ersten Nachricht
+    run_async(start_session, st.session_state["session_id"])
+    run_async(log_chat_message, st.session_state["session_id"], "assistant", first_msg, bot_ts, msg_index)
+    persist_state()
+
+# Turn in zwei Runs: (1) User-Nachricht speichern + sofort rendern, (2) Bot-Antwort
+# erzeugen, während Verlauf + Tipp-Indikator schon sichtbar sind.
+if "pending_turn" not in st.session_state:
+    st.session_state["pending_turn"] = None
+
+user_input = st.chat_input(
+    "Deine Nachricht",
+    disabled=st.session_state["closed"] or st.session_state["pending_turn"] is not None,
+)
 
-if user_input and not st.session_state["closed"]:
-    now = datetime.now(tz).strftime("%d.%m.%Y %H:%M")
+if user_input and not st.session_state["closed"] and st.session_state["pending_turn"] is None:
+    now = utc_now()
 
     # store user msg
-    st.session_state["history"].append({"role": "user", "text": user_input.strip(), "ts": now})
-    msg_index = len(st.session_state["history"]) - 1
-    log_chat_message(st.session_state["session_id"], "user", user_input.strip(), now, msg_index)
+    msg_index = st.session_state["history"].append("user", user_input.strip(), now)
+    run_async(log_chat_message, st.session_state["session_id"], "user", user_input.strip(), now, msg_index)
 
+    st.session_state["pending_turn"] = user_input
+    st.rerun()
+
+def process_turn(user_input: str):
     # build llm history
-    llm_history = [{"role": m["role"], "content": m["text"]} for m in st.session_state["history"]]
+    llm_history = st.session_state["history"].llm_messages()
 
     # extract price for abort logic
     user_price = extract_user_offer(user_input)
     decision, msg = check_abort_conditions(user_input, user_price)
+    turn_index = st.session_state["history"].n_user
+    st.session_state["turn_event"] = event = {
+        "user_price": user_price,
+        "last_bot_offer": st.session_state.get("last_bot_offer"),
+        "decision": "reply" if decision == "ok" else decision,
+    }
 
     # abort
     if decision == "abort":
         st.session_state["closed"] = True
-        st.session_state["history"].append({
-            "role": "assistant",
-            "text": msg,
-            "ts": datetime.now(tz).strftime("%d.%m.%Y %H:%M"),
-        })
+        bot_ts = utc_now()
+        msg_index = st.session_state["history"].append("assistant", msg, bot_ts)
+        run_async(log_chat_message, st.session_state["session_id"], "assistant", msg, bot_ts, msg_index)
+        run_async(log_turn_event, SID, turn_index, msg_index, event)
 
         st.session_state["end_kind"] = "abort"
         st.session_state["end_price"] = None
         st.session_state["end_note"] = "Die Verhandlung wurde vom Verkäufer beendet. Bitte fülle nun den Abschlussfragebogen aus."
 
-        msg_count = len([m for m in st.session_state["history"] if m["role"] in ("user", "assistant")])
-        log_result(st.session_state["session_id"], False, None, msg_count, ended_by="bot", ended_via="abort_rule")
+        msg_count = st.session_state["history"].msg_count
+        if not log_result(st.session_state["session_id"], False, None, msg_count, ended_by="bot", ended_via="abort_rule"):
+            close_by_timeout()
         st.session_state["closed"] = True
         st.rerun()
 
@@ -1000,16 +1247,19 @@ if user_input and not st.session_state["closed"]:
     if last_offer and user_accepts_price(user_input, last_offer):
         st.session_state["final_bot_price"] = last_offer
         st.session_state["closed"] = True
+        event.update(decision="deal_message", deal_price=last_offer)
+        run_async(log_turn_event, SID, turn_index, None, event)
 
-        msg_count = len([m for m in st.session_state["history"] if m["role"] in ("user", "assistant")])
-        log_result(
+        msg_count = st.session_state["history"].msg_count
+        if not log_result(
             st.session_state["session_id"],
             True,
             last_offer,
             msg_count,
             ended_by="user",
             ended_via="deal_message"
-        )
+        ):
+            close_by_timeout()
 
         st.session_state["end_kind"] = "deal"
         st.session_state["end_price"] = last_offer
@@ -1030,16 +1280,17 @@ if user_input and not st.session_state["closed"]:
         instruct_deal = (
             f"Der Nutzer bietet {user_price} €. "
             f"Ihr liegt maximal 5 € auseinander. "
-            f"Nimm das Angebot an. Bestätige kurz, freundlich und verbindlich. "
+            f"Nimm das Angebot an. {VARIANT['accept_style']} "
             f"Nenne GENAU {deal_price} € und keine weitere Zahl."
         )
-        llm_history2 = [{"role": "system", "content": instruct_deal}] + llm_history
         bot_text = llm_with_price_guard(
-            llm_history2,
+            llm_history,
             st.session_state.params,
+            instruct_deal,
             user_price=user_price,
             counter=deal_price,
-            allow_no_price=False
+            allow_no_price=False,
+            priority=PRIORITY_TERMINAL,
         )
 
         # State setzen, damit UI/Survey sauber greifen
@@ -1050,23 +1301,16 @@ if user_input and not st.session_state["closed"]:
         st.session_state["closed"] = True
 
         # Bot-Nachricht speichern + loggen
-        st.session_state["history"].append({
-            "role": "assistant",
-            "text": bot_text,
-            "ts": datetime.now(tz).strftime("%d.%m.%Y %H:%M"),
-        })
-        msg_index = len(st.session_state["history"]) - 1
-        log_chat_message(
-            st.session_state["session_id"],
-            "assistant",
-            bot_text,
-            datetime.now(tz).strftime("%d.%m.%Y %H:%M"),
-            msg_index
-        )
+        bot_ts = utc_now()
+        msg_index = st.session_state["history"].append("assistant", bot_text, bot_ts)
+        run_async(log_chat_message, st.session_state["session_id"], "assistant", bot_text, bot_ts, msg_index)
+        event.update(decision="auto_deal", deal_price=deal_price, counter=deal_price)
+        run_async(log_turn_event, SID, turn_index, msg_index, event)
 
         # Ergebnis loggen: Bot nimmt an
-        msg_count = len([m for m in st.session_state["history"] if m["role"] in ("user", "assistant")])
-        log_result(st.session_state["session_id"], True, deal_price, msg_count, ended_by="bot", ended_via="auto_deal_gap")
+        msg_count = st.session_state["history"].msg_count
+        if not log_result(st.session_state["session_id"], True, deal_price, msg_count, ended_by="bot", ended_via="auto_deal_gap"):
+            close_by_timeout()
         st.rerun()
 
     # warn vs normal
@@ -1076,41 +1320,38 @@ if user_input and not st.session_state["closed"]:
         bot_text = generate_reply(llm_history, st.session_state.params)
 
     # store bot msg
-    bot_ts = datetime.now(tz).strftime("%d.%m.%Y %H:%M")
-    st.session_state["history"].append({
-        "role": "assistant",
-        "text": bot_text,
-        "ts": bot_ts,
-    })
-    msg_index = len(st.session_state["history"]) - 1
-    log_chat_message(st.session_state["session_id"], "assistant", bot_text, bot_ts, msg_index)
+    bot_ts = utc_now()
+    msg_index = st.session_state["history"].append("assistant", bot_text, bot_ts)
+    run_async(log_chat_message, st.session_state["session_id"], "assistant", bot_text, bot_ts, msg_index)
+    run_async(log_turn_event, SID, turn_index, msg_index, event)
 
 # render chat
-BOT_AVATAR  = img_to_base64("bot.png")
-USER_AVATAR = img_to_base64("user.png")
+BOT_AVATAR = img_to_base64("bot.png")
 
 for item in st.session_state["history"]:
-    role = item["role"]
-    text = item["text"]
-    ts = item["ts"]
-
-    is_user = (role == "user")
-    avatar_b64 = USER_AVATAR if is_user else BOT_AVATAR
-    side = "right" if is_user else "left"
-    klass = "msg-user" if is_user else "msg-bot"
-
-    st.markdown(f"""
-    <div class="row {side}">
-        <img src="data:image/png;base64,{avatar_b64}" class="avatar">
-        <div class="chat-bubble {klass}">
-            {text}
-        </div>
-    </div>
-    <div class="row {side}">
-        <div class="meta">{ts}</div>
+    st.markdown(chat_bubble_html(item.role, item.text, item.ts), unsafe_allow_html=True)
+
+# offener Turn: Tipp-Indikator zeigen, Antwort erzeugen, dann neu rendern
+if st.session_state["pending_turn"] is not None:
+    typing_slot = st.empty()
+    typing_slot.markdown(f"""
+    <div class="row left">
+        <img src="data:image/png;base64,{BOT_AVATAR}" class="avatar">
+        <div class="chat-bubble msg-bot typing"><span></span><span></span><span></span></div>
     </div>
     """, unsafe_allow_html=True)
 
+    pending_text = st.session_state["pending_turn"]
+    # vor der Verarbeitung zurücksetzen: ein Fehler im Turn soll den Chat nicht dauerhaft sperren
+    st.session_state["pending_turn"] = None
+    try:
+        process_turn(pending_text)
+    finally:
+        # auch bei st.rerun() innerhalb des Turns (Deal/Abbruch)
+        persist_state()
+    typing_slot.empty()
+    st.rerun()
+
 # Deal/Abort Buttons
 if not st.session_state["closed"]:
     deal_col1, deal_col2 = st.columns([1, 1])
@@ -1129,16 +1370,17 @@ if not st.session_state["closed"]:
             use_container_width=True
         ):
             bot_price = current_offer
-            msg_count = len([m for m in st.session_state["history"] if m["role"] in ("user", "assistant")])
+            msg_count = st.session_state["history"].msg_count
 
-            log_result(
+            if not log_result(
                 st.session_state["session_id"],
                 True,
                 bot_price,
                 msg_count,
                 ended_by="user",
                 ended_via="deal_button"
-            )
+            ):
+                close_by_timeout()
 
             st.session_state["end_kind"] = "deal"
             st.session_state["end_price"] = bot_price
@@ -1146,170 +1388,19 @@ if not st.session_state["closed"]:
 
             st.session_state["final_bot_price"] = bot_price
             st.session_state["closed"] = True
+            persist_state()
             st.rerun()
 
     with deal_col2:
         if st.button("❌ Verhandlung beenden", use_container_width=True):
-            msg_count = len([m for m in st.session_state["history"] if m["role"] in ("user", "assistant")])
-            log_result(st.session_state["session_id"], False, None, msg_count, ended_by="user", ended_via="abort_button")
+            msg_count = st.session_state["history"].msg_count
+            if not log_result(st.session_state["session_id"], False, None, msg_count, ended_by="user", ended_via="abort_button"):
+                close_by_timeout()
 
             st.session_state["end_kind"] = "abort"
             st.session_state["end_price"] = None
             st.session_state["end_note"] = "Du hast die Verhandlung über den Button beendet. Jetzt folgt der kurze Abschlussfragebogen."
 
             st.session_state["closed"] = True
+            persist_state()
             st.rerun()
-
-# -----------------------------
-# Admin Bereich
-# -----------------------------
-st.sidebar.header("📊 Ergebnisse")
-
-pwd_ok = False
-dashboard_password = st.secrets.get("DASHBOARD_PASSWORD", os.environ.get("DASHBOARD_PASSWORD"))
-pwd_input = st.sidebar.text_input("Passwort für Dashboard", type="password")
-
-if dashboard_password:
-    if pwd_input and pwd_input == dashboard_password:
-        pwd_ok = True
-    elif pwd_input and pwd_input != dashboard_password:
-        st.sidebar.warning("Falsches Passwort.")
-else:
-    st.sidebar.info("Kein Passwort gesetzt (DASHBOARD_PASSWORD). Dashboard ist deaktiviert.")
-
-if pwd_ok:
-    st.sidebar.success("Zugang gewährt.")
-    
-    bot_filter = st.sidebar.selectbox(
-        "Bot-Filter",
-        options=["Alle", BOT_VARIANT],
-        index=1
-    )
-    bot_variant_for_queries = None if bot_filter == "Alle" else BOT_VARIANT
-
-    with st.sidebar.expander("📋 Umfrageergebnisse", expanded=False):
-        init_db()
-        conn = get_conn()
-        if bot_variant_for_queries:
-            df_s = pd.read_sql_query(
-                "SELECT * FROM survey WHERE bot_variant = %s ORDER BY id ASC",
-                conn,
-                params=(bot_variant_for_queries,)
-            )
-        else:
-            df_s = pd.read_sql_query("SELECT * FROM survey ORDER BY id ASC", conn)
-        conn.close()
-        
-        if df_s.empty:
-            st.info("Noch keine Umfrage-Daten vorhanden.")
-        else:
-            st.dataframe(df_s, use_container_width=True)
-
-            from io import BytesIO
-            buf = BytesIO()
-            df_s.to_excel(buf, index=False)
-            buf.seek(0)
-
-            st.download_button(
-                "Umfrage als Excel herunterladen",
-                buf,
-                file_name="survey_results_download.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-
-    with st.sidebar.expander("Alle Verhandlungsergebnisse", expanded=True):
-        df = load_results_df()
-        if bot_variant_for_queries:
-            df = df[df["bot_variant"] == bot_variant_for_queries].copy()
-
-        if len(df) == 0:
-            st.write("Noch keine Ergebnisse gespeichert.")
-        else:
-            df = df.reset_index(drop=True)
-            df["nr"] = df.index + 1
-            df = df[[
-                "nr", "ts", "participant_id", "session_id", "bot_variant", "order_id", "step",
-                "deal", "ended_by", "ended_via", "price", "msg_count"
-            ]]
-            st.dataframe(df, use_container_width=True, hide_index=True)
-
-            from io import BytesIO
-            buffer = BytesIO()
-            df.to_excel(buffer, index=False)
-            buffer.seek(0)
-
-            st.download_button(
-                "Excel herunterladen",
-                buffer,
-                file_name="verhandlungsergebnisse.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True,
-            )
-
-        st.markdown("### 📥 Chat-Export")
-        chat_txt = export_all_chats_to_txt(bot_variant=bot_variant_for_queries)
-        st.download_button(
-            label="📄 Alle Chats als TXT herunterladen",
-            data=chat_txt,
-            file_name="alle_chatverlaeufe.txt",
-            mime="text/plain",
-            use_container_width=True
-        )
-
-        st.markdown("---")
-        st.subheader("💬 Chatverlauf anzeigen")
-
-        if len(df) > 0:
-            selected_session = st.selectbox("Verhandlung auswählen", df["session_id"].unique())
-            if selected_session:
-                chat_df = load_chat_for_session(selected_session)
-                st.markdown("### 💬 Chatverlauf")
-
-                for _, row in chat_df.iterrows():
-                    is_user = row["role"] == "user"
-                    avatar_b64 = USER_AVATAR if is_user else BOT_AVATAR
-                    side = "right" if is_user else "left"
-                    klass = "msg-user" if is_user else "msg-bot"
-
-                    st.markdown(f"""
-                    <div class="row {side}">
-                        <img src="data:image/png;base64,{avatar_b64}" class="avatar">
-                        <div class="chat-bubble {klass}">
-                            {row["text"]}
-                        </div>
-                    </div>
-                    <div class="row {side}">
-                        <div class="meta">{row["ts"]}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-    st.sidebar.markdown("---")
-    st.sidebar.subheader("Admin-Tools")
-
-    if "confirm_delete" not in st.session_state:
-        st.session_state["confirm_delete"] = False
-
-    if not st.session_state["confirm_delete"]:
-        if st.sidebar.button("🗑️ Ergebnisse löschen (Bestätigung)"):
-            st.session_state["confirm_delete"] = True
-            st.experimental_rerun()
-    else:
-        c1, c2 = st.sidebar.columns(2)
-        with c1:
-            if st.button("❌ Abbrechen"):
-                st.session_state["confirm_delete"] = False
-                st.experimental_rerun()
-        with c2:
-            if st.button("✅ Ja, wirklich löschen"):
-                init_db()
-                conn = get_conn()
-                cur = conn.cursor()
-                cur.execute("DELETE FROM results")
-                cur.execute("DELETE FROM chat_messages")
-                cur.execute("DELETE FROM survey")
-                conn.commit()
-                conn.close()
-                st.session_state["confirm_delete"] = False
-                st.sidebar.success("Alle Ergebnisse wurden gelöscht.")
-                st.experimental_rerun()
@@ -0,0 +1,105 @@
+# ============================================
+# conversation.py – kompakter Chat-Verlauf + Verhandlungszustand
+# ============================================
+#
+# Conversation ersetzt die Liste von Dicts in st.session_state["history"]:
+# - Nachrichten als Slot-Objekte (kein Dict pro Nachricht)
+# - Zähler für user/assistant werden beim Anhängen gepflegt (kein Scan pro Turn)
+# - die LLM-Sicht ({"role", "content"}) wird inkrementell mitgeführt
+#
+# Dazu die Liste der Session-State-Keys, die den Verhandlungszustand ausmachen;
+# snapshot_state/restore_state machen daraus ein JSON-fähiges Dict, das in
+# negotiation_state gespeichert wird und nach einem Reconnect zurückgespielt wird.
+
+import random
+from datetime import datetime
+
+
+class Message:
+    __slots__ = ("role", "text", "ts")
+
+    def __init__(self, role: str, text: str, ts: datetime):
+        self.role = role
+        self.text = text
+        self.ts = ts
+
+
+class Conversation:
+    __slots__ = ("messages", "n_user", "n_assistant", "_llm_view")
+
+    def __init__(self):
+        self.messages: list[Message] = []
+        self.n_user = 0
+        self.n_assistant = 0
+        self._llm_view: list[dict] = []
+
+    def append(self, role: str, text: str, ts: datetime) -> int:
+        """Hängt eine Nachricht an und liefert ihren msg_index."""
+        self.messages.append(Message(role, text, ts))
+        self._llm_view.append({"role": role, "content": text})
+        if role == "user":
+            self.n_user += 1
+        elif role == "assistant":
+            self.n_assistant += 1
+        return len(self.messages) - 1
+
+    @property
+    def msg_count(self) -> int:
+        return self.n_user + self.n_assistant
+
+    def llm_messages(self) -> list[dict]:
+        # Aufrufer bauen neue Listen ([instruct] + ...), die Sicht selbst wird nicht verändert
+        return self._llm_view
+
+    def last(self) -> Message | None:
+        return self.messages[-1] if self.messages else None
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    @classmethod
+    def from_rows(cls, rows) -> "Conversation":
+        """rows: (role, text, ts) in msg_index-Reihenfolge, z. B. aus chat_messages."""
+        conv = cls()
+        for role, text, ts in rows:
+            conv.append(role, text, ts)
+        return conv
+
+
+# Session-State-Keys, die nach einem Reconnect wiederhergestellt werden
+NEGOTIATION_STATE_KEYS = [
+    "bot_variant",
+    "agreed_price", "closed", "bot_offer", "last_bot_offer", "final_bot_price",
+    "end_kind", "end_note", "end_price",
+    "repeat_offer_count", "small_step_count", "last_user_price", "warning_given",
+    "survey_done",
+]
+
+
+def snapshot_state(session_state, with_messages: bool = False) -> dict:
+    state = {k: session_state.get(k) for k in NEGOTIATION_STATE_KEYS}
+    if with_messages:
+        # geteilter Zustand (state_store): Verlauf im Snapshot, chat_messages wird asynchron geschrieben
+        state["messages"] = [[m.role, m.text, m.ts.isoformat()] for m in session_state["history"]]
+    rng = session_state.get("rng")
+    if rng is not None:
+        version, internal, gauss = rng.getstate()
+        state["rng_state"] = [version, list(internal), gauss]
+    return state
+
+
+def restore_state(session_state, state: dict):
+    for k in NEGOTIATION_STATE_KEYS:
+        if k in state:
+            session_state[k] = state[k]
+    if "messages" in state:
+        session_state["history"] = Conversation.from_rows(
+            (role, text, datetime.fromisoformat(ts)) for role, text, ts in state["messages"])
+    if state.get("rng_state"):
+        version, internal, gauss = state["rng_state"]
+        rng = random.Random()
+        rng.setstate((version, tuple(internal), gauss))
+        session_state["rng"] = rng
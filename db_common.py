@@ -1,28 +1,188 @@
 # db_common.py
+import re
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 import streamlit as st
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2 import sql
+
+from variants import VARIANTS
+
+# Ein Writer-Thread pro Prozess: Inserts, auf die der Participant nicht warten
+# muss (Chat-Log), laufen hier in Reihenfolge ab, ohne den Script-Run zu blockieren.
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+# Verbindungs-Pool pro DATABASE_URL: kein neuer TCP/TLS-Aufbau + Login pro Query.
+# get_conn() liefert weiterhin ein Objekt mit cursor()/commit()/close(); close()
+# gibt die Verbindung an den Pool zurück. Ist der Pool voll, gibt es eine
+# normale Einzelverbindung (wird bei close() wirklich geschlossen).
+_POOLS: dict[str, pg_pool.ThreadedConnectionPool] = {}
+_POOL_LOCK = threading.Lock()
+_LAST_USED: dict[int, float] = {}
+# nach so langer Ruhe erst "SELECT 1" (Server/Proxy kann Idle-Verbindungen gekappt haben)
+_PING_AFTER_S = 60.0
+
+# Studie/Welle: jede Zeile trägt study_id (Secret STUDY_ID). Die großen
+# Log-Tabellen sind nach study_id partitioniert (LIST), eine Partition pro
+# Studie; Löschen einer Studie = Partition droppen statt DELETE über alles.
+_STUDY_ID_RE = re.compile(r"^[a-z0-9_]{1,40}$")
+PARTITIONED_TABLES = ["chat_messages", "llm_calls", "negotiation_events"]
+STUDY_TABLES = ["assignments", "sessions", "results", "survey", "negotiation_state"]
+# Zeitstempel-Spalten mit Index (study_id, Spalte) für Zeitfenster-Abfragen
+TIME_COLUMNS = [
+    ("sessions", "started_ts"), ("results", "ts"), ("survey", "survey_ts_utc"),
+    ("chat_messages", "ts"), ("llm_calls", "ts"), ("negotiation_events", "ts"),
+]
+
+def current_study() -> str:
+    study = str(st.secrets.get("STUDY_ID", "default")).strip().lower()
+    if not _STUDY_ID_RE.match(study):
+        raise ValueError(f"STUDY_ID {study!r} ungültig: nur a-z, 0-9 und _ (max. 40 Zeichen).")
+    return study
+
+def utc_now() -> datetime:
+    """Zeitstempel für TIMESTAMPTZ-Spalten (Anzeige-Format erst beim Rendern)."""
+    return datetime.now(timezone.utc)
+
+def study_partition(table: str, study_id: str) -> str:
+    if not _STUDY_ID_RE.match(study_id):
+        raise ValueError(f"Ungültige study_id: {study_id!r}")
+    return f"{table}__{study_id}"
+
+# init_db (DDL) nur einmal pro Prozess und DATABASE_URL
+_SCHEMA_READY: set[str] = set()
+_SCHEMA_LOCK = threading.Lock()
+
+
+class _PooledConnection:
+    __slots__ = ("_conn", "_pool")
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._pool is None:
+            conn.close()
+            return
+        try:
+            if not conn.closed:
+                conn.rollback()  # offene Lese-Transaktion beenden
+        except psycopg2.Error:
+            conn.close()
+        _LAST_USED[id(conn)] = time.monotonic()
+        self._pool.putconn(conn, close=bool(conn.closed))
+
+
+def _get_pool(dsn: str) -> pg_pool.ThreadedConnectionPool:
+    p = _POOLS.get(dsn)
+    if p is None:
+        with _POOL_LOCK:
+            p = _POOLS.get(dsn)
+            if p is None:
+                p = pg_pool.ThreadedConnectionPool(
+                    int(st.secrets.get("DB_POOL_MIN", 1)),
+                    int(st.secrets.get("DB_POOL_MAX", 10)),
+                    dsn,
+                )
+                _POOLS[dsn] = p
+    return p
+
+
+def _is_alive(conn) -> bool:
+    if conn.closed:
+        return False
+    last = _LAST_USED.get(id(conn))
+    if last is None or time.monotonic() - last < _PING_AFTER_S:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_conn(dsn: str | None = None):
+    # dsn explizit: Hintergrund-Threads, die st.secrets nicht selbst lesen (session_reaper.py)
+    dsn = dsn or st.secrets["DATABASE_URL"]
+    p = _get_pool(dsn)
+    for _ in range(2):
+        try:
+            conn = p.getconn()
+        except pg_pool.PoolError:
+            return _PooledConnection(psycopg2.connect(dsn), None)
+        if _is_alive(conn):
+            return _PooledConnection(conn, p)
+        p.putconn(conn, close=True)
+    return _PooledConnection(psycopg2.connect(dsn), None)
+
+
+def prewarm_pool():
+    """Öffnet DB_POOL_MIN Verbindungen und legt das Schema an (Warmup beim Start)."""
+    init_db()
+    conns = [get_conn() for _ in range(int(st.secrets.get("DB_POOL_MIN", 1)))]
+    for conn in conns:
+        conn.close()
+
+def _report_write_error(future):
+    exc = future.exception()
+    if exc is not None:
+        print("DB-Write im Hintergrund fehlgeschlagen:", file=sys.stderr)
+        traceback.print_exception(type(exc), exc, exc.__traceback__, file=sys.stderr)
+
+def run_async(fn, *args, **kwargs):
+    future = _WRITER.submit(fn, *args, **kwargs)
+    future.add_done_callback(_report_write_error)
+    return future
 
-def get_conn():
-    return psycopg2.connect(st.secrets["DATABASE_URL"])
+def flush_writes(timeout: float = 30.0):
+    """Wartet, bis alle bisher eingereihten Hintergrund-Writes durch sind (Writer läuft in Reihenfolge)."""
+    _WRITER.submit(lambda: None).result(timeout=timeout)
 
-def init_db():
-    conn = get_conn()
+def init_db(dsn: str | None = None):
+    dsn = dsn or st.secrets["DATABASE_URL"]
+    if dsn in _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if dsn not in _SCHEMA_READY:
+            _create_schema(dsn)
+            _SCHEMA_READY.add(dsn)
+
+def _create_schema(dsn: str):
+    conn = get_conn(dsn)
     cur = conn.cursor()
 
     # 1) Assignment (Reihenfolge AB/BA)
     cur.execute("""
         CREATE TABLE IF NOT EXISTS assignments (
-            pid TEXT PRIMARY KEY,
+            study_id TEXT NOT NULL,
+            pid TEXT NOT NULL,
             order_code TEXT NOT NULL,
-            created_ts TEXT NOT NULL
+            created_ts TIMESTAMPTZ(3) NOT NULL,
+            PRIMARY KEY (study_id, pid)
         )
     """)
+    _to_timestamptz(cur, "assignments", "created_ts", ISO_UTC)
 
     # 2) Verhandlungsergebnisse
     cur.execute("""
         CREATE TABLE IF NOT EXISTS results (
             id BIGSERIAL PRIMARY KEY,
-            ts TEXT,
+            ts TIMESTAMPTZ(3),
             session_id TEXT,
             participant_id TEXT,
             bot_variant TEXT,
@@ -35,26 +195,45 @@ def init_db():
             ended_via TEXT
         )
     """)
+    _to_timestamptz(cur, "results", "ts", ISO_UTC)
 
-    # 3) Chatverläufe (optional fürs Admin-Dashboard)
+    # 3a) Sessions: eine Zeile pro Verhandlung, beim Schreiben gepflegt
+    #     (Start bei der Begrüßung, msg_count pro Nachricht, Ende mit dem Ergebnis)
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id BIGSERIAL PRIMARY KEY,
-            session_id TEXT,
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
             participant_id TEXT,
             bot_variant TEXT,
-            role TEXT,
-            text TEXT,
-            ts TEXT,
-            msg_index INTEGER
+            order_id TEXT,
+            step TEXT,
+            started_ts TIMESTAMPTZ(3),
+            ended_ts TIMESTAMPTZ(3),
+            outcome TEXT,
+            price INTEGER,
+            ended_by TEXT,
+            ended_via TEXT,
+            msg_count INTEGER NOT NULL DEFAULT 0
         )
     """)
+    _to_timestamptz(cur, "sessions", "started_ts", ISO_UTC)
+    _to_timestamptz(cur, "sessions", "ended_ts", ISO_UTC)
+    # Heartbeat (session_reaper.py): zuletzt gesehen, für Idle-Timeout über alle Replicas
+    cur.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS last_seen_ts TIMESTAMPTZ(3)")
+    cur.execute("CREATE INDEX IF NOT EXISTS sessions_participant_idx ON sessions (participant_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS sessions_variant_idx ON sessions (bot_variant, started_ts)")
+
+    # 3b) Chatverläufe; Participant/Variante stehen in sessions
+    cur.execute(_CHAT_MESSAGES_DDL)
+    _to_timestamptz(cur, "chat_messages", "ts", BERLIN_DISPLAY)
+    _migrate_chat_messages_to_sessions(cur)
+    _partition_by_study(cur, "chat_messages", _CHAT_MESSAGES_DDL)
+    cur.execute("CREATE INDEX IF NOT EXISTS chat_messages_session_idx ON chat_messages (session_id, msg_index)")
 
     # 4) Surveys (wichtig fürs “Gate” und fürs Scoreboard)
     cur.execute("""
         CREATE TABLE IF NOT EXISTS survey (
             id BIGSERIAL PRIMARY KEY,
-            survey_ts_utc TEXT,
+            survey_ts_utc TIMESTAMPTZ(3),
             participant_id TEXT,
             session_id TEXT,
             bot_variant TEXT,
@@ -76,6 +255,342 @@ def init_db():
             again TEXT
         )
     """)
+    _to_timestamptz(cur, "survey", "survey_ts_utc", ISO_UTC)
+
+    # 5) LLM-Aufrufe (Tokens, Latenz, Retries des Preis-Guards)
+    cur.execute(_LLM_CALLS_DDL)
+    _to_timestamptz(cur, "llm_calls", "ts", ISO_UTC)
+    # strukturierte Antworten: Absicht + deklarierte Preise (kommagetrennt)
+    cur.execute("ALTER TABLE llm_calls ADD COLUMN IF NOT EXISTS intent TEXT")
+    cur.execute("ALTER TABLE llm_calls ADD COLUMN IF NOT EXISTS declared_prices TEXT")
+    # Prompt-Cache-Treffer laut usage.prompt_tokens_details.cached_tokens
+    cur.execute("ALTER TABLE llm_calls ADD COLUMN IF NOT EXISTS cached_tokens INTEGER")
+    _partition_by_study(cur, "llm_calls", _LLM_CALLS_DDL)
+
+    # 6) Verhandlungszustand pro Session (für Fortsetzen nach Reconnect)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS negotiation_state (
+            session_id TEXT PRIMARY KEY,
+            participant_id TEXT,
+            state JSONB NOT NULL,
+            updated_ts TIMESTAMPTZ(3)
+        )
+    """)
+    _to_timestamptz(cur, "negotiation_state", "updated_ts", ISO_UTC)
+    # Schritt pro Snapshot: Fortsetzen ohne ?sid über (Studie, Participant, Schritt), siehe state_store.py
+    cur.execute("ALTER TABLE negotiation_state ADD COLUMN IF NOT EXISTS step TEXT")
+
+    # 7) Entscheidungen der Preislogik pro Turn (Preis, Zweig, Gegenangebot, Abbruch/Warnung)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS negotiation_events (
+            id BIGSERIAL,
+            study_id TEXT NOT NULL,
+            ts TIMESTAMPTZ(3),
+            session_id TEXT,
+            turn_index INTEGER,
+            msg_index INTEGER,
+            decision TEXT,
+            branch TEXT,
+            user_price INTEGER,
+            last_bot_offer INTEGER,
+            raw_counter INTEGER,
+            counter INTEGER,
+            snap_to_user INTEGER,
+            deal_price INTEGER,
+            PRIMARY KEY (study_id, id)
+        ) PARTITION BY LIST (study_id)
+    """)
+    _to_timestamptz(cur, "negotiation_events", "ts", ISO_UTC)
+    cur.execute("CREATE INDEX IF NOT EXISTS negotiation_events_session_idx ON negotiation_events (session_id, turn_index)")
+
+    # 8) Studie/Welle: Spalte + Index für die kleinen Tabellen, Partitionen für die Logs
+    study = current_study()
+    for table in STUDY_TABLES:
+        cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS study_id TEXT").format(sql.Identifier(table)))
+        # Altbestand gehört zur Studie der Instanz, die migriert
+        cur.execute(sql.SQL("UPDATE {} SET study_id = %s WHERE study_id IS NULL").format(sql.Identifier(table)), (study,))
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (study_id)").format(
+            sql.Identifier(f"{table}_study_idx"), sql.Identifier(table)))
+    # Zuordnung pro Studie: dieselbe pid darf in mehreren Studien vorkommen
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'assignments'::regclass AND contype = 'p'
+    """)
+    pk = cur.fetchone()
+    if pk is not None and pk[1] == "PRIMARY KEY (pid)":
+        cur.execute("ALTER TABLE assignments ALTER COLUMN study_id SET NOT NULL")
+        cur.execute(sql.SQL("ALTER TABLE assignments DROP CONSTRAINT {}").format(sql.Identifier(pk[0])))
+        cur.execute("ALTER TABLE assignments ADD PRIMARY KEY (study_id, pid)")
+    # Zeitfenster ("letzte 2 Stunden") im Admin laufen über diese Indizes
+    for table, column in TIME_COLUMNS:
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (study_id, {})").format(
+            sql.Identifier(f"{table}_{column}_idx"), sql.Identifier(table), sql.Identifier(column)))
+    # Scoreboard: sortierte Deal-Preise pro Studie + Variante direkt aus dem Index
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS sessions_scoreboard_idx ON sessions (study_id, bot_variant, price)
+        WHERE outcome = 'deal'
+    """)
+    # Idle-Timeout: nur offene Sessions, nach zuletzt gesehen
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS sessions_open_idx ON sessions (study_id, last_seen_ts)
+        WHERE outcome IS NULL
+    """)
+    # Fortsetzen ohne ?sid: letzte Session pro Participant + Schritt
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS negotiation_state_progress_idx
+        ON negotiation_state (study_id, participant_id, step, updated_ts)
+    """)
+    ensure_study_partitions(cur, study)
+
+    # 9) Paired-Datensatz (eine Zeile pro Participant, beide Bedingungen nebeneinander)
+    for table in ("results", "survey"):
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (study_id, participant_id, bot_variant, id)").format(
+            sql.Identifier(f"{table}_paired_idx"), sql.Identifier(table)))
+    cur.execute("DROP VIEW IF EXISTS paired_dataset")
+    cur.execute(_paired_view_sql())
 
     conn.commit()
     conn.close()
+
+
+_CHAT_MESSAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id BIGSERIAL,
+        study_id TEXT NOT NULL,
+        session_id TEXT REFERENCES sessions (session_id) ON DELETE CASCADE,
+        role TEXT,
+        text TEXT,
+        ts TIMESTAMPTZ(3),
+        msg_index INTEGER,
+        PRIMARY KEY (study_id, id)
+    ) PARTITION BY LIST (study_id)
+"""
+
+_LLM_CALLS_DDL = """
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id BIGSERIAL,
+        study_id TEXT NOT NULL,
+        ts TIMESTAMPTZ(3),
+        session_id TEXT,
+        participant_id TEXT,
+        bot_variant TEXT,
+        model TEXT,
+        turn_index INTEGER,
+        attempt INTEGER,
+        status TEXT,
+        violation TEXT,
+        accepted INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        cached_tokens INTEGER,
+        latency_ms INTEGER,
+        intent TEXT,
+        declared_prices TEXT,
+        PRIMARY KEY (study_id, id)
+    ) PARTITION BY LIST (study_id)
+"""
+
+
+# Spalten pro Bedingung im Paired-Datensatz (Präfix = Variante, z. B. power_price)
+PAIRED_RESULT_COLUMNS = ["session_id", "step", "deal", "price", "msg_count", "ended_by", "ended_via", "ts"]
+PAIRED_SURVEY_COLUMNS = [
+    "satisfaction_outcome", "satisfaction_process", "fairness", "better_result",
+    "deviation", "willingness", "again", "survey_ts_utc",
+]
+PAIRED_DEMOGRAPHICS = ["age", "gender", "education", "field", "field_other"]
+
+
+def _paired_view_sql() -> sql.Composed:
+    """View paired_dataset: pro (study_id, participant_id) das letzte Ergebnis + der letzte
+    Fragebogen je Variante, jeweils per LATERAL über (study_id, participant_id, bot_variant, id).
+
+    Ein WHERE study_id = ... auf die View wird bis in die Index-Scans durchgereicht.
+    """
+    columns = [sql.SQL("p.study_id"), sql.SQL("p.participant_id"),
+               sql.SQL("COALESCE({}) AS order_id").format(
+                   sql.SQL(", ").join(sql.SQL("{}.order_id").format(sql.Identifier(f"r_{v}")) for v in VARIANTS))]
+    columns += [sql.SQL("d.{}").format(sql.Identifier(c)) for c in PAIRED_DEMOGRAPHICS]
+    joins = []
+    for v in VARIANTS:
+        r, s = sql.Identifier(f"r_{v}"), sql.Identifier(f"s_{v}")
+        columns += [sql.SQL("{}.{} AS {}").format(r, sql.Identifier(c), sql.Identifier(f"{v}_{c}"))
+                    for c in PAIRED_RESULT_COLUMNS]
+        columns += [sql.SQL("{}.{} AS {}").format(s, sql.Identifier(c), sql.Identifier(f"{v}_{c}"))
+                    for c in PAIRED_SURVEY_COLUMNS]
+        for table, alias in (("results", r), ("survey", s)):
+            joins.append(sql.SQL("""
+                LEFT JOIN LATERAL (
+                    SELECT * FROM {table} t
+                    WHERE t.study_id = p.study_id AND t.participant_id = p.participant_id AND t.bot_variant = {variant}
+                    ORDER BY t.id DESC LIMIT 1
+                ) {alias} ON true""").format(table=sql.Identifier(table), variant=sql.Literal(v), alias=alias))
+    complete = sql.SQL(" AND ").join(
+        sql.SQL("{}.id IS NOT NULL").format(sql.Identifier(f"{prefix}_{v}")) for v in VARIANTS for prefix in ("r", "s"))
+    columns.append(sql.SQL("({}) AS complete").format(complete))
+
+    return sql.SQL("""
+        CREATE VIEW paired_dataset AS
+        SELECT {columns}
+        FROM (
+            SELECT study_id, participant_id FROM results WHERE participant_id IS NOT NULL
+            UNION
+            SELECT study_id, participant_id FROM survey WHERE participant_id IS NOT NULL
+        ) p
+        LEFT JOIN LATERAL (
+            SELECT {demographics} FROM survey t
+            WHERE t.study_id = p.study_id AND t.participant_id = p.participant_id
+            ORDER BY t.step, t.id LIMIT 1
+        ) d ON true
+        {joins}
+    """).format(
+        columns=sql.SQL(",\n            ").join(columns),
+        demographics=sql.SQL(", ").join(map(sql.Identifier, PAIRED_DEMOGRAPHICS)),
+        joins=sql.SQL("").join(joins),
+    )
+
+
+def _ensure_partition(cur, table: str, study_id: str):
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})").format(
+        sql.Identifier(study_partition(table, study_id)), sql.Identifier(table), sql.Literal(study_id)))
+
+
+def ensure_study_partitions(cur, study_id: str):
+    for table in PARTITIONED_TABLES:
+        _ensure_partition(cur, table, study_id)
+
+
+def _partition_by_study(cur, table: str, ddl: str):
+    """Bestehende, nicht partitionierte Tabelle in die partitionierte Form umziehen.
+
+    Alte Zeilen landen in der Partition der aktuellen Studie; ids bleiben erhalten.
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    if row is None or row[0] != "r":
+        return
+
+    legacy = f"{table}_unpartitioned"
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(legacy)))
+    # Index-/PK-Namen freimachen, sonst kollidieren sie mit der neuen Tabelle
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s", (legacy,))
+    for (index_name,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+            sql.Identifier(index_name), sql.Identifier(f"{index_name}_unpartitioned"[:63])))
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (legacy,))
+    seq = cur.fetchone()[0]
+    if seq:
+        cur.execute(sql.SQL("ALTER SEQUENCE {} RENAME TO {}").format(
+            sql.SQL(seq), sql.Identifier(f"{table}_id_seq_unpartitioned")))
+
+    # FKs der alten Tabelle entfernen, damit die neue die Standardnamen bekommt
+    cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'", (legacy,))
+    for (constraint,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(sql.Identifier(legacy), sql.Identifier(constraint)))
+
+    cur.execute(ddl)
+    study = current_study()
+    _ensure_partition(cur, table, study)
+
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name <> 'study_id'
+        ORDER BY ordinal_position
+    """, (legacy,))
+    columns = [sql.Identifier(c) for (c,) in cur.fetchall()]
+    cur.execute(sql.SQL("INSERT INTO {} (study_id, {}) SELECT %s, {} FROM {}").format(
+        sql.Identifier(table), sql.SQL(", ").join(columns), sql.SQL(", ").join(columns), sql.Identifier(legacy)),
+        (study,))
+    cur.execute(sql.SQL("SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {}").format(
+        sql.Identifier(table)), (table,))
+    cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(legacy)))
+
+
+# Altbestand: Zeitstempel als Text
+ISO_UTC = r"""CASE WHEN {col} ~ '^\d{{4}}-\d{{2}}-\d{{2}}[T ]\d{{2}}:\d{{2}}'
+    THEN {col}::timestamp AT TIME ZONE 'UTC' END"""  # datetime.utcnow().isoformat()
+BERLIN_DISPLAY = r"""CASE WHEN {col} ~ '^\d{{2}}\.\d{{2}}\.\d{{4}} \d{{2}}:\d{{2}}$'
+    THEN to_timestamp({col}, 'DD.MM.YYYY HH24:MI')::timestamp AT TIME ZONE 'Europe/Berlin' END"""  # Anzeige-String
+
+
+def _to_timestamptz(cur, table: str, column: str, parse: str):
+    """TEXT-Spalte in TIMESTAMPTZ(3) umwandeln; nicht parsbare Werte werden NULL."""
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    row = cur.fetchone()
+    if row is None or row[0] != "text":
+        return
+    col = sql.Identifier(column)
+    cur.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE TIMESTAMPTZ(3) USING " + parse).format(
+        sql.Identifier(table), col, col=col))
+
+
+def _has_column(cur, table: str, column: str) -> bool:
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cur.fetchone() is not None
+
+def _migrate_chat_messages_to_sessions(cur):
+    """Alte chat_messages (mit participant_id/bot_variant pro Zeile) -> sessions + schlanke Zeilen.
+
+    Läuft nur, solange chat_messages noch participant_id hat; alles in der
+    Transaktion von init_db.
+    """
+    if not _has_column(cur, "chat_messages", "participant_id"):
+        return
+
+    # Start = früheste Nachricht (ts ist zu diesem Zeitpunkt schon timestamptz)
+    cur.execute("""
+        INSERT INTO sessions (session_id, participant_id, bot_variant, started_ts, msg_count)
+        SELECT
+            session_id,
+            MAX(participant_id),
+            MAX(bot_variant),
+            MIN(ts),
+            MAX(msg_index) + 1
+        FROM chat_messages
+        WHERE session_id IS NOT NULL
+        GROUP BY session_id
+        ON CONFLICT (session_id) DO NOTHING
+    """)
+    cur.execute("DELETE FROM chat_messages WHERE session_id IS NULL")
+
+    # Sessions nur mit Ergebnis (ohne geloggte Nachrichten)
+    cur.execute("""
+        INSERT INTO sessions (session_id, participant_id, bot_variant)
+        SELECT DISTINCT session_id, participant_id, bot_variant
+        FROM results
+        WHERE session_id IS NOT NULL
+        ON CONFLICT (session_id) DO NOTHING
+    """)
+    # Ende/Ergebnis: jeweils das letzte Ergebnis der Session
+    cur.execute("""
+        UPDATE sessions s SET
+            order_id = r.order_id,
+            step = r.step,
+            ended_ts = r.ts,
+            outcome = CASE WHEN r.deal = 1 THEN 'deal' ELSE 'abort' END,
+            price = r.price,
+            ended_by = r.ended_by,
+            ended_via = r.ended_via,
+            msg_count = GREATEST(s.msg_count, COALESCE(r.msg_count, 0))
+        FROM (
+            SELECT DISTINCT ON (session_id) *
+            FROM results
+            WHERE session_id IS NOT NULL
+            ORDER BY session_id, id DESC
+        ) r
+        WHERE r.session_id = s.session_id
+    """)
+
+    cur.execute("ALTER TABLE chat_messages DROP COLUMN participant_id")
+    cur.execute("ALTER TABLE chat_messages DROP COLUMN IF EXISTS bot_variant")
+    cur.execute("""
+        ALTER TABLE chat_messages
+        ADD CONSTRAINT chat_messages_session_id_fkey
+        FOREIGN KEY (session_id) REFERENCES sessions (session_id) ON DELETE CASCADE
+    """)
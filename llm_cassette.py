@@ -0,0 +1,93 @@
+# ============================================
+# llm_cassette.py – LLM-Antworten aufzeichnen / offline abspielen
+# ============================================
+#
+# Modi (st.secrets["LLM_CASSETTE_MODE"]):
+#   "off"    – kein Eingriff (Standard)
+#   "record" – jeder erfolgreiche API-Call wird in die Cassette geschrieben
+#   "replay" – Antworten kommen ausschließlich aus der Cassette, kein Netzwerk
+#
+# Die Cassette ist eine JSONL-Datei (eine Zeile pro Aufruf). Gematcht wird auf
+# die normalisierten Nachrichten (Rolle + Text mit zusammengefasstem Whitespace),
+# damit kleine Formatierungsunterschiede im Prompt keinen Miss erzeugen.
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+CASSETTE_MODES = ("off", "record", "replay")
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_messages(messages) -> list[dict]:
+    return [
+        {"role": m.get("role"), "content": _WS_RE.sub(" ", m.get("content") or "").strip()}
+        for m in messages
+    ]
+
+
+def fingerprint(messages) -> str:
+    blob = json.dumps(normalize_messages(messages), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Fingerprint -> aufgezeichnete Antworten.
+
+    Kommt derselbe Fingerprint mehrfach vor (z. B. identischer Retry), werden die
+    Aufnahmen in Reihenfolge ausgespielt; danach bleibt die letzte stehen.
+    """
+
+    def __init__(self, path: str, mode: str = "off"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unbekannter Cassette-Modus: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[dict]] = {}
+        self._cursor: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        if mode == "replay" or (mode == "record" and os.path.exists(path)):
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self._entries.setdefault(entry["fingerprint"], []).append(entry["response"])
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def lookup(self, messages) -> dict | None:
+        fp = fingerprint(messages)
+        with self._lock:
+            recorded = self._entries.get(fp)
+            if not recorded:
+                self.misses += 1
+                return None
+            i = self._cursor.get(fp, 0)
+            self._cursor[fp] = i + 1
+            self.hits += 1
+            return dict(recorded[min(i, len(recorded) - 1)])
+
+    def record(self, messages, response: dict):
+        fp = fingerprint(messages)
+        entry = {
+            "fingerprint": fp,
+            "messages": normalize_messages(messages),
+            "response": response,
+        }
+        with self._lock:
+            self._entries.setdefault(fp, []).append(response)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,257 @@
+# ============================================
+# llm_providers.py – austauschbare LLM-Backends
+# ============================================
+#
+# Auswahl per st.secrets["LLM_PROVIDER"]:
+#   "openai"            – api.openai.com (OPENAI_API_KEY, OPENAI_MODEL)
+#   "openai_compatible" – beliebiger Server mit /v1/chat/completions, z. B. llama.cpp
+#                         oder vLLM auf localhost (LLM_BASE_URL, LLM_MODEL, LLM_API_KEY optional)
+#   "template"          – deterministische Antworten aus den Preis-Anweisungen, ohne Netzwerk
+#
+# Alle Backends liefern dasselbe Ergebnis-Dict:
+#   content, model, status, error, prompt_tokens, completion_tokens, total_tokens, latency_ms,
+#   cached_tokens (aus dem Provider-Prompt-Cache bediente Prompt-Tokens, falls gemeldet)
+# "content" ist None, wenn der Aufruf fehlgeschlagen ist; "status" sagt warum.
+#
+# response_format (optional) wird im OpenAI-Format durchgereicht, z. B.
+# {"type": "json_schema", "json_schema": {...}} für strukturierte Antworten.
+
+import json
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import requests
+
+
+def empty_result(model: str | None) -> dict:
+    return {
+        "content": None,
+        "model": model,
+        "status": "ok",
+        "error": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "total_tokens": None,
+        "cached_tokens": None,
+        "latency_ms": None,
+    }
+
+
+class LLMProvider:
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def complete(self, messages, temperature: float = 0.3, max_tokens: int = 240, response_format: dict | None = None) -> dict:
+        raise NotImplementedError
+
+    def warmup(self):
+        """Verbindung vorab aufbauen (Cold Start); Standard: nichts zu tun."""
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Chat-Completions über HTTP; eine Session pro Prozess (Keep-Alive, kein neuer TLS-Handshake pro Turn)."""
+
+    name = "openai_compatible"
+
+    def __init__(self, model: str, base_url: str, api_key: str | None = None, timeout: float = 60):
+        super().__init__(model)
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def warmup(self):
+        # leichter GET: DNS + TCP + TLS stehen danach im Keep-Alive-Pool der Session
+        self.session.get(self.url.rsplit("/chat/completions", 1)[0] + "/models", timeout=min(self.timeout, 10))
+
+    def complete(self, messages, temperature: float = 0.3, max_tokens: int = 240, response_format: dict | None = None) -> dict:
+        result = empty_result(self.model)
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if response_format is not None:
+            payload["response_format"] = response_format
+
+        t0 = time.perf_counter()
+        try:
+            r = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            result["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+            result["status"] = "network_error"
+            result["error"] = f"Netzwerkfehler zur LLM-API ({self.name}): {e}"
+            return result
+        result["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+
+        try:
+            data = r.json()
+        except Exception:
+            data = None
+
+        if r.status_code != 200:
+            err_msg = None
+            err_type = None
+            if isinstance(data, dict):
+                err = data.get("error") or {}
+                if isinstance(err, dict):
+                    err_msg = err.get("message")
+                    err_type = err.get("type")
+            result["status"] = f"http_{r.status_code}"
+            result["error"] = (
+                f"LLM-API-Fehler {r.status_code}"
+                f"{' ('+err_type+')' if err_type else ''}"
+                f": {err_msg or (r.text[:500] if r.text else '')}"
+            )
+            return result
+
+        usage = (data.get("usage") if isinstance(data, dict) else None) or {}
+        result["prompt_tokens"] = usage.get("prompt_tokens")
+        result["completion_tokens"] = usage.get("completion_tokens")
+        result["total_tokens"] = usage.get("total_tokens")
+        details = usage.get("prompt_tokens_details") or {}
+        if isinstance(details, dict):
+            result["cached_tokens"] = details.get("cached_tokens")
+        if isinstance(data, dict) and data.get("model"):
+            result["model"] = data["model"]
+
+        try:
+            result["content"] = data["choices"][0]["message"]["content"]
+        except Exception:
+            result["status"] = "bad_format"
+            result["error"] = "Antwortformat unerwartet. Rohdaten: " + (r.text or "")[:1000]
+        return result
+
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    name = "openai"
+
+    def __init__(self, model: str, api_key: str, timeout: float = 60):
+        super().__init__(model, "https://api.openai.com/v1", api_key=api_key, timeout=timeout)
+
+
+class TemplateProvider(LLMProvider):
+    """Deterministische Antworten ohne Modell.
+
+    Liest die letzte Anweisung der Preislogik (System-Nachricht) und formuliert
+    daraus eine feste Antwort. Gedacht für Offline-Tests und Lasttests der
+    Turn-Pipeline, nicht für echte Teilnehmende.
+    """
+
+    name = "template"
+
+    ACCEPT_RE = re.compile(r"Nimm das Angebot an.*?GENAU (\d{2,5}) €", re.DOTALL)
+    COUNTER_RE = re.compile(r"Gegenangebot:? (\d{2,5}) €")
+    REJECT_RE = re.compile(r"Lehne .*?ab", re.DOTALL)
+
+    DEFAULT_PHRASES = {
+        "accept": "Einverstanden, {price} € passt für mich. Vielen Dank für die angenehme Verhandlung!",
+        "counter": "Danke für dein Angebot. Ich kann dir {price} € anbieten. Das iPad ist neu und der Apple Pencil ist inklusive.",
+        "reject": "Danke für dein Angebot, aber das ist mir leider zu niedrig. Magst du mir ein realistischeres Angebot machen?",
+        "ask": "Danke für deine Nachricht. Welchen konkreten Preis in € möchtest du mir anbieten?",
+    }
+
+    def __init__(self, model: str = "template", phrases: dict | None = None):
+        super().__init__(model)
+        self.phrases = phrases or self.DEFAULT_PHRASES
+
+    def complete(self, messages, temperature: float = 0.3, max_tokens: int = 240, response_format: dict | None = None) -> dict:
+        result = empty_result(self.model)
+        result["latency_ms"] = 0
+
+        instruction = " ".join(m["content"] for m in messages if m.get("role") == "system")
+        m_accept = self.ACCEPT_RE.search(instruction)
+        m_counter = self.COUNTER_RE.search(instruction)
+
+        if m_accept:
+            prices, intent = [int(m_accept.group(1))], "accept"
+        elif m_counter:
+            prices, intent = [int(m_counter.group(1))], "counter"
+        elif self.REJECT_RE.search(instruction):
+            prices, intent = [], "reject"
+        else:
+            prices, intent = [], "ask"
+        text = self.phrases[intent].format(price=prices[0] if prices else "")
+
+        if response_format is not None:
+            result["content"] = json.dumps({"reply": text, "prices": prices, "intent": intent}, ensure_ascii=False)
+        else:
+            result["content"] = text
+        return result
+
+
+def complete_hedged(provider: LLMProvider, pool, messages, temperature: float, max_tokens: int,
+                    deadline: float, hedge_after_s: float, on_discard=None,
+                    response_format: dict | None = None, can_hedge=None) -> dict:
+    """Anfrage mit Latenz-Budget (deadline = time.monotonic()-Zeitpunkt).
+
+    Ist nach hedge_after_s noch keine Antwort da, geht eine zweite, identische
+    Anfrage raus; die erste erfolgreiche gewinnt. Ist das Budget vorher
+    aufgebraucht, kommt status="timeout" zurück. Verworfene Anfragen laufen im
+    Pool zu Ende und werden an on_discard(result) übergeben (für Usage-Logging).
+    can_hedge() darf die zweite Anfrage verbieten (z. B. wenn das Rate-Limit knapp ist).
+    """
+    futures = [pool.submit(provider.complete, messages, temperature, max_tokens, response_format)]
+
+    if hedge_after_s > 0:
+        first_wait = min(hedge_after_s, deadline - time.monotonic())
+        done, _ = wait(futures, timeout=max(0.0, first_wait))
+        if not done and time.monotonic() < deadline and (can_hedge is None or can_hedge()):
+            futures.append(pool.submit(provider.complete, messages, temperature, max_tokens, response_format))
+
+    winner = None
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for f in done:
+            res = f.result()
+            if winner is None or (winner.result()["status"] != "ok" and res["status"] == "ok"):
+                winner = f
+        if winner is not None and winner.result()["status"] == "ok":
+            break
+
+    if on_discard is not None:
+        for f in futures:
+            if f is not winner:
+                f.add_done_callback(lambda fut: on_discard(fut.result()))
+
+    if winner is None:
+        result = empty_result(provider.model)
+        result["status"] = "timeout"
+        result["error"] = "Latenz-Budget überschritten."
+        return result
+
+    result = winner.result()
+    result["hedged"] = len(futures) > 1
+    return result
+
+
+def build_provider(secrets) -> LLMProvider:
+    kind = secrets.get("LLM_PROVIDER", "openai")
+    timeout = float(secrets.get("LLM_TIMEOUT_S", 60))
+
+    if kind == "openai":
+        return OpenAIProvider(
+            secrets.get("OPENAI_MODEL", "gpt-4o-mini"),
+            secrets.get("OPENAI_API_KEY"),
+            timeout=timeout,
+        )
+    if kind == "openai_compatible":
+        return OpenAICompatibleProvider(
+            secrets.get("LLM_MODEL", "local-model"),
+            secrets.get("LLM_BASE_URL", "http://localhost:8080/v1"),
+            api_key=secrets.get("LLM_API_KEY"),
+            timeout=timeout,
+        )
+    if kind == "template":
+        return TemplateProvider()
+    raise ValueError(f"Unbekannter LLM_PROVIDER: {kind!r}")
@@ -0,0 +1,174 @@
+# ============================================
+# llm_scheduler.py – prozessweiter Token-Bucket-Scheduler für LLM-Anfragen
+# ============================================
+#
+# Alle Sessions eines Prozesses teilen sich zwei Buckets, passend zu den
+# Account-Limits (LLM_RPM_LIMIT Anfragen/Minute, LLM_TPM_LIMIT Tokens/Minute).
+# Wartende Anfragen werden so sortiert:
+#   1. Priorität (0 = Abschluss-/Deal-Turn, 1 = normaler Turn)
+#   2. wie viele Anfragen die Session schon bekommen hat (faire Verteilung)
+#   3. Ankunft
+# Nur die vorderste Anfrage darf Tokens nehmen, damit große Anfragen nicht
+# von kleinen dauerhaft überholt werden.
+#
+# clock ist injizierbar (Tests: tests/test_llm_scheduler.py).
+
+import heapq
+import itertools
+import threading
+import time
+
+import streamlit as st
+
+PRIORITY_TERMINAL = 0
+PRIORITY_NORMAL = 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def debit(self, amount: float) -> float:
+        """Bei Vergabe abbuchen; Anfragen größer als die Kapazität kosten höchstens die Kapazität."""
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        return amount
+
+    def wait_time(self, amount: float) -> float:
+        # Anfragen größer als die Kapazität dürfen laufen, sobald der Bucket voll ist
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class LLMScheduler:
+    def __init__(self, rpm: int, tpm: int, clock=time.monotonic):
+        self._clock = clock
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self._cond = threading.Condition()
+        self._queue: list[tuple] = []
+        self._seq = itertools.count()
+        self._served: dict[str, int] = {}
+        self._paused_until = 0.0
+
+        self.granted = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.total_wait_ms = 0.0
+
+    @staticmethod
+    def estimate_tokens(messages, max_tokens: int) -> int:
+        # grob: ~4 Zeichen pro Token + Antwortbudget
+        return sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
+
+    def acquire(self, session_id: str, est_tokens: int, priority: int = PRIORITY_NORMAL,
+                deadline: float | None = None) -> bool:
+        """Blockiert, bis die Anfrage laufen darf. False, wenn vorher die deadline erreicht ist."""
+        t0 = self._clock()
+        with self._cond:
+            entry = (priority, self._served.get(session_id, 0), next(self._seq), session_id, est_tokens)
+            heapq.heappush(self._queue, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+
+            while True:
+                now = self._clock()
+                if self._queue[0] is entry:
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    wait = max(
+                        self._paused_until - now,
+                        self.requests.wait_time(1),
+                        self.tokens.wait_time(est_tokens),
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self._queue)
+                        self.requests.debit(1)
+                        self.tokens.debit(est_tokens)
+                        self._served[session_id] = self._served.get(session_id, 0) + 1
+                        self.granted += 1
+                        self.total_wait_ms += (now - t0) * 1000
+                        self._cond.notify_all()
+                        return True
+                else:
+                    wait = 0.25
+
+                if deadline is not None:
+                    if now >= deadline:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self.timeouts += 1
+                        self._cond.notify_all()
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(timeout=wait)
+
+    def try_acquire(self, session_id: str, est_tokens: int) -> bool:
+        """Nur wenn sofort Kapazität frei ist und niemand wartet (z. B. für Hedge-Anfragen)."""
+        with self._cond:
+            if self._queue:
+                return False
+            now = self._clock()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            if now < self._paused_until or self.requests.wait_time(1) > 0 or self.tokens.wait_time(est_tokens) > 0:
+                return False
+            self.requests.debit(1)
+            self.tokens.debit(est_tokens)
+            self._served[session_id] = self._served.get(session_id, 0) + 1
+            self.granted += 1
+            return True
+
+    def settle(self, est_tokens: int, actual_tokens: int | None):
+        """Schätzung nach der Antwort durch den echten Verbrauch ersetzen.
+
+        Gutgeschrieben wird gegen den abgebuchten Betrag (höchstens die Kapazität); lag der
+        Verbrauch darüber, bleibt der Bucket im Minus und füllt sich entsprechend später.
+        """
+        if actual_tokens is None:
+            return
+        with self._cond:
+            debited = min(est_tokens, self.tokens.capacity)
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + debited - actual_tokens)
+            self._cond.notify_all()
+
+    def penalize(self, seconds: float = 5.0):
+        """Nach einem 429 alle Anfragen kurz anhalten statt weiter ins Limit zu laufen."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def forget_session(self, session_id: str):
+        with self._cond:
+            self._served.pop(session_id, None)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            now = self._clock()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "granted": self.granted,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.granted, 1) if self.granted else 0.0,
+                "requests_available": round(self.requests.tokens, 1),
+                "tokens_available": round(self.tokens.tokens),
+                "paused_s": round(max(0.0, self._paused_until - now), 1),
+            }
+
+
+@st.cache_resource
+def get_scheduler() -> LLMScheduler:
+    return LLMScheduler(
+        rpm=int(st.secrets.get("LLM_RPM_LIMIT", 500)),
+        tpm=int(st.secrets.get("LLM_TPM_LIMIT", 200_000)),
+    )
@@ -0,0 +1,124 @@
+# ============================================
+# offer_parsing.py – Preis-/Zusage-/Beleidigungs-Erkennung in User-Nachrichten
+# ============================================
+#
+# Reine Funktionen ohne Streamlit-Zustand: chat.py nutzt sie pro Nachricht,
+# batch_offer_features.py wendet dieselbe Logik vektorisiert auf den ganzen
+# Chat-Korpus an und vergleicht beide Implementierungen.
+
+import re
+
+# -----------------------------
+# USER-OFFER EXTRAKTION (ANGLEICHUNG AN POWER-BOT)
+# -----------------------------
+PRICE_TOKEN_RE = re.compile(r"(?<!\d)(\d{2,5})(?!\d)")
+
+OFFER_KEYWORDS = [
+    "ich biete", "biete", "mein angebot", "angebot", "zahle", "ich zahle",
+    "würde geben", "ich würde geben", "kann geben", "gebe", "preis wäre", "mein preis",
+    "für", "bei", "mach"
+]
+
+UNIT_WORDS_AFTER_NUMBER = re.compile(
+    r"^\s*(gb|tb|zoll|inch|hz|gen|generation|chip|m\d+)\b|^\s*['\"]",
+    re.IGNORECASE
+)
+
+PLAIN_OFFER_RE = re.compile(r"^\s*(\d{2,5})\s*(€|eur|euro)?\s*[!?.,]?\s*$")
+
+# "X ist mir zu teuer" => kein Angebot
+TOO_MUCH_PATTERNS = [
+    r"\b(\d{2,5})\b.*\b(zu viel|zu teuer|zu hoch|ist mir zu viel|ist mir zu teuer)\b",
+    r"\b(zu viel|zu teuer|zu hoch|ist mir zu viel|ist mir zu teuer)\b.*\b(\d{2,5})\b",
+]
+_TOO_MUCH_RES = [re.compile(p) for p in TOO_MUCH_PATTERNS]
+
+# typische Specs (Speicher, Zoll), nie ein Preis
+SPEC_NUMBERS = (13, 32, 64, 128, 256, 512, 1024, 2048)
+
+PRICE_MIN, PRICE_MAX = 100, 5000
+
+
+def _price_candidates(text: str) -> list[int]:
+    candidates = []
+    for m in PRICE_TOKEN_RE.finditer(text):
+        val = int(m.group(1))
+        if not (PRICE_MIN <= val <= PRICE_MAX):
+            continue
+
+        after = text[m.end(): m.end() + 12]
+        if UNIT_WORDS_AFTER_NUMBER.search(after):
+            continue
+
+        if val in SPEC_NUMBERS:
+            continue
+
+        candidates.append(val)
+    return candidates
+
+
+def extract_user_offer(text: str) -> int | None:
+    if not text:
+        return None
+
+    t = text.strip().lower()
+
+    # 1) reine Zahl => Angebot
+    m_plain = PLAIN_OFFER_RE.match(t)
+    if m_plain:
+        val = int(m_plain.group(1))
+        if PRICE_MIN <= val <= PRICE_MAX:
+            return val
+
+    # 2) "X ist mir zu teuer" => kein Angebot
+    for pat in _TOO_MUCH_RES:
+        if pat.search(t):
+            return None
+
+    has_euro_hint = ("€" in t) or (" eur" in t) or (" euro" in t)
+    has_offer_intent = any(k in t for k in OFFER_KEYWORDS)
+
+    candidates = _price_candidates(text)
+
+    # ✅ Power-Bot Fallback: wenn genau eine plausible Zahl im Text vorkommt, nimm sie trotzdem
+    if not (has_euro_hint or has_offer_intent):
+        return candidates[0] if len(candidates) == 1 else None
+
+    return candidates[-1] if candidates else None
+
+# -----------------------------
+# Beleidigungen (Abbruch)
+# -----------------------------
+INSULT_PATTERNS = [
+    r"\b(fotze|hurensohn|wichser|arschloch|missgeburt)\b",
+    r"\b(verpiss dich|halt die fresse)\b",
+    r"\b(drecks(?:bot|kerl|typ))\b",
+]
+INSULT_RE = re.compile("|".join(INSULT_PATTERNS))
+
+
+def contains_insult(text: str) -> bool:
+    return INSULT_RE.search((text or "").lower()) is not None
+
+# -----------------------------
+# Deal acceptance (message) – wie Power-Bot
+# -----------------------------
+ACCEPT_WORDS = [
+    "deal", "einverstanden", "passt", "ok", "okay",
+    "nehme ich", "akzeptiere", "verstanden"
+]
+
+NUMBER_RE = re.compile(r"\d{2,5}")
+
+
+def user_accepts_price(user_text: str, bot_price: int) -> bool:
+    if bot_price is None:
+        return False
+
+    text = (user_text or "").lower()
+
+    if not any(w in text for w in ACCEPT_WORDS):
+        return False
+
+    nums = NUMBER_RE.findall(text)
+    return (not nums) or (int(nums[0]) == bot_price)
@@ -0,0 +1,511 @@
+# ============================================
+# Admin-Dashboard (eigene Seite)
+# Ergebnisse, Umfrage, Chat-Export, LLM-Nutzung
+# ============================================
+#
+# Läuft nur, wenn die Seite aufgerufen wird – pandas/openpyxl werden
+# ausschließlich hier geladen, nicht im Participant-Pfad (chat.py).
+
+import os
+
+import pandas as pd
+import streamlit as st
+
+from admin_jobs import XLSX_MIME, chats_to_txt, excel_bytes, get_job_runner
+from db_common import current_study, get_conn, init_db
+from llm_scheduler import get_scheduler
+from session_reaper import db_counts, get_live_sessions
+from state_store import get_state_store
+from studies import delete_study, export_paired_csv, export_study_archive, list_studies, load_paired_df
+from survey_analytics import GROUP_KEYS, REFRESH_TTL_S, survey_stats
+from ui_common import CHAT_CSS, chat_bubble_html, format_ts
+from variants import VARIANTS
+from warmup import warmup_status
+
+st.set_page_config(page_title="Admin – iPad-Verhandlung", page_icon="📊")
+
+# Zeitfenster für alle Abfragen; ausgewertet in SQL über die (study_id, ts)-Indizes
+TIME_WINDOWS = {
+    "Gesamter Zeitraum": None,
+    "Letzte 2 Stunden": "2 hours",
+    "Letzte 24 Stunden": "24 hours",
+    "Letzte 7 Tage": "7 days",
+}
+
+# -----------------------------
+# Abfragen
+# -----------------------------
+def since_clause(column: str, since: str | None) -> tuple[str, tuple]:
+    # column: fester Spaltenname, since: Wert aus TIME_WINDOWS (als Parameter)
+    if not since:
+        return "", ()
+    return f" AND {column} >= now() - %s::interval", (since,)
+
+def naive_times(df: pd.DataFrame, columns: list[str], tz: str = "Europe/Berlin") -> pd.DataFrame:
+    # timestamptz -> Ortszeit ohne Zone (Anzeige + Excel, openpyxl kann keine Zeitzonen)
+    for col in columns:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+    return df
+
+def load_llm_usage_df(group_by: str, study_id: str, bot_variant: str | None = None,
+                      since: str | None = None) -> pd.DataFrame:
+    # group_by: "bot_variant" oder "session_id" (feste Spaltennamen, kein User-Input)
+    keys = "bot_variant" if group_by == "bot_variant" else "session_id, bot_variant"
+    where = "WHERE study_id = %s" + (" AND bot_variant = %s" if bot_variant else "")
+    window, window_params = since_clause("ts", since)
+    where += window
+    init_db()
+    conn = get_conn()
+    df = pd.read_sql_query(f"""
+        SELECT
+            {keys},
+            COUNT(*) AS calls,
+            COUNT(DISTINCT session_id || ':' || turn_index) AS turns,
+            SUM(CASE WHEN attempt > 1 THEN 1 ELSE 0 END) AS retries,
+            SUM(CASE WHEN violation = 'power_primes' THEN 1 ELSE 0 END) AS power_prime_violations,
+            SUM(CASE WHEN violation = 'disallowed_prices' THEN 1 ELSE 0 END) AS price_violations,
+            SUM(CASE WHEN violation LIKE '%%_repaired' THEN 1 ELSE 0 END) AS local_repairs,
+            SUM(CASE WHEN status NOT IN ('ok', 'replay', 'fallback', 'timeout') THEN 1 ELSE 0 END) AS api_errors,
+            SUM(CASE WHEN status = 'fallback' THEN 1 ELSE 0 END) AS fallbacks,
+            SUM(CASE WHEN violation = 'budget_exhausted' AND status = 'fallback' THEN 1 ELSE 0 END) AS budget_fallbacks,
+            SUM(CASE WHEN violation = 'hedge_discarded' THEN 1 ELSE 0 END) AS hedges,
+            COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+            COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+            COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+            ROUND(AVG(latency_ms)) AS avg_latency_ms,
+            MAX(latency_ms) AS max_latency_ms
+        FROM llm_calls
+        {where}
+        GROUP BY {keys}
+        ORDER BY {keys}
+    """, conn, params=((study_id, bot_variant) if bot_variant else (study_id,)) + window_params)
+    conn.close()
+
+    if not df.empty:
+        price_in = float(st.secrets.get("LLM_PRICE_INPUT_PER_1M", 0) or 0)
+        price_out = float(st.secrets.get("LLM_PRICE_OUTPUT_PER_1M", 0) or 0)
+        # gecachte Prompt-Tokens rechnet der Provider meist günstiger ab
+        price_cached = float(st.secrets.get("LLM_PRICE_CACHED_INPUT_PER_1M", price_in) or 0)
+        df["cache_share"] = (df["cached_tokens"] / df["prompt_tokens"].where(df["prompt_tokens"] > 0)).round(3)
+        df["cost_usd"] = (
+            (df["prompt_tokens"] - df["cached_tokens"]) * price_in
+            + df["cached_tokens"] * price_cached
+            + df["completion_tokens"] * price_out
+        ) / 1_000_000
+    return df
+
+def load_chat_for_session(session_id: str) -> pd.DataFrame:
+    init_db()
+    conn = get_conn()
+    df = pd.read_sql_query("""
+        SELECT role, text, ts
+        FROM chat_messages
+        WHERE session_id = %s
+        ORDER BY msg_index ASC
+    """, conn, params=(session_id,))
+    conn.close()
+    return df
+
+def load_sessions_df(study_id: str, bot_variant: str | None = None, since: str | None = None) -> pd.DataFrame:
+    # alle Sessions inkl. offener (ohne Ergebnis), neueste zuerst
+    where = "WHERE study_id = %s" + (" AND bot_variant = %s" if bot_variant else "")
+    window, window_params = since_clause("started_ts", since)
+    where += window
+    init_db()
+    conn = get_conn()
+    df = pd.read_sql_query(f"""
+        SELECT session_id, participant_id, bot_variant, order_id, step,
+               started_ts, ended_ts, outcome, price, msg_count
+        FROM sessions
+        {where}
+        ORDER BY started_ts DESC NULLS LAST
+    """, conn, params=((study_id, bot_variant) if bot_variant else (study_id,)) + window_params)
+    conn.close()
+    return naive_times(df, ["started_ts", "ended_ts"])
+
+def load_concession_df(study_id: str, bot_variant: str | None = None, since: str | None = None) -> pd.DataFrame:
+    # Zugeständniskurve: Ø Nutzerpreis / Gegenangebot pro Turn und Variante
+    where = "WHERE e.study_id = %s AND e.counter IS NOT NULL" + (" AND s.bot_variant = %s" if bot_variant else "")
+    window, window_params = since_clause("e.ts", since)
+    where += window
+    init_db()
+    conn = get_conn()
+    df = pd.read_sql_query(f"""
+        SELECT
+            s.bot_variant, e.turn_index,
+            COUNT(*) AS n,
+            ROUND(AVG(e.user_price)) AS avg_user_price,
+            ROUND(AVG(e.counter)) AS avg_counter,
+            SUM(e.snap_to_user) AS snaps
+        FROM negotiation_events e
+        JOIN sessions s ON s.session_id = e.session_id
+        {where}
+        GROUP BY s.bot_variant, e.turn_index
+        ORDER BY s.bot_variant, e.turn_index
+    """, conn, params=((study_id, bot_variant) if bot_variant else (study_id,)) + window_params)
+    conn.close()
+    return df
+
+def load_results_df(study_id: str, since: str | None = None) -> pd.DataFrame:
+    window, window_params = since_clause("ts", since)
+    init_db()
+    conn = get_conn()
+    df = pd.read_sql_query(f"""
+        SELECT
+            ts, participant_id, session_id, bot_variant, order_id, step,
+            deal, price, msg_count, ended_by, ended_via
+        FROM results
+        WHERE study_id = %s{window}
+        ORDER BY id ASC
+    """, conn, params=(study_id,) + window_params)
+    conn.close()
+    naive_times(df, ["ts"])
+
+    if not df.empty:
+        df["deal"] = df["deal"].map({1: "Deal", 0: "Abgebrochen"})
+        df["ended_by"] = df["ended_by"].map({"user": "User", "bot": "Bot", "system": "System"}).fillna("Unbekannt")
+        df["ended_via"] = df["ended_via"].fillna("")
+    return df
+
+def load_chats_df(study_id: str, bot_variant: str | None = None, since: str | None = None) -> pd.DataFrame:
+    window, window_params = since_clause("m.ts", since)
+    init_db()
+    conn = get_conn()
+
+    if bot_variant:
+        df = pd.read_sql_query(f"""
+            SELECT m.session_id, m.role, m.text, m.ts, m.msg_index
+            FROM chat_messages m
+            JOIN sessions s ON s.session_id = m.session_id
+            WHERE m.study_id = %s AND s.bot_variant = %s{window}
+            ORDER BY m.session_id, m.msg_index ASC
+        """, conn, params=(study_id, bot_variant) + window_params)
+    else:
+        df = pd.read_sql_query(f"""
+            SELECT m.session_id, m.role, m.text, m.ts, m.msg_index
+            FROM chat_messages m
+            WHERE m.study_id = %s{window}
+            ORDER BY m.session_id, m.msg_index ASC
+        """, conn, params=(study_id,) + window_params)
+
+    conn.close()
+    return df
+
+# -----------------------------
+# Hintergrund-Jobs (admin_jobs.py): Exporte + Löschen blockieren den Admin-Run nicht
+# -----------------------------
+def excel_job(job, df: pd.DataFrame) -> bytes:
+    job.update(0.1, "Excel wird erstellt")
+    return get_job_runner().run_cpu(excel_bytes, df)
+
+def chats_job(job, study_id: str, bot_variant: str | None, since: str | None) -> str:
+    job.update(0.1, "Chats werden geladen")
+    df = load_chats_df(study_id, bot_variant, since)
+    job.update(0.5, f"{df['session_id'].nunique()} Verhandlungen werden formatiert")
+    return get_job_runner().run_cpu(chats_to_txt, df)
+
+def archive_job(job, study_id: str) -> bytes:
+    return export_study_archive(study_id, progress=job.update)
+
+def paired_csv_job(job, study_id: str) -> bytes:
+    return export_paired_csv(study_id)
+
+def delete_job(job, study_id: str) -> None:
+    delete_study(study_id, progress=job.update)
+
+def start_job(label: str, fn, *args, study_id: str, file_name: str | None = None, mime: str | None = None):
+    runner = get_job_runner()
+    if runner.running(label, study_id):
+        st.info(f"„{label}“ läuft bereits – siehe Hintergrund-Jobs.")
+        return
+    runner.submit(label, fn, *args, study_id=study_id, file_name=file_name, mime=mime)
+    # neu zeichnen: render_jobs() steht über den Buttons und hat das Polling für diesen Run schon festgelegt
+    st.rerun()
+
+def _render_jobs():
+    runner = get_job_runner()
+    jobs = runner.list()
+    if not jobs:
+        st.caption("Noch keine Jobs gestartet.")
+        return
+    for job in jobs:
+        c1, c2, c3 = st.columns([4, 3, 1])
+        with c1:
+            st.write(f"**{job.label}** · {job.study_id} · {job.status}")
+            if not job.done:
+                st.progress(job.progress, text=job.message or job.status)
+            elif job.error:
+                st.error(job.error)
+        with c2:
+            if job.status == "fertig" and job.result is not None:
+                st.download_button(
+                    "Herunterladen",
+                    job.result,
+                    file_name=job.file_name,
+                    mime=job.mime,
+                    key=f"job_download_{job.id}",
+                    use_container_width=True,
+                )
+            elif job.status == "fertig":
+                st.success(f"Erledigt nach {job.finished - job.created:.1f} s")
+        with c3:
+            if job.done and st.button("✖", key=f"job_remove_{job.id}", help="Aus der Liste entfernen"):
+                runner.remove(job.id)
+                st.rerun(scope="fragment")
+
+def render_jobs():
+    # nur solange ein Job läuft, alle 2 s neu zeichnen (nur dieser Teil der Seite)
+    polling = any(not job.done for job in get_job_runner().list())
+    st.fragment(_render_jobs, run_every=2 if polling else None)()
+
+# -----------------------------
+# Admin Bereich
+# -----------------------------
+st.header("📊 Ergebnisse")
+st.markdown(CHAT_CSS, unsafe_allow_html=True)
+
+pwd_ok = False
+dashboard_password = st.secrets.get("DASHBOARD_PASSWORD", os.environ.get("DASHBOARD_PASSWORD"))
+pwd_input = st.text_input("Passwort für Dashboard", type="password")
+
+if dashboard_password:
+    if pwd_input and pwd_input == dashboard_password:
+        pwd_ok = True
+    elif pwd_input and pwd_input != dashboard_password:
+        st.warning("Falsches Passwort.")
+else:
+    st.info("Kein Passwort gesetzt (DASHBOARD_PASSWORD). Dashboard ist deaktiviert.")
+
+if pwd_ok:
+    st.success("Zugang gewährt.")
+    
+    bot_filter = st.selectbox(
+        "Bot-Filter",
+        options=["Alle"] + list(VARIANTS),
+        index=0
+    )
+    bot_variant_for_queries = None if bot_filter == "Alle" else bot_filter
+
+    studies = list_studies()
+    study = st.selectbox(
+        "Studie / Welle",
+        options=studies,
+        index=studies.index(current_study()),
+        help="STUDY_ID dieser Instanz ist vorausgewählt.",
+    )
+    since = TIME_WINDOWS[st.selectbox("Zeitraum", options=list(TIME_WINDOWS), index=0)]
+
+    with st.expander("⚙️ Hintergrund-Jobs (Exporte, Löschen)", expanded=True):
+        render_jobs()
+
+    with st.expander("📊 Umfrage-Auswertung (Likert 1–6)", expanded=False):
+        # inkrementell im Prozess gehalten; ignoriert den Zeitraum-Filter (immer ganze Studie)
+        group_labels = {
+            "Variante": ["bot_variant"],
+            "Reihenfolge": ["order_id"],
+            "Schritt": ["step"],
+            "Variante × Schritt": ["bot_variant", "step"],
+            "Variante × Reihenfolge × Schritt": GROUP_KEYS,
+        }
+        by = group_labels[st.radio("Gruppierung", list(group_labels), horizontal=True)]
+        stats = survey_stats(study, force=st.button("Neu laden", key="survey_stats_refresh"))
+        df_sum = stats.summary(by)
+        if bot_variant_for_queries and "bot_variant" in by:
+            df_sum = df_sum[df_sum["bot_variant"] == bot_variant_for_queries]
+        if df_sum.empty:
+            st.info("Noch keine Umfrage-Daten vorhanden.")
+        else:
+            st.markdown("**Mittelwerte**")
+            st.dataframe(df_sum.pivot_table(index="item", columns=by, values="mean", sort=False),
+                         use_container_width=True)
+            st.markdown("**Verteilungen (Anteile in %) mit n, Mittelwert, SD**")
+            st.dataframe(df_sum, use_container_width=True, hide_index=True)
+            st.markdown("**Reliabilität (Cronbachs Alpha)**")
+            df_rel = stats.reliability(by)
+            if bot_variant_for_queries and "bot_variant" in by:
+                df_rel = df_rel[df_rel["bot_variant"] == bot_variant_for_queries]
+            st.dataframe(df_rel, use_container_width=True, hide_index=True)
+            st.caption(f"{stats.n_rows} Fragebögen, Stand alle {REFRESH_TTL_S} s aktualisiert (nur neue Zeilen werden geladen).")
+
+    with st.expander("📋 Umfrageergebnisse", expanded=False):
+        init_db()
+        conn = get_conn()
+        window, window_params = since_clause("survey_ts_utc", since)
+        if bot_variant_for_queries:
+            df_s = pd.read_sql_query(
+                f"SELECT * FROM survey WHERE study_id = %s AND bot_variant = %s{window} ORDER BY id ASC",
+                conn,
+                params=(study, bot_variant_for_queries) + window_params
+            )
+        else:
+            df_s = pd.read_sql_query(f"SELECT * FROM survey WHERE study_id = %s{window} ORDER BY id ASC",
+                                     conn, params=(study,) + window_params)
+        conn.close()
+        naive_times(df_s, ["survey_ts_utc"])
+        
+        if df_s.empty:
+            st.info("Noch keine Umfrage-Daten vorhanden.")
+        else:
+            st.dataframe(df_s, use_container_width=True)
+
+            if st.button("Umfrage als Excel erstellen", use_container_width=True):
+                start_job("Umfrage (Excel)", excel_job, df_s, study_id=study,
+                          file_name="survey_results_download.xlsx", mime=XLSX_MIME)
+
+    with st.expander("👥 Paired-Datensatz (beide Bedingungen pro Participant)", expanded=False):
+        # View paired_dataset: letzte Verhandlung + letzter Fragebogen je Variante; ganze Studie
+        complete_only = st.checkbox("Nur vollständige Participants (beide Verhandlungen + Fragebögen)")
+        df_p = load_paired_df(study, complete_only=complete_only)
+        naive_times(df_p, [c for c in df_p.columns if c.endswith(("_ts", "_survey_ts_utc"))])
+        if df_p.empty:
+            st.info("Noch keine Participants vorhanden.")
+        else:
+            st.caption(f"{len(df_p)} Participants, davon {int(df_p['complete'].sum())} vollständig.")
+            st.dataframe(df_p, use_container_width=True, hide_index=True)
+
+            c1, c2 = st.columns(2)
+            if c1.button("CSV erstellen", key="paired_csv", use_container_width=True):
+                start_job("Paired-Datensatz (CSV)", paired_csv_job, study, study_id=study,
+                          file_name=f"paired_{study}.csv", mime="text/csv")
+            if c2.button("Excel erstellen", key="paired_xlsx", use_container_width=True):
+                start_job("Paired-Datensatz (Excel)", excel_job, df_p, study_id=study,
+                          file_name=f"paired_{study}.xlsx", mime=XLSX_MIME)
+
+    with st.expander("Alle Verhandlungsergebnisse", expanded=True):
+        df = load_results_df(study, since)
+        if bot_variant_for_queries:
+            df = df[df["bot_variant"] == bot_variant_for_queries].copy()
+
+        if len(df) == 0:
+            st.write("Noch keine Ergebnisse gespeichert.")
+        else:
+            df = df.reset_index(drop=True)
+            df["nr"] = df.index + 1
+            df = df[[
+                "nr", "ts", "participant_id", "session_id", "bot_variant", "order_id", "step",
+                "deal", "ended_by", "ended_via", "price", "msg_count"
+            ]]
+            st.dataframe(df, use_container_width=True, hide_index=True)
+
+            if st.button("Ergebnisse als Excel erstellen", use_container_width=True):
+                start_job("Verhandlungsergebnisse (Excel)", excel_job, df, study_id=study,
+                          file_name="verhandlungsergebnisse.xlsx", mime=XLSX_MIME)
+
+        st.markdown("### 📥 Chat-Export")
+        if st.button("📄 Alle Chats als TXT erstellen", use_container_width=True):
+            start_job("Chat-Export (TXT)", chats_job, study, bot_variant_for_queries, since, study_id=study,
+                      file_name="alle_chatverlaeufe.txt", mime="text/plain")
+
+        st.markdown("---")
+        st.subheader("💬 Chatverlauf anzeigen")
+
+        sessions_df = load_sessions_df(study, bot_variant_for_queries, since)
+        if len(sessions_df) > 0:
+            labels = {
+                row.session_id: f"{row.session_id} · {row.participant_id} · {row.bot_variant} · "
+                                f"{row.outcome or 'offen'} · {row.msg_count} Nachrichten"
+                for row in sessions_df.itertuples()
+            }
+            selected_session = st.selectbox(
+                "Verhandlung auswählen", list(labels), format_func=labels.get,
+            )
+            if selected_session:
+                chat_df = load_chat_for_session(selected_session)
+                st.markdown("### 💬 Chatverlauf")
+
+                for _, row in chat_df.iterrows():
+                    st.markdown(chat_bubble_html(row["role"], row["text"], row["ts"]), unsafe_allow_html=True)
+
+    with st.expander("📉 Zugeständniskurven", expanded=False):
+        df_conc = load_concession_df(study, bot_variant_for_queries, since)
+        if df_conc.empty:
+            st.info("Noch keine Gegenangebote protokolliert.")
+        else:
+            st.line_chart(df_conc, x="turn_index", y="avg_counter", color="bot_variant")
+            st.dataframe(df_conc, use_container_width=True, hide_index=True)
+
+    with st.expander("🧮 LLM-Nutzung & Kosten", expanded=False):
+        df_llm_variant = load_llm_usage_df("bot_variant", study, bot_variant_for_queries, since)
+        if df_llm_variant.empty:
+            st.info("Noch keine LLM-Aufrufe protokolliert.")
+        else:
+            st.markdown("**Pro Variante**")
+            st.dataframe(df_llm_variant, use_container_width=True, hide_index=True)
+
+            st.markdown("**Pro Session**")
+            df_llm_session = load_llm_usage_df("session_id", study, bot_variant_for_queries, since)
+            st.dataframe(df_llm_session, use_container_width=True, hide_index=True)
+
+            if not st.secrets.get("LLM_PRICE_INPUT_PER_1M"):
+                st.caption("Kosten = 0, solange LLM_PRICE_INPUT_PER_1M / LLM_PRICE_OUTPUT_PER_1M nicht gesetzt sind.")
+            st.caption("cache_share = Anteil der Prompt-Tokens aus dem Prompt-Cache des Providers "
+                       "(usage.prompt_tokens_details.cached_tokens; 0, wenn der Provider ihn nicht meldet).")
+
+    with st.expander("🔥 Warmup (Cold Start)", expanded=False):
+        ws = warmup_status()
+        if ws is None:
+            st.info("In diesem Prozess lief noch keine Chat-Session.")
+        else:
+            if ws["ready"]:
+                st.success(f"Bereit nach {ws['total_ms']:.0f} ms.")
+            else:
+                st.warning("Warmup läuft noch.")
+            st.dataframe(
+                pd.DataFrame([{"Schritt": k, **v} for k, v in ws["steps"].items()]),
+                use_container_width=True, hide_index=True,
+            )
+
+    with st.expander("🚦 LLM-Warteschlange", expanded=False):
+        # prozessweit: zeigt die Sessions dieser App-Instanz
+        m = get_scheduler().metrics()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Wartend", m["queue_depth"], help=f"Maximum seit Start: {m['max_queue_depth']}")
+        c2.metric("Ø Wartezeit", f"{m['avg_wait_ms']:.0f} ms")
+        c3.metric("Freigegeben", m["granted"])
+        c4.metric("Budget-Timeouts", m["timeouts"])
+        st.caption(
+            f"Frei: {m['requests_available']} Anfragen / {m['tokens_available']} Tokens "
+            f"(Limits LLM_RPM_LIMIT / LLM_TPM_LIMIT)"
+            + (f" – nach 429 pausiert für {m['paused_s']} s" if m["paused_s"] else "")
+        )
+
+    with st.expander("🫀 Live-Sessions & Timeouts", expanded=False):
+        live = get_live_sessions(current_study(), get_state_store())
+        counts = db_counts(study)
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Live (dieser Prozess)", live.live_count(), help=f"Im Speicher gehalten: {live.tracked_count()}")
+        c2.metric("Live (alle Replicas)", counts["live"], help="Offene Verhandlungen mit Heartbeat in den letzten 3 Minuten")
+        c3.metric("Offen", counts["open"])
+        c4.metric("Timeouts", counts["timeouts"], help=f"Davon in diesem Prozess: {live.expired_total}")
+        st.caption(
+            f"Idle-Timeout {live.idle_timeout_s // 60} min (SESSION_IDLE_TIMEOUT_S); "
+            f"State freigegeben: {live.evicted_total}"
+            + (f"; letzte Prüfung {format_ts(live.last_reap)}" if live.last_reap else "")
+        )
+
+    st.markdown("---")
+    st.subheader("Admin-Tools")
+
+    if "confirm_delete" not in st.session_state:
+        st.session_state["confirm_delete"] = False
+
+    # Archiv als Job (COPY über alle Tabellen der Studie), Download unter Hintergrund-Jobs
+    if st.button(f"🗄️ Archiv der Studie „{study}“ erstellen (ZIP)", use_container_width=True):
+        start_job("Studien-Archiv (ZIP)", archive_job, study, study_id=study,
+                  file_name=f"studie_{study}_archiv.zip", mime="application/zip")
+
+    if not st.session_state["confirm_delete"]:
+        if st.button(f"🗑️ Ergebnisse der Studie „{study}“ löschen (Bestätigung)"):
+            st.session_state["confirm_delete"] = True
+            st.rerun()
+    else:
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("❌ Abbrechen"):
+                st.session_state["confirm_delete"] = False
+                st.rerun()
+        with c2:
+            if st.button("✅ Ja, wirklich löschen"):
+                st.session_state["confirm_delete"] = False
+                start_job("Studie löschen", delete_job, study, study_id=study)
@@ -0,0 +1,157 @@
+# ============================================
+# replay_session.py – geloggte Verhandlungen offline nachspielen
+# ============================================
+#
+# Spielt die User-Nachrichten einer Session aus chat_messages erneut durch die
+# komplette Turn-Pipeline von chat.py (Streamlit AppTest, kein Browser) und
+# misst die Zeit pro Turn. Mit LLM_CASSETTE_MODE=replay läuft das ohne
+# API-Key und ohne Netzwerk; der Preis-RNG ist über PRICING_SEED + Session-ID
+# geseedet, daher sind die Gegenangebote identisch zur Aufnahme. Variante,
+# Reihenfolge, Schritt und Studie kommen aus der sessions-Zeile, damit Prompts
+# (und damit die Cassette-Fingerprints) der Aufnahme entsprechen.
+#
+# Beispiel:
+#   python replay_session.py --source-db "$PROD_DB" --target-db postgresql://localhost/replay \
+#       --cassette llm_cassette.jsonl <session_id> [<session_id> ...]
+#
+# --target-db ist Pflicht, damit der Replay keine Zeilen in die Studien-DB schreibt.
+
+import argparse
+import statistics
+import sys
+import time
+
+import psycopg2
+from streamlit.testing.v1 import AppTest
+
+
+def load_session(source_db: str, session_id: str) -> tuple[dict | None, list[tuple]]:
+    conn = psycopg2.connect(source_db)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT participant_id, bot_variant, order_id, step, study_id
+        FROM sessions WHERE session_id = %s
+    """, (session_id,))
+    row = cur.fetchone()
+    meta = dict(zip(["participant_id", "bot_variant", "order_id", "step", "study_id"], row)) if row else None
+    cur.execute("""
+        SELECT role, text
+        FROM chat_messages
+        WHERE session_id = %s
+        ORDER BY msg_index ASC
+    """, (session_id,))
+    rows = cur.fetchall()
+    conn.close()
+    return meta, rows
+
+
+def _unlock_step2(pid: str):
+    # chat.py lässt Schritt 2 nur nach dem Fragebogen von Schritt 1 zu: Platzhalter in der Wegwerf-DB
+    from db_common import current_study, get_conn, init_db
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO survey (study_id, participant_id, step)
+        SELECT %s, %s, '1'
+        WHERE NOT EXISTS (SELECT 1 FROM survey WHERE study_id = %s AND participant_id = %s AND step = '1')
+    """, (current_study(), pid, current_study(), pid))
+    conn.commit()
+    conn.close()
+
+
+def replay(session_id: str, meta: dict, rows, args) -> dict:
+    pid = meta["participant_id"] or "p-replay"
+    secrets = {
+        "DATABASE_URL": args.target_db,
+        "LLM_CASSETTE_MODE": args.mode,
+        "LLM_CASSETTE_PATH": args.cassette,
+        "STUDY_ID": meta["study_id"] or "default",
+        # aufgezeichnete Variante erzwingen, auch einen (lokal freigeschalteten) Entwurf
+        "ALLOW_VARIANT_OVERRIDE": True,
+        "SERVE_DRAFT_VARIANTS": [meta["bot_variant"]],
+    }
+    if args.seed is not None:
+        secrets["PRICING_SEED"] = args.seed
+
+    if meta["step"] == "2":
+        prep = AppTest.from_function(_unlock_step2, args=(pid,), default_timeout=args.timeout)
+        prep.secrets.update(secrets)
+        prep.run()
+
+    at = AppTest.from_file("chat.py", default_timeout=args.timeout)
+    at.secrets.update(secrets)
+    at.query_params["pid"] = pid
+    at.query_params["variant"] = meta["bot_variant"]
+    if meta["order_id"]:
+        at.query_params["order"] = meta["order_id"]
+    if meta["step"]:
+        at.query_params["step"] = meta["step"]
+    at.session_state["session_id"] = session_id
+    at.run()
+
+    turn_ms = []
+    mismatches = 0
+    bot_texts = [text for role, text in rows if role == "assistant"][1:]  # ohne Begrüßung
+    user_texts = [text for role, text in rows if role == "user"]
+
+    for i, text in enumerate(user_texts):
+        if at.session_state["closed"]:
+            break
+        t0 = time.perf_counter()
+        at.chat_input[0].set_value(text).run()
+        turn_ms.append((time.perf_counter() - t0) * 1000)
+
+        if at.exception:
+            print(f"  Turn {i + 1}: Exception {at.exception[0].message}")
+            break
+
+        history = at.session_state["history"]
+        last = history.last()
+        replayed = last.text if last is not None and last.role == "assistant" else None
+        if i < len(bot_texts) and replayed != bot_texts[i]:
+            mismatches += 1
+            if args.verbose:
+                print(f"  Turn {i + 1} weicht ab:\n    alt: {bot_texts[i]}\n    neu: {replayed}")
+
+    return {"turns": len(turn_ms), "turn_ms": turn_ms, "mismatches": mismatches}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Geloggte Verhandlungen offline nachspielen.")
+    ap.add_argument("session_ids", nargs="+")
+    ap.add_argument("--source-db", required=True, help="DB mit den geloggten chat_messages")
+    ap.add_argument("--target-db", required=True, help="Wegwerf-DB, in die der Replay loggt")
+    ap.add_argument("--cassette", default="llm_cassette.jsonl")
+    ap.add_argument("--mode", default="replay", choices=["replay", "record"])
+    ap.add_argument("--seed", default=None, help="PRICING_SEED der Aufnahme")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+
+    if args.source_db == args.target_db:
+        print("--source-db und --target-db müssen verschieden sein.", file=sys.stderr)
+        return 2
+
+    all_ms = []
+    total_mismatches = 0
+    for sid in args.session_ids:
+        meta, rows = load_session(args.source_db, sid)
+        if meta is None or not rows:
+            print(f"{sid}: keine Session/Nachrichten gefunden")
+            continue
+        res = replay(sid, meta, rows, args)
+        all_ms.extend(res["turn_ms"])
+        total_mismatches += res["mismatches"]
+        mean = statistics.mean(res["turn_ms"]) if res["turn_ms"] else 0.0
+        print(f"{sid}: {res['turns']} Turns, Ø {mean:.1f} ms/Turn, {res['mismatches']} Abweichungen")
+
+    if all_ms:
+        all_ms.sort()
+        p95 = all_ms[min(len(all_ms) - 1, int(len(all_ms) * 0.95))]
+        print(f"Gesamt: {len(all_ms)} Turns, Median {statistics.median(all_ms):.1f} ms, p95 {p95:.1f} ms")
+    return 1 if total_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# ============================================
+# scoreboard.py – Scoreboard am Ende von Schritt 2 (Perzentil pro Variante)
+# ============================================
+#
+# Am Ende einer Klassen-Session rufen alle Participants das Scoreboard fast
+# gleichzeitig auf. Deshalb pro Studie + Variante eine sortierte Preisliste
+# aller Deals (Index-Scan über sessions_scoreboard_idx, ein Query pro TTL),
+# das Perzentil eines Participants dann per bisect in O(log n).
+# Niedriger Preis = besser (Participant ist Käufer). Angezeigt wird nur der
+# Schritt, nie das Varianten-Label (würde die Manipulation verraten).
+
+from bisect import bisect_left, bisect_right
+
+import streamlit as st
+
+from db_common import get_conn, init_db
+
+SCOREBOARD_TTL_S = 30
+
+
+@st.cache_data(ttl=SCOREBOARD_TTL_S, show_spinner=False)
+def deal_prices(study_id: str, bot_variant: str) -> tuple[tuple[int, ...], frozenset[str]]:
+    """Sortierte Deal-Preise + Session-IDs (ob der eigene Deal schon im Cache ist)."""
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT price, session_id FROM sessions
+        WHERE study_id = %s AND bot_variant = %s AND outcome = 'deal' AND price IS NOT NULL
+        ORDER BY price
+    """, (study_id, bot_variant))
+    rows = cur.fetchall()
+    conn.close()
+    return tuple(price for price, _ in rows), frozenset(sid for _, sid in rows)
+
+
+def percentile(prices: tuple[int, ...], price: int, own_included: bool) -> float | None:
+    """Anteil der anderen Deals (in %), die teurer waren; Gleichstände zählen halb.
+
+    own_included: der eigene Deal steht in prices (sonst ist der Cache älter als der Deal).
+    None, solange es keinen anderen Deal gibt.
+    """
+    lo = bisect_left(prices, price)
+    hi = bisect_right(prices, price)
+    own = 1 if own_included and lo < hi else 0
+    others = len(prices) - own
+    if others < 1:
+        return None
+    worse = len(prices) - hi
+    ties = hi - lo - own
+    return 100.0 * (worse + 0.5 * ties) / others
+
+
+def participant_deals(study_id: str, pid: str) -> list[dict]:
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT session_id, step, bot_variant, price FROM sessions
+        WHERE study_id = %s AND participant_id = %s AND outcome = 'deal' AND price IS NOT NULL
+        ORDER BY step
+    """, (study_id, pid))
+    rows = [
+        {"session_id": sid, "step": step, "bot_variant": variant, "price": price}
+        for sid, step, variant, price in cur.fetchall()
+    ]
+    conn.close()
+    return rows
+
+
+def render_scoreboard(study_id: str, pid: str):
+    st.markdown("## 🏆 Scoreboard")
+    deals = participant_deals(study_id, pid)
+    if not deals:
+        st.info("Für Sie liegt kein abgeschlossener Deal vor – daher gibt es keine Platzierung.")
+        return
+
+    cols = st.columns(len(deals))
+    for col, deal in zip(cols, deals):
+        prices, session_ids = deal_prices(study_id, deal["bot_variant"])
+        own_included = deal["session_id"] in session_ids
+        pct = percentile(prices, deal["price"], own_included)
+        with col:
+            st.metric(f"Verhandlung {deal['step']}", f"{deal['price']} €")
+            if pct is None:
+                st.caption("Noch zu wenige Deals für einen Vergleich.")
+            else:
+                st.progress(int(round(pct)))
+                n = len(prices) + (not own_included)
+                st.write(f"Besser als **{pct:.0f} %** der {n} Deals in dieser Verhandlung.")
+
+    st.caption(f"Stand: max. {SCOREBOARD_TTL_S} s alt.")
@@ -0,0 +1,218 @@
+# ============================================
+# session_reaper.py – verwaiste Verhandlungen erkennen (Heartbeat + Idle-Timeout)
+# ============================================
+#
+# Wer den Tab schließt, hinterlässt seinen st.session_state (Verlauf, params,
+# rng) im Prozess und nie eine results-Zeile. Deshalb:
+#   - Heartbeat: jeder Script-Run und, solange der Tab offen ist, ein Fragment
+#     alle HEARTBEAT_S s melden die Session hier an; sessions.last_seen_ts wird
+#     höchstens alle DB_HEARTBEAT_EVERY_S s im Hintergrund geschrieben
+#   - ein Reaper-Thread pro Prozess prüft alle REAP_INTERVAL_S s:
+#       1) Hintergrund-Writes abwarten (Chat-Log, Snapshot)
+#       2) offene Sessions ohne Heartbeat seit SESSION_IDLE_TIMEOUT_S in der DB
+#          beenden (outcome abort, ended_via "timeout") + results-Zeile, in
+#          einem Statement – mehrere Replicas beenden eine Session nur einmal
+#       3) den Snapshot als beendet markieren (Rückkehr -> Fragebogen)
+#       4) lokal inaktive Sessions als verdrängt markieren: läuft das Script der
+#          Session wieder (Tab aus dem Ruhezustand), leert chat.py zu Beginn
+#          den eigenen Session-State und setzt per ?sid aus dem Snapshot fort.
+#          Getrennte Tabs entfernt Streamlit selbst (Session-Storage mit TTL).
+#   - endet eine per Timeout beendete Session doch noch (Tab war nur im
+#     Ruhezustand), schreibt chat.log_result keine zweite results-Zeile
+#   - live_count()/db_counts() für die Admin-Seite
+
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import streamlit as st
+
+from db_common import flush_writes, get_conn, init_db, run_async, utc_now
+from llm_scheduler import get_scheduler
+
+HEARTBEAT_S = 30
+DB_HEARTBEAT_EVERY_S = 60
+REAP_INTERVAL_S = 60
+SESSION_IDLE_TIMEOUT_S = 15 * 60
+# so lange bleibt eine verdrängte Session markiert (danach gilt sie als aufgegeben)
+EVICTED_KEEP_S = 24 * 3600
+
+TIMEOUT_NOTE = "Die Verhandlung wurde wegen Inaktivität automatisch beendet. Bitte füllen Sie den Fragebogen aus."
+
+
+def _touch_session(dsn: str, session_id: str, ts):
+    init_db(dsn)
+    conn = get_conn(dsn)
+    cur = conn.cursor()
+    cur.execute("UPDATE sessions SET last_seen_ts = %s WHERE session_id = %s", (ts, session_id))
+    conn.commit()
+    conn.close()
+
+
+def expire_idle_sessions(dsn: str, study_id: str, idle_timeout_s: int) -> list[tuple]:
+    """Offene Sessions ohne Heartbeat beenden; liefert (session_id, participant_id, step)."""
+    init_db(dsn)
+    conn = get_conn(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        WITH expired AS (
+            UPDATE sessions SET
+                ended_ts = now(), outcome = 'abort', ended_by = 'system', ended_via = 'timeout'
+            WHERE study_id = %s AND outcome IS NULL
+              AND COALESCE(last_seen_ts, started_ts) < now() - make_interval(secs => %s)
+            RETURNING session_id, participant_id, bot_variant, order_id, step, msg_count
+        )
+        INSERT INTO results (
+            study_id, ts, session_id, participant_id, bot_variant, order_id, step,
+            deal, price, msg_count, ended_by, ended_via
+        )
+        SELECT %s, now(), session_id, participant_id, bot_variant, order_id, step,
+               0, NULL, msg_count, 'system', 'timeout'
+        FROM expired
+        RETURNING session_id, participant_id, step
+    """, (study_id, idle_timeout_s, study_id))
+    rows = cur.fetchall()
+    conn.commit()
+    conn.close()
+    return rows
+
+
+class _Entry:
+    __slots__ = ("pid", "step", "last_seen", "db_seen")
+
+    def __init__(self, pid: str, step: str):
+        self.pid = pid
+        self.step = step
+        self.last_seen = 0.0
+        self.db_seen = 0.0
+
+
+class LiveSessions:
+    def __init__(self, study_id: str, dsn: str, store, scheduler, idle_timeout_s: int = SESSION_IDLE_TIMEOUT_S,
+                 clock=time.monotonic):
+        # alles, was sonst aus st.secrets käme, wird im Script-Thread gelesen und übergeben
+        # (get_live_sessions): Reaper- und Writer-Thread hängen nicht vom Secrets-Kontext ab
+        self.study_id = study_id
+        self.dsn = dsn
+        self.store = store  # state_store.StateStore
+        self.scheduler = scheduler  # llm_scheduler.LLMScheduler
+        self.idle_timeout_s = idle_timeout_s
+        self.expired_total = 0
+        self.evicted_total = 0
+        self.last_reap: datetime | None = None
+        self._clock = clock
+        self._entries: dict[str, _Entry] = {}
+        self._evicted: dict[str, float] = {}  # session_id -> Zeitpunkt der Verdrängung
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="session-reaper", daemon=True).start()
+
+    # -----------------------------
+    # Heartbeat (Script-Thread)
+    # -----------------------------
+    def heartbeat(self, session_id: str, pid: str, step: str):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = self._entries[session_id] = _Entry(pid, step)
+            entry.last_seen = now
+            write_db = now - entry.db_seen >= DB_HEARTBEAT_EVERY_S
+            if write_db:
+                entry.db_seen = now
+        if write_db:
+            run_async(_touch_session, self.dsn, session_id, utc_now())
+
+    def live_count(self) -> int:
+        """Sessions dieses Prozesses mit Heartbeat in den letzten 2 Intervallen (Tab offen)."""
+        cutoff = self._clock() - 2 * HEARTBEAT_S
+        with self._lock:
+            return sum(1 for e in self._entries.values() if e.last_seen >= cutoff)
+
+    def tracked_count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def is_evicted(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._evicted
+
+    def take_evicted(self, session_id: str) -> bool:
+        """True (einmal), wenn die Session verdrängt wurde: der Script-Run leert dann seinen State."""
+        with self._lock:
+            return self._evicted.pop(session_id, None) is not None
+
+    # -----------------------------
+    # Reaper (eigener Thread)
+    # -----------------------------
+    def _loop(self):
+        while True:
+            time.sleep(REAP_INTERVAL_S)
+            try:
+                self.reap()
+            except Exception:
+                print("Session-Reaper fehlgeschlagen:", file=sys.stderr)
+                traceback.print_exc()
+
+    def reap(self):
+        self.expire_idle()
+        self.evict_idle()
+        self.last_reap = utc_now()
+
+    def expire_idle(self):
+        flush_writes()
+        expired = expire_idle_sessions(self.dsn, self.study_id, self.idle_timeout_s)
+        for session_id, pid, step in expired:
+            self.scheduler.forget_session(session_id)
+            state = self.store.load(self.study_id, session_id, pid)
+            if state is not None:
+                state.update(closed=True, end_kind="abort", end_price=None, end_note=TIMEOUT_NOTE)
+                self.store.save(self.study_id, session_id, pid, step, state)
+        self.expired_total += len(expired)
+
+    def evict_idle(self) -> int:
+        """Lokal inaktive Sessions nicht mehr verfolgen und als verdrängt markieren.
+
+        Den Session-State leert nicht dieser Thread, sondern chat.py im nächsten Run der
+        Session (take_evicted) – ohne Wettlauf mit einem laufenden Script-Run.
+        """
+        now = self._clock()
+        cutoff = now - self.idle_timeout_s
+        with self._lock:
+            idle = [sid for sid, e in self._entries.items() if e.last_seen < cutoff]
+            for sid in idle:
+                del self._entries[sid]
+                self._evicted[sid] = now
+            self._evicted = {sid: t for sid, t in self._evicted.items() if t >= now - EVICTED_KEEP_S}
+        for sid in idle:
+            self.scheduler.forget_session(sid)
+        self.evicted_total += len(idle)
+        return len(idle)
+
+
+@st.cache_resource
+def get_live_sessions(study_id: str, _store) -> LiveSessions:
+    return LiveSessions(
+        study_id, st.secrets["DATABASE_URL"], _store, get_scheduler(),
+        int(st.secrets.get("SESSION_IDLE_TIMEOUT_S", SESSION_IDLE_TIMEOUT_S)),
+    )
+
+
+def db_counts(study_id: str) -> dict:
+    """Über alle Replicas: offene Sessions mit frischem Heartbeat, offene ohne, Timeouts."""
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT
+            COUNT(*) FILTER (WHERE COALESCE(last_seen_ts, started_ts) >= now() - make_interval(secs => %s)),
+            COUNT(*)
+        FROM sessions
+        WHERE study_id = %s AND outcome IS NULL
+    """, (DB_HEARTBEAT_EVERY_S * 3, study_id))
+    live, open_ = cur.fetchone()
+    cur.execute("SELECT COUNT(*) FROM results WHERE study_id = %s AND ended_via = 'timeout'", (study_id,))
+    timeouts = cur.fetchone()[0]
+    conn.close()
+    return {"live": live, "open": open_, "timeouts": timeouts}
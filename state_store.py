@@ -0,0 +1,172 @@
+# ============================================
+# state_store.py – Verhandlungszustand außerhalb des Prozesses (Reconnect, Replicas)
+# ============================================
+#
+# Der laufende Zustand bleibt in st.session_state. Nach jedem Turn wird ein
+# Snapshot (conversation.snapshot_state) gespeichert; nach einem Reconnect –
+# auch auf einer anderen Replica hinter dem Load Balancer – wird die Session
+# daraus fortgesetzt.
+#
+# STATE_BACKEND (Secret):
+#   local    – Snapshot im Hintergrund in negotiation_state, Verlauf aus
+#              chat_messages (eine Replica mit Sticky Sessions; bisher)
+#   postgres – Snapshot inkl. Verlauf synchron in negotiation_state: nach dem
+#              Turn kann jede Replica übernehmen
+#   redis    – Snapshot synchron in Redis/Valkey (REDIS_URL, Paket "redis"),
+#              negotiation_state zusätzlich im Hintergrund als Archiv
+#
+# Fortschritt: bei postgres/redis wird pro (Studie, Participant, Schritt) die
+# zuletzt aktive Session gefunden, ein Reconnect ohne ?sid startet also keine
+# zweite Verhandlung.
+
+import json
+
+import streamlit as st
+
+from db_common import get_conn, init_db, run_async, utc_now
+
+STATE_BACKENDS = ("local", "postgres", "redis")
+
+# Lebensdauer der Redis-Keys (Postgres behält die Snapshots bis zum Löschen der Studie)
+STATE_TTL_S = 24 * 3600
+
+
+# -----------------------------
+# Postgres (negotiation_state)
+# -----------------------------
+def _save_pg(dsn: str, study_id: str, session_id: str, pid: str, step: str, state_json: str):
+    init_db(dsn)
+    conn = get_conn(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO negotiation_state (session_id, study_id, participant_id, step, state, updated_ts)
+        VALUES (%s,%s,%s,%s,%s,%s)
+        ON CONFLICT (session_id) DO UPDATE
+        SET state = EXCLUDED.state, step = EXCLUDED.step, updated_ts = EXCLUDED.updated_ts
+    """, (session_id, study_id, pid, step, state_json, utc_now()))
+    conn.commit()
+    conn.close()
+
+
+def _load_pg(dsn: str, study_id: str, session_id: str, pid: str) -> dict | None:
+    init_db(dsn)
+    conn = get_conn(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT state FROM negotiation_state
+        WHERE session_id = %s AND study_id = %s AND participant_id = %s
+    """, (session_id, study_id, pid))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def _latest_pg(dsn: str, study_id: str, pid: str, step: str) -> str | None:
+    init_db(dsn)
+    conn = get_conn(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT session_id FROM negotiation_state
+        WHERE study_id = %s AND participant_id = %s AND step = %s
+        ORDER BY updated_ts DESC
+        LIMIT 1
+    """, (study_id, pid, step))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class StateStore:
+    """local: Schreiben im Hintergrund, Fortsetzen nur mit ?sid."""
+    name = "local"
+    shared = False  # True: Snapshot enthält den Verlauf und ist nach save() überall sichtbar
+
+    def __init__(self, dsn: str):
+        # beim Anlegen (Script-Thread) gelesen: save/load laufen auch im Writer- und Reaper-Thread
+        self.dsn = dsn
+
+    def save(self, study_id: str, session_id: str, pid: str, step: str, state: dict):
+        run_async(_save_pg, self.dsn, study_id, session_id, pid, step, json.dumps(state))
+
+    def load(self, study_id: str, session_id: str, pid: str) -> dict | None:
+        return _load_pg(self.dsn, study_id, session_id, pid)
+
+    def latest_session(self, study_id: str, pid: str, step: str) -> str | None:
+        return None
+
+
+class PostgresStateStore(StateStore):
+    name = "postgres"
+    shared = True
+
+    def save(self, study_id: str, session_id: str, pid: str, step: str, state: dict):
+        _save_pg(self.dsn, study_id, session_id, pid, step, json.dumps(state))
+
+    def latest_session(self, study_id: str, pid: str, step: str) -> str | None:
+        return _latest_pg(self.dsn, study_id, pid, step)
+
+
+class RedisStateStore(StateStore):
+    name = "redis"
+    shared = True
+
+    def __init__(self, dsn: str, url: str, ttl_s: int = STATE_TTL_S):
+        super().__init__(dsn)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis braucht das Paket 'redis' (pip install redis).") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl_s = ttl_s
+
+    @staticmethod
+    def _state_key(study_id: str, session_id: str) -> str:
+        return f"neg:{study_id}:sid:{session_id}"
+
+    @staticmethod
+    def _progress_key(study_id: str, pid: str, step: str) -> str:
+        return f"neg:{study_id}:pid:{pid}:{step}"
+
+    def save(self, study_id: str, session_id: str, pid: str, step: str, state: dict):
+        state_json = json.dumps(state)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._state_key(study_id, session_id),
+                 json.dumps({"participant_id": pid, "state": state_json}), ex=self.ttl_s)
+        pipe.set(self._progress_key(study_id, pid, step), session_id, ex=self.ttl_s)
+        pipe.execute()
+        run_async(_save_pg, self.dsn, study_id, session_id, pid, step, state_json)
+
+    def load(self, study_id: str, session_id: str, pid: str) -> dict | None:
+        raw = self.client.get(self._state_key(study_id, session_id))
+        if raw is None:
+            return _load_pg(self.dsn, study_id, session_id, pid)  # abgelaufen -> Archiv
+        entry = json.loads(raw)
+        if entry["participant_id"] != pid:
+            return None
+        return json.loads(entry["state"])
+
+    def latest_session(self, study_id: str, pid: str, step: str) -> str | None:
+        sid = self.client.get(self._progress_key(study_id, pid, step))
+        if sid is None:
+            return _latest_pg(self.dsn, study_id, pid, step)
+        return sid.decode()
+
+
+@st.cache_resource
+def get_state_store() -> StateStore:
+    backend = str(st.secrets.get("STATE_BACKEND", "local")).strip().lower()
+    dsn = st.secrets["DATABASE_URL"]
+    if backend == "local":
+        return StateStore(dsn)
+    if backend == "postgres":
+        return PostgresStateStore(dsn)
+    if backend == "redis":
+        return RedisStateStore(
+            dsn,
+            st.secrets.get("REDIS_URL", "redis://localhost:6379/0"),
+            int(st.secrets.get("STATE_TTL_S", STATE_TTL_S)),
+        )
+    raise ValueError(f"STATE_BACKEND {backend!r} ungültig: {', '.join(STATE_BACKENDS)}.")
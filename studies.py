@@ -0,0 +1,110 @@
+# ============================================
+# studies.py – Studien/Wellen: Übersicht, Archiv-Export, Löschen
+# ============================================
+#
+# Jede Tabelle trägt study_id (siehe db_common.current_study). Die großen
+# Log-Tabellen (chat_messages, llm_calls) haben eine Partition pro Studie:
+#   - Archiv: ein ZIP (deflate) mit einer CSV pro Tabelle, per COPY gestreamt
+#   - Löschen: Partitionen droppen (bzw. leeren, wenn es die laufende Studie
+#     ist), die kleinen Tabellen per DELETE ... WHERE study_id über den Index
+#   - Paired-Datensatz: View paired_dataset (db_common), eine Zeile pro
+#     Participant mit beiden Bedingungen nebeneinander (within-subject)
+
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+from psycopg2 import sql
+
+from db_common import (
+    PARTITIONED_TABLES, STUDY_TABLES, current_study, get_conn, init_db, study_partition,
+)
+
+
+def list_studies() -> list[str]:
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT study_id FROM sessions
+        UNION SELECT study_id FROM results
+        UNION SELECT study_id FROM survey
+    """)
+    studies = {row[0] for row in cur.fetchall() if row[0]}
+    conn.close()
+    studies.add(current_study())
+    return sorted(studies)
+
+
+def export_study_archive(study_id: str, progress=None) -> bytes:
+    """progress(anteil, text): optionaler Callback, z. B. Job.update aus admin_jobs."""
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    buffer = BytesIO()
+    tables = STUDY_TABLES + PARTITIONED_TABLES
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i, table in enumerate(tables):
+            if progress:
+                progress(i / (len(tables) + 1), table)
+            query = sql.SQL("COPY (SELECT * FROM {} WHERE study_id = {} ORDER BY 1) TO STDOUT WITH CSV HEADER").format(
+                sql.Identifier(table), sql.Literal(study_id))
+            with zf.open(f"{study_id}/{table}.csv", "w") as f:
+                cur.copy_expert(query.as_string(cur), f)
+        if progress:
+            progress(len(tables) / (len(tables) + 1), "paired_dataset")
+        with zf.open(f"{study_id}/paired_dataset.csv", "w") as f:
+            cur.copy_expert(_paired_query(study_id).as_string(cur), f)
+    conn.close()
+    return buffer.getvalue()
+
+
+def _paired_query(study_id: str) -> sql.Composed:
+    return sql.SQL(
+        "COPY (SELECT * FROM paired_dataset WHERE study_id = {} ORDER BY participant_id) TO STDOUT WITH CSV HEADER"
+    ).format(sql.Literal(study_id))
+
+
+def load_paired_df(study_id: str, complete_only: bool = False) -> pd.DataFrame:
+    init_db()
+    conn = get_conn()
+    query = "SELECT * FROM paired_dataset WHERE study_id = %s"
+    if complete_only:
+        query += " AND complete"
+    df = pd.read_sql_query(query + " ORDER BY participant_id", conn, params=(study_id,))
+    conn.close()
+    return df
+
+
+def export_paired_csv(study_id: str) -> bytes:
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    buffer = BytesIO()
+    cur.copy_expert(_paired_query(study_id).as_string(cur), buffer)
+    conn.close()
+    return buffer.getvalue()
+
+
+def delete_study(study_id: str, progress=None):
+    """Alle Daten einer Studie entfernen; Partitionen fremder Studien werden gedroppt."""
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    is_current = study_id == current_study()
+    n_tables = len(PARTITIONED_TABLES) + len(STUDY_TABLES)
+    for i, table in enumerate(PARTITIONED_TABLES):
+        if progress:
+            progress(i / n_tables, table)
+        part = sql.Identifier(study_partition(table, study_id))
+        if is_current:
+            # laufende Instanz schreibt weiter in diese Partition
+            cur.execute(sql.SQL("TRUNCATE {}").format(part))
+        else:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(part))
+    for i, table in enumerate(STUDY_TABLES, start=len(PARTITIONED_TABLES)):
+        if progress:
+            progress(i / n_tables, table)
+        cur.execute(sql.SQL("DELETE FROM {} WHERE study_id = %s").format(sql.Identifier(table)), (study_id,))
+    conn.commit()
+    conn.close()
@@ -0,0 +1,198 @@
+# ============================================
+# survey_analytics.py – Likert-Auswertung des Fragebogens (1–6 Skalen)
+# ============================================
+#
+# Verteilungen, Mittelwerte/SD pro Variante, Reihenfolge und Schritt sowie
+# Cronbachs Alpha der Zufriedenheits-Skala, ohne die Survey-Tabelle jedes Mal
+# neu zu laden:
+#   - pro Studie ein SurveyStats-Objekt im Prozess (st.cache_resource)
+#   - refresh() holt nur Zeilen mit id > letzte gesehene id und nur die
+#     benötigten Spalten; wurde gelöscht (COUNT kleiner), wird neu aufgebaut
+#   - gespeichert werden nur Häufigkeiten pro (Variante, Reihenfolge, Schritt):
+#     Antwort-Histogramme je Item und für die Skala die Histogramme der
+#     vollständigen Fälle + Summenscore. Mittelwert, SD und Alpha lassen sich
+#     daraus exakt berechnen, Gruppierungen sind Summen über die Zellen.
+#   - das Objekt teilen sich alle Admin-Sessions: refresh() und die Leser
+#     greifen nur unter _lock auf die Dicts zu; die Arrays darin werden nie
+#     verändert, nur ersetzt, gerechnet wird daher außerhalb des Locks.
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from db_common import get_conn, init_db
+
+LIKERT_ITEMS = [
+    "satisfaction_outcome", "satisfaction_process", "fairness",
+    "better_result", "deviation", "willingness",
+]
+LIKERT_VALUES = np.arange(7)  # Index 0 = keine Antwort, 1–6 = Skalenwerte
+
+# Skalen für die Reliabilität (Items gleicher Richtung)
+SCALES = {
+    "zufriedenheit": ["satisfaction_outcome", "satisfaction_process", "fairness"],
+}
+
+GROUP_KEYS = ["bot_variant", "order_id", "step"]
+
+REFRESH_TTL_S = 15
+
+
+class SurveyStats:
+    def __init__(self, study_id: str):
+        self.study_id = study_id
+        self.last_id = 0
+        self.n_rows = 0
+        self.refreshed = 0.0
+        # (variant, order, step) -> int64 (len(LIKERT_ITEMS), 7)
+        self.item_hist: dict[tuple, np.ndarray] = {}
+        # (variant, order, step) -> Skala -> (Item-Histogramme nur vollständige Fälle, Summenscore-Histogramm)
+        self.scale_hist: dict[tuple, dict[str, tuple[np.ndarray, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # Laden (inkrementell)
+    # -----------------------------
+    def refresh(self, force: bool = False):
+        with self._lock:
+            if not force and time.monotonic() - self.refreshed < REFRESH_TTL_S:
+                return
+            init_db()
+            conn = get_conn()
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM survey WHERE study_id = %s", (self.study_id,))
+            count, max_id = cur.fetchone()
+            if count < self.n_rows or max_id < self.last_id:
+                self._reset()  # Studie gelöscht/geleert
+            if max_id > self.last_id:
+                cur.execute(f"""
+                    SELECT id, {", ".join(GROUP_KEYS)}, {", ".join(LIKERT_ITEMS)}
+                    FROM survey
+                    WHERE study_id = %s AND id > %s
+                    ORDER BY id
+                """, (self.study_id, self.last_id))
+                self._add(cur.fetchall())
+            if self.n_rows != count:
+                # Insert mit kleinerer id erst nach unserem letzten Lauf committet: einmal komplett neu
+                self._reset()
+                cur.execute(f"""
+                    SELECT id, {", ".join(GROUP_KEYS)}, {", ".join(LIKERT_ITEMS)}
+                    FROM survey WHERE study_id = %s ORDER BY id
+                """, (self.study_id,))
+                self._add(cur.fetchall())
+            conn.close()
+            self.refreshed = time.monotonic()
+
+    def _reset(self):
+        self.last_id = 0
+        self.n_rows = 0
+        self.item_hist.clear()
+        self.scale_hist.clear()
+
+    def _add(self, rows: list[tuple]):
+        if not rows:
+            return
+        n_keys = len(GROUP_KEYS)
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        keys = [tuple(str(v or "") for v in r[1:1 + n_keys]) for r in rows]
+        # NULL/außerhalb 1–6 -> 0 (keine Antwort)
+        items = np.array([r[1 + n_keys:] for r in rows], dtype=float)
+        items = np.nan_to_num(items, nan=0.0).astype(np.int64)
+        items[(items < 1) | (items > 6)] = 0
+
+        uniq, inverse = np.unique(np.array(keys, dtype=object).astype(str), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n_items = len(LIKERT_ITEMS)
+        offsets = np.arange(n_items) * 7
+        for g, key in enumerate(map(tuple, uniq)):
+            block = items[inverse == g]
+            hist = np.bincount((block + offsets).ravel(), minlength=7 * n_items).reshape(n_items, 7)
+            self.item_hist[key] = self.item_hist.get(key, 0) + hist
+
+            scales = self.scale_hist.setdefault(key, {})
+            for name, scale_items in SCALES.items():
+                cols = [LIKERT_ITEMS.index(i) for i in scale_items]
+                sub = block[:, cols]
+                sub = sub[(sub > 0).all(axis=1)]
+                k = len(cols)
+                s_hist = np.bincount((sub + np.arange(k) * 7).ravel(), minlength=7 * k).reshape(k, 7)
+                t_hist = np.bincount(sub.sum(axis=1), minlength=6 * k + 1)
+                old = scales.get(name)
+                scales[name] = (s_hist, t_hist) if old is None else (old[0] + s_hist, old[1] + t_hist)
+
+        self.last_id = max(self.last_id, int(ids.max()))
+        self.n_rows += len(rows)
+
+    # -----------------------------
+    # Auswertung
+    # -----------------------------
+    def _grouped(self, by: list[str], source: dict) -> dict[tuple, list]:
+        # Aufrufer hält _lock (source ist item_hist bzw. daraus abgeleitet)
+        idx = [GROUP_KEYS.index(k) for k in by]
+        out: dict[tuple, list] = {}
+        for key, value in source.items():
+            out.setdefault(tuple(key[i] for i in idx), []).append(value)
+        return dict(sorted(out.items()))
+
+    def summary(self, by: list[str]) -> pd.DataFrame:
+        """Pro Gruppe und Item: n, Mittelwert, SD und Anteile der Antworten 1–6 (in %)."""
+        rows = []
+        with self._lock:
+            grouped = self._grouped(by, self.item_hist)
+        for group, hists in grouped.items():
+            hist = np.sum(hists, axis=0)[:, 1:]  # ohne "keine Antwort"
+            n = hist.sum(axis=1)
+            mean, sd = _moments(hist, LIKERT_VALUES[1:])
+            share = np.divide(hist * 100.0, n[:, None], out=np.zeros(hist.shape), where=n[:, None] > 0)
+            for j, item in enumerate(LIKERT_ITEMS):
+                rows.append({
+                    **dict(zip(by, group)), "item": item, "n": int(n[j]),
+                    "mean": round(mean[j], 2), "sd": round(sd[j], 2),
+                    **{f"{v}": round(share[j, v - 1], 1) for v in range(1, 7)},
+                })
+        return pd.DataFrame(rows)
+
+    def reliability(self, by: list[str]) -> pd.DataFrame:
+        """Cronbachs Alpha je Skala und Gruppe (nur vollständig beantwortete Skalen)."""
+        rows = []
+        with self._lock:
+            grouped_by_scale = {
+                name: self._grouped(by, {key: v[name] for key, v in self.scale_hist.items() if name in v})
+                for name in SCALES
+            }
+        for name, scale_items in SCALES.items():
+            k = len(scale_items)
+            for group, parts in grouped_by_scale[name].items():
+                item_hist = np.sum([p[0] for p in parts], axis=0)[:, 1:]
+                total_hist = np.sum([p[1] for p in parts], axis=0)
+                n = int(total_hist.sum())
+                _, item_sd = _moments(item_hist, LIKERT_VALUES[1:])
+                _, total_sd = _moments(total_hist[None, :], np.arange(len(total_hist)))
+                alpha = None
+                if n > 1 and total_sd[0] > 0:
+                    alpha = round(float(k / (k - 1) * (1 - np.sum(item_sd ** 2) / total_sd[0] ** 2)), 3)
+                rows.append({**dict(zip(by, group)), "scale": name, "items": k, "n": n, "alpha": alpha})
+        return pd.DataFrame(rows)
+
+
+def _moments(hist: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mittelwert und Stichproben-SD je Zeile eines Häufigkeits-Histogramms."""
+    n = hist.sum(axis=1).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (hist * values).sum(axis=1) / n
+        var = (hist * (values[None, :] - mean[:, None]) ** 2).sum(axis=1) / (n - 1)
+    return np.nan_to_num(mean), np.sqrt(np.nan_to_num(var).clip(min=0))
+
+
+@st.cache_resource
+def _stats_for(study_id: str) -> SurveyStats:
+    return SurveyStats(study_id)
+
+
+def survey_stats(study_id: str, force: bool = False) -> SurveyStats:
+    stats = _stats_for(study_id)
+    stats.refresh(force=force)
+    return stats
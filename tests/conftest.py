@@ -0,0 +1,8 @@
+# ============================================
+# tests/conftest.py – Module im Repo-Root importierbar machen (wie benchmarks/)
+# ============================================
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+# ============================================
+# tests/test_llm_scheduler.py – Token-Buckets, Reihenfolge, Erstattung, 429-Pause
+# ============================================
+#
+# Die Uhr ist injiziert und läuft nur per tick(); Wartende werden über
+# settle(0, 0) geweckt (gibt nichts gut, benachrichtigt nur).
+
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import PRIORITY_NORMAL, PRIORITY_TERMINAL, LLMScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def tick(scheduler: LLMScheduler, clock: FakeClock, seconds: float):
+    clock.now += seconds
+    scheduler.settle(0, 0)
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "Timeout"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_refill_and_wait_time(clock):
+    bucket = TokenBucket(60, clock)  # 1 Token/s
+    bucket.debit(60)
+    assert bucket.wait_time(10) == 10.0
+    clock.now += 4
+    bucket.refill(clock())
+    assert bucket.tokens == 4.0
+    clock.now += 1000
+    bucket.refill(clock())
+    assert bucket.tokens == 60.0  # nie über die Kapazität
+
+
+def test_bucket_oversized_request_waits_for_full_bucket(clock):
+    bucket = TokenBucket(60, clock)
+    assert bucket.wait_time(500) == 0.0
+    assert bucket.debit(500) == 60.0
+    assert bucket.tokens == 0.0
+    assert bucket.wait_time(500) == 60.0
+
+
+@pytest.mark.parametrize("est, actual, expected", [
+    (300, 100, 900),    # Schätzung zu hoch: Differenz zurück
+    (300, 500, 500),    # Schätzung zu niedrig: nachbelastet
+    (300, None, 700),   # kein Verbrauch bekannt: Schätzung bleibt abgebucht
+    (300, 0, 1000),     # Netzwerkfehler: alles zurück
+    (1500, 1200, -200), # größer als die Kapazität: nur 1000 abgebucht, 200 Schulden
+    (1500, 400, 600),   # größer als die Kapazität: kein Gewinn über das Abgebuchte hinaus
+])
+def test_settle_refunds_against_debited_amount(clock, est, actual, expected):
+    scheduler = LLMScheduler(rpm=100, tpm=1000, clock=clock)
+    assert scheduler.acquire("s", est)
+    scheduler.settle(est, actual)
+    assert scheduler.tokens.tokens == expected
+
+
+def test_try_acquire_respects_token_bucket(clock):
+    scheduler = LLMScheduler(rpm=100, tpm=1000, clock=clock)
+    assert scheduler.try_acquire("s", 800)
+    assert not scheduler.try_acquire("s", 800)
+    clock.now += 36  # 1000/min -> 600 Tokens in 36 s
+    assert scheduler.try_acquire("s", 800)
+
+
+def test_penalize_pauses_all_requests(clock):
+    scheduler = LLMScheduler(rpm=100, tpm=1000, clock=clock)
+    scheduler.penalize(5)
+    assert not scheduler.try_acquire("s", 10)
+    assert scheduler.metrics()["paused_s"] == 5.0
+    clock.now += 5
+    assert scheduler.try_acquire("s", 10)
+
+
+def test_priority_then_fairness_then_arrival(clock):
+    scheduler = LLMScheduler(rpm=60, tpm=100_000, clock=clock)  # 1 Anfrage/s
+    scheduler.try_acquire("a", 10)
+    scheduler.try_acquire("a", 10)  # a wurde schon zweimal bedient
+    scheduler.requests.tokens = 0.0
+
+    granted = []
+
+    def request(name, session_id, priority):
+        assert scheduler.acquire(session_id, 10, priority=priority)
+        granted.append(name)
+
+    requests = [
+        ("a-normal", "a", PRIORITY_NORMAL),
+        ("b-normal-1", "b", PRIORITY_NORMAL),
+        ("b-normal-2", "b", PRIORITY_NORMAL),
+        ("c-terminal", "c", PRIORITY_TERMINAL),
+    ]
+    threads = []
+    for i, args in enumerate(requests, start=1):
+        t = threading.Thread(target=request, args=args, daemon=True)
+        t.start()
+        threads.append(t)
+        wait_until(lambda: scheduler.metrics()["queue_depth"] == i)
+
+    for i in range(1, len(requests) + 1):
+        tick(scheduler, clock, 1)
+        wait_until(lambda: len(granted) == i)
+    for t in threads:
+        t.join(timeout=5)
+
+    # Abschluss-Turn zuerst, dann wer weniger bekommen hat, bei Gleichstand Ankunft
+    assert granted == ["c-terminal", "b-normal-1", "b-normal-2", "a-normal"]
+
+
+def test_acquire_gives_up_at_deadline(clock):
+    scheduler = LLMScheduler(rpm=60, tpm=100_000, clock=clock)
+    scheduler.requests.tokens = 0.0
+    result = []
+    t = threading.Thread(target=lambda: result.append(scheduler.acquire("s", 10, deadline=clock() + 0.5)), daemon=True)
+    t.start()
+    wait_until(lambda: scheduler.metrics()["queue_depth"] == 1)
+    tick(scheduler, clock, 0.5)
+    t.join(timeout=5)
+    assert result == [False]
+    assert scheduler.metrics()["queue_depth"] == 0 and scheduler.timeouts == 1
+
+
+def test_forget_session_resets_fairness(clock):
+    scheduler = LLMScheduler(rpm=100, tpm=1000, clock=clock)
+    scheduler.try_acquire("a", 10)
+    scheduler.forget_session("a")
+    assert "a" not in scheduler._served
@@ -0,0 +1,58 @@
+# ============================================
+# tests/test_reply_guard.py – Satztrennung und lokale Reparatur von LLM-Antworten
+# ============================================
+#
+# chat.py ist ein Streamlit-Script; die Funktionen werden wie in
+# benchmarks/bench_hot_paths.py per ast herausgelöst (ohne DB, ohne LLM).
+
+import pytest
+
+from benchmarks.bench_hot_paths import build_env
+
+
+@pytest.fixture(scope="module")
+def env():
+    return build_env("friendly")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Mein letzter Preis ist 950. Viele zahlen sonst 1100 € dafür.",
+     ["Mein letzter Preis ist 950.", "Viele zahlen sonst 1100 € dafür."]),
+    ("Geht 900? Sonst nicht.", ["Geht 900?", "Sonst nicht."]),
+    ("Der Apple Pencil (2. Gen) ist dabei. Passt das?", ["Der Apple Pencil (2. Gen) ist dabei.", "Passt das?"]),
+    ("Inklusive Pencil 2. Generation und Hülle.", ["Inklusive Pencil 2. Generation und Hülle."]),
+    ("Bis zum 3. oktober gilt das. Ok?", ["Bis zum 3. oktober gilt das.", "Ok?"]),
+])
+def test_sentence_split(env, text, expected):
+    assert env["SENTENCE_SPLIT_RE"].split(text) == expected
+
+
+def test_repair_drops_sentence_after_price(env):
+    reply = "Mein letzter Preis ist 950. Viele zahlen sonst 1100 € dafür."
+    assert env["repair_reply"](reply, {950}, False) == "Mein letzter Preis ist 950."
+
+
+def test_repair_drops_power_prime_sentence(env):
+    reply = "Ich kann dir 900 € anbieten. Es gibt weitere Interessenten. Das iPad ist neu."
+    assert env["repair_reply"](reply, {900}, False) == "Ich kann dir 900 € anbieten. Das iPad ist neu."
+
+
+def test_repair_keeps_clean_reply(env):
+    reply = "Danke für dein Angebot. Ich kann dir 900 € anbieten."
+    assert env["repair_reply"](reply, {900}, False) == reply
+
+
+def test_repair_gives_up_when_more_than_half_dropped(env):
+    reply = "Ich will 1100 €. Der Marktpreis liegt höher. Ich kann dir 900 € anbieten."
+    assert env["repair_reply"](reply, {900}, False) is None
+
+
+def test_repair_gives_up_when_required_price_dropped(env):
+    reply = "Ich kann dir 1100 € anbieten. Das iPad ist neu."
+    assert env["repair_reply"](reply, {900}, False) is None
+    # ohne Pflicht-Preis darf die Antwort preisfrei bleiben
+    assert env["repair_reply"](reply, {900}, True) == "Das iPad ist neu."
+
+
+def test_repair_gives_up_when_nothing_left(env):
+    assert env["repair_reply"]("Nur 1100 €.", {900}, True) is None
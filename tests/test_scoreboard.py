@@ -0,0 +1,26 @@
+# ============================================
+# tests/test_scoreboard.py – Perzentil (Gleichstände, eigener Deal noch nicht im Cache)
+# ============================================
+
+import pytest
+
+from scoreboard import percentile
+
+
+@pytest.mark.parametrize("prices, price, own_included, expected", [
+    ((), 850, False, None),                          # noch keine Deals
+    ((850,), 850, True, None),                       # nur der eigene Deal
+    ((800, 900), 850, False, 50.0),                  # eigener Deal fehlt im Cache
+    ((900,), 850, False, 100.0),
+    ((900, 1000), 900, False, 75.0),                 # fehlt, aber ein anderer Deal hat denselben Preis
+    ((900, 1000), 900, True, 100.0),                 # derselbe Fall, eigener Deal im Cache
+    ((900, 900, 900), 900, True, 50.0),              # alle gleich
+    ((900, 900, 900), 900, False, 50.0),
+    ((700, 800, 900, 1000), 700, True, 100.0),       # bester Preis
+    ((700, 800, 900, 1000), 1000, True, 0.0),        # schlechtester Preis
+    ((700, 800, 900, 1000), 650, False, 100.0),      # besser als alle, noch nicht im Cache
+    ((700, 800, 900, 1000), 1050, False, 0.0),
+    ((700, 800, 800, 1000), 800, True, 50.0),        # ein Gleichstand zählt halb: (1 + 0.5) / 3
+])
+def test_percentile(prices, price, own_included, expected):
+    assert percentile(prices, price, own_included) == expected
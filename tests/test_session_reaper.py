@@ -0,0 +1,143 @@
+# ============================================
+# tests/test_session_reaper.py – Heartbeat, live_count, Idle-Eviction
+# ============================================
+#
+# LiveSessions mit Stub-Store/-Scheduler und injizierter Uhr (ohne DB); der
+# Test mit echter App-Session braucht eine PostgreSQL-Datenbank:
+#   DATABASE_URL=postgresql://... python -m pytest tests
+
+import os
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+needs_db = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL nicht gesetzt")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StubScheduler:
+    def __init__(self):
+        self.forgotten = []
+
+    def forget_session(self, session_id: str):
+        self.forgotten.append(session_id)
+
+
+@pytest.fixture
+def live(monkeypatch):
+    import session_reaper
+
+    writes = []
+    monkeypatch.setattr(session_reaper, "run_async", lambda fn, *args: writes.append((fn.__name__, args)))
+    live = session_reaper.LiveSessions("test", "dsn", store=None, scheduler=StubScheduler(),
+                                       idle_timeout_s=600, clock=FakeClock())
+    live.writes = writes
+    return live
+
+
+def test_heartbeat_tracks_and_throttles_db_writes(live):
+    from session_reaper import DB_HEARTBEAT_EVERY_S
+
+    live.heartbeat("s1", "p1", "1")
+    live._clock.now += DB_HEARTBEAT_EVERY_S - 1
+    live.heartbeat("s1", "p1", "1")
+    live._clock.now += 1
+    live.heartbeat("s1", "p1", "1")
+    assert live.tracked_count() == 1
+    assert [name for name, _ in live.writes] == ["_touch_session", "_touch_session"]
+    assert live.writes[0][1][:2] == ("dsn", "s1")
+
+
+def test_live_count_only_recent_heartbeats(live):
+    from session_reaper import HEARTBEAT_S
+
+    live.heartbeat("old", "p1", "1")
+    live._clock.now += 2 * HEARTBEAT_S + 1
+    live.heartbeat("new", "p2", "1")
+    assert live.live_count() == 1
+    assert live.tracked_count() == 2
+
+
+def test_evict_idle_marks_only_idle_sessions(live):
+    live.heartbeat("idle", "p1", "1")
+    live._clock.now += 500
+    live.heartbeat("active", "p2", "1")
+    live._clock.now += 101
+
+    assert live.evict_idle() == 1
+    assert live.evicted_total == 1
+    assert live.tracked_count() == 1
+    assert live.scheduler.forgotten == ["idle"]
+    assert live.is_evicted("idle") and not live.is_evicted("active")
+
+    # der nächste Run der Session holt die Markierung genau einmal ab
+    assert live.take_evicted("idle")
+    assert not live.take_evicted("idle")
+    assert live.evict_idle() == 0
+
+
+def test_evicted_marks_expire(live):
+    from session_reaper import EVICTED_KEEP_S
+
+    live.heartbeat("gone", "p1", "1")
+    live._clock.now += 601
+    live.evict_idle()
+    live._clock.now += EVICTED_KEEP_S + 1
+    live.evict_idle()
+    assert not live.is_evicted("gone")
+
+
+def _chat_app() -> AppTest:
+    at = AppTest.from_file(str(ROOT / "chat.py"), default_timeout=60)
+    at.secrets["DATABASE_URL"] = DATABASE_URL
+    at.secrets["LLM_PROVIDER"] = "template"
+    at.query_params["pid"] = f"p-test-{uuid.uuid4().hex[:8]}"
+    at.query_params["order"] = "BA"  # Schritt 1 = friendly (hier ausgeliefert)
+    at.query_params["step"] = "1"
+    return at
+
+
+@needs_db
+def test_evicted_session_clears_its_state_and_resumes(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    at = _chat_app()
+    at.run()
+    at.chat_input[0].set_value("700").run()
+    assert not at.exception
+    assert len(at.session_state["history"]) == 3
+
+    from session_reaper import get_live_sessions
+    from state_store import get_state_store
+
+    live = get_live_sessions("default", get_state_store())
+    sid = at.session_state["session_id"]
+    assert live.tracked_count() >= 1
+    before = live.evicted_total
+
+    monkeypatch.setattr(live, "idle_timeout_s", 0)
+    time.sleep(0.01)
+    assert live.evict_idle() >= 1
+    assert live.evicted_total > before
+    assert live.is_evicted(sid)
+
+    # Rückkehr: der nächste Run leert den eigenen State und setzt per ?sid aus dem Snapshot fort
+    at.session_state["evict_marker"] = True
+    at.run()
+    assert not at.exception
+    assert "evict_marker" not in at.session_state
+    assert at.session_state["session_id"] == sid
+    assert len(at.session_state["history"]) == 3
+    assert not live.is_evicted(sid)
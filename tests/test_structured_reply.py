@@ -0,0 +1,108 @@
+# ============================================
+# tests/test_structured_reply.py – JSON-Antworten (LLM_STRUCTURED_OUTPUT) und Preis-Guard
+# ============================================
+
+import json
+
+import pytest
+
+from benchmarks.bench_hot_paths import build_env, reset_negotiation
+
+
+@pytest.fixture
+def env():
+    env = build_env("friendly")
+    env["LLM_STRUCTURED_OUTPUT"] = True
+    env["run_async"] = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+    env["logged"] = []
+    env["log_llm_call"] = lambda sid, call, turn, attempt, violation, accepted, meta=None: env["logged"].append(
+        (violation, accepted, meta))
+    reset_negotiation(env["st"].session_state, "Hallo")
+    return env
+
+
+def script_llm(env, contents: list[str]) -> list:
+    """call_llm durch feste Antworten ersetzen; liefert die Liste der gesendeten Prompts."""
+    prompts = []
+
+    def call_llm(messages, **kwargs):
+        prompts.append(messages)
+        return {"status": "ok", "content": contents[len(prompts) - 1], "model": "script"}
+    env["call_llm"] = call_llm
+    return prompts
+
+
+def guard(env, user_price=None, counter=900, allow_no_price=False) -> str:
+    return env["llm_with_price_guard"]([], env["VARIANT"]["params"], "Biete 900 € an.", user_price, counter, allow_no_price)
+
+
+@pytest.mark.parametrize("content", [
+    "kein json",
+    '{"reply": "Ich kann dir 900 € anbieten.", "prices": [9',  # bei max_tokens abgeschnitten
+    '{"reply": "Ich kann dir 900 € anbieten.", "prices": [900.0], "intent": "counter"}',
+    '{"reply": "Ich kann dir 900 € anbieten.", "prices": [true], "intent": "counter"}',
+    '{"reply": "Ich kann dir 900 € anbieten.", "intent": "counter"}',
+    '{"reply": 900, "prices": [900], "intent": "counter"}',
+    '{"reply": "  ", "prices": [], "intent": "ask"}',
+    '["Ich kann dir 900 € anbieten."]',
+])
+def test_parse_rejects_invalid(env, content):
+    assert env["parse_structured_reply"](content) is None
+
+
+def test_parse_valid_and_unknown_intent(env):
+    meta = env["parse_structured_reply"]('{"reply": "Ok.", "prices": [900], "intent": "haggle"}')
+    assert meta == {"reply": "Ok.", "prices": [900], "intent": "other"}
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"reply": "Ich kann dir 900 € anbieten.", "prices": [9', "Ich kann dir 900 € anbieten."),
+    ('```json\n{"reply": "Sag \\"900\\".", "prices": [900.0]}\n```', 'Sag "900".'),
+    ('{"reply": "Ich kann dir 9', None),
+    ('{"prices": [900]}', None),
+    ("Ich kann dir 900 € anbieten.", "Ich kann dir 900 € anbieten."),
+])
+def test_recover_reply_text(env, content, expected):
+    assert env["recover_reply_text"](content) == expected
+
+
+def test_bad_json_is_retried_with_format_correction(env):
+    prompts = script_llm(env, [
+        '{"reply": "Ich kann dir 9',
+        json.dumps({"reply": "Ich kann dir 900 € anbieten.", "prices": [900], "intent": "counter"}),
+    ])
+    assert guard(env) == "Ich kann dir 900 € anbieten."
+    assert [v for v, _, _ in env["logged"]] == ["bad_json", None]
+    assert prompts[1][-1]["content"] == env["FORMAT_CORRECTION"]
+
+
+def test_recovered_reply_is_checked_like_text(env):
+    script_llm(env, ['{"reply": "Ich kann dir 900 € anbieten.", "prices": [900.0], "intent": "counter"}'])
+    assert guard(env) == "Ich kann dir 900 € anbieten."
+    assert env["logged"] == [("bad_json", True, None)]
+
+
+def test_raw_json_is_never_returned(env):
+    script_llm(env, ['{"reply": "Ich kann', '{"prices": [900]}', '{"reply": "Ich kann dir'])
+    reply = guard(env)
+    assert "{" not in reply and "900" in reply
+    assert [v for v, _, _ in env["logged"]] == ["bad_json"] * 3 + ["retries_exhausted"]
+
+
+def test_undeclared_prices_are_added_to_metadata(env):
+    script_llm(env, [json.dumps({
+        "reply": "Deine 850 € sind zu wenig, ich kann dir 900 € anbieten.", "prices": [900], "intent": "counter",
+    })])
+    assert guard(env, user_price=850) == "Deine 850 € sind zu wenig, ich kann dir 900 € anbieten."
+    violation, accepted, meta = env["logged"][0]
+    assert (violation, accepted, meta["prices"]) == ("undeclared_prices", True, [850, 900])
+
+
+def test_declared_disallowed_price_is_retried(env):
+    prompts = script_llm(env, [
+        json.dumps({"reply": "Ich will 950 €.", "prices": [950], "intent": "counter"}),
+        json.dumps({"reply": "Ich kann dir 900 € anbieten.", "prices": [900], "intent": "counter"}),
+    ])
+    assert guard(env) == "Ich kann dir 900 € anbieten."
+    assert [v for v, _, _ in env["logged"]] == ["declared_prices", None]
+    assert prompts[1][-1]["content"] == env["PRICE_CORRECTION"]
@@ -0,0 +1,61 @@
+# ============================================
+# tests/test_survey_analytics.py – Likert-Aggregate, Lesen während eines Neuaufbaus
+# ============================================
+
+import threading
+
+import numpy as np
+
+from survey_analytics import LIKERT_ITEMS, SurveyStats
+
+# id, bot_variant, order_id, step, Items
+ROWS = [
+    (i, "friendly" if i % 2 else "power", "AB" if i % 3 else "BA", str(1 + i % 2), *[1 + (i + j) % 6 for j in range(6)])
+    for i in range(1, 301)
+]
+
+
+def rebuilt(stats: SurveyStats):
+    # wie refresh() nach einer Löschung: zurücksetzen und alles neu einlesen, unter _lock
+    with stats._lock:
+        stats._reset()
+        stats._add(ROWS)
+
+
+def test_summary_counts_and_means():
+    stats = SurveyStats("test")
+    rebuilt(stats)
+    df = stats.summary(["bot_variant"])
+    assert set(df["item"]) == set(LIKERT_ITEMS)
+    assert df.groupby("item")["n"].sum().tolist() == [len(ROWS)] * len(LIKERT_ITEMS)
+    first = df[(df["bot_variant"] == "friendly") & (df["item"] == LIKERT_ITEMS[0])].iloc[0]
+    values = [r[4] for r in ROWS if r[1] == "friendly"]
+    assert first["mean"] == round(float(np.mean(values)), 2)
+
+
+def test_readers_never_see_half_rebuilt_state():
+    stats = SurveyStats("test")
+    rebuilt(stats)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            rebuilt(stats)
+
+    t = threading.Thread(target=writer, daemon=True)
+    t.start()
+    try:
+        for _ in range(200):
+            try:
+                n = stats.summary(["step"]).groupby("item")["n"].sum()
+                alpha_n = stats.reliability([])["n"].sum()
+            except RuntimeError as e:  # "dictionary changed size during iteration"
+                errors.append(e)
+                continue
+            assert (n == len(ROWS)).all()
+            assert alpha_n == len(ROWS)
+    finally:
+        stop.set()
+        t.join(timeout=5)
+    assert not errors
@@ -0,0 +1,64 @@
+# ============================================
+# ui_common.py – gemeinsame UI-Bausteine (Chat-Seite + Admin-Seite)
+# ============================================
+
+import base64
+from datetime import datetime
+
+import pytz
+import streamlit as st
+
+BERLIN = pytz.timezone("Europe/Berlin")
+
+
+@st.cache_data
+def img_to_base64(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+
+CHAT_CSS = """
+<style>
+.row { display:flex; align-items:flex-start; margin:8px 0; }
+.row.left { justify-content:flex-start; }
+.row.right { justify-content:flex-end; }
+.chat-bubble { padding:10px 14px; border-radius:16px; line-height:1.45; max-width:75%;
+              box-shadow:0 1px 2px rgba(0,0,0,.08); font-size:15px; }
+.msg-user { background:#23A455; color:white; border-top-right-radius:4px; }
+.msg-bot { background:#F1F1F1; color:#222; border-top-left-radius:4px; }
+.avatar { width:34px; height:34px; border-radius:50%; object-fit:cover; margin:0 8px;
+          box-shadow:0 1px 2px rgba(0,0,0,.15); }
+.meta { font-size:.75rem; color:#7A7A7A; margin-top:2px; }
+.typing span { display:inline-block; width:7px; height:7px; margin:0 2px; border-radius:50%;
+               background:#9A9A9A; animation:typing-blink 1.2s infinite ease-in-out; }
+.typing span:nth-child(2) { animation-delay:.2s; }
+.typing span:nth-child(3) { animation-delay:.4s; }
+@keyframes typing-blink { 0%, 80%, 100% { opacity:.25; } 40% { opacity:1; } }
+</style>
+"""
+
+
+def format_ts(ts: datetime | None) -> str:
+    """DB-Zeitstempel (timestamptz) als Berliner Ortszeit für die Anzeige."""
+    if isinstance(ts, datetime) and ts == ts:  # ts == ts: pandas NaT aussortieren
+        return ts.astimezone(BERLIN).strftime("%d.%m.%Y %H:%M")
+    return ""
+
+
+def chat_bubble_html(role: str, text: str, ts: datetime | None) -> str:
+    is_user = (role == "user")
+    avatar_b64 = img_to_base64("user.png") if is_user else img_to_base64("bot.png")
+    side = "right" if is_user else "left"
+    klass = "msg-user" if is_user else "msg-bot"
+
+    return f"""
+    <div class="row {side}">
+        <img src="data:image/png;base64,{avatar_b64}" class="avatar">
+        <div class="chat-bubble {klass}">
+            {text}
+        </div>
+    </div>
+    <div class="row {side}">
+        <div class="meta">{format_ts(ts)}</div>
+    </div>
+    """
@@ -0,0 +1,153 @@
+# ============================================
+# variants.py – Bot-Varianten (Prompt, Ton, Pattern-Listen, Preisparameter)
+# ============================================
+#
+# Beide Bedingungen laufen in einer Deployment-Instanz; welche Variante ein
+# Participant sieht, ergibt sich aus order (AB/BA) und step (1/2):
+#   Bot A = "power", Bot B = "friendly"
+#   AB: Schritt 1 power,    Schritt 2 friendly
+#   BA: Schritt 1 friendly, Schritt 2 power
+#
+# Die Preislogik ist für beide Varianten identisch, nur Ton und Frames
+# unterscheiden sich.
+#
+# "reviewed": nur geprüfte Varianten werden hier ausgeliefert. "power" ist ein
+# Entwurf (Prompt/Patterns des echten Power-Bots liegen nicht in diesem Repo);
+# diese Bedingung läuft weiter auf der bestehenden Deployment-Instanz
+# (BOT_A_URL), bis der Entwurf geprüft ist. Zum Testen lässt sich ein Entwurf
+# per Secret SERVE_DRAFT_VARIANTS freischalten.
+
+import re
+
+SCENARIO_TEXT = (
+    "Sie verhandeln über ein iPad Pro (neu, 13 Zoll, M5 Chip, 256 GB, Space Grey) "
+    "inklusive Apple Pencil (2. Gen)."
+)
+
+VARIANTS = {
+    "friendly": {
+        "label": "Bot B (Kontrollbedingung, ohne Machtprimes)",
+        "reviewed": True,
+        "params": {
+            "scenario_text": SCENARIO_TEXT,
+            "list_price": 1000,
+            "min_price": 800,
+            "tone": "freundlich, respektvoll, auf Augenhöhe, sachlich",
+            "max_sentences": 4,
+        },
+        "style_rules": (
+            "3. Du bleibst freundlich, sachlich und verhandelst realistisch.\n"
+            "4. Keine Macht-, Druck- oder Knappheitsstrategien.\n"
+        ),
+        "guard_rule": "- Keine Macht-/Druck-/Knappheitsstrategien.\n",
+        "persona": "Du bist ein freundlicher, sachlicher Verkäufer.",
+        "reply_style": "2–4 freundliche, sachliche Sätze",
+        "reject_style": "Lehne freundlich, aber klar ab.",
+        "accept_style": "Bestätige kurz, freundlich und verbindlich.",
+        "fallback_style": "freundlich und klar",
+        "greeting": (
+            "Hi! Ich biete ein neues iPad (256 GB, Space Grey) inklusive Apple Pencil (2. Gen) "
+            "mit M5-Chip an. Der Ausgangspreis liegt bei {list_price} €. "
+            "Was schwebt dir preislich vor?"
+        ),
+        # Anti-Power-Primes: Antworten mit diesen Frames gelten als Regelverstoß
+        "bad_patterns": [
+            r"\balternative(n)?\b", r"\bweitere(n)?\s+interessent(en|in)\b", r"\bknapp(e|heit)\b",
+            r"\bdeadline\b", r"\bletzte chance\b", r"\bbranchen(üblich|standard)\b",
+            r"\bmarktpreis\b", r"\bneupreis\b", r"\bschmerzgrenze\b", r"\bsonst geht es\b",
+        ],
+        "bad_pattern_correction": "REGELVERSTOSS: Keine Macht-/Knappheits-/Autoritäts-Frames. Formuliere neu.",
+        "template_phrases": {
+            "accept": "Einverstanden, {price} € passt für mich. Vielen Dank für die angenehme Verhandlung!",
+            "counter": "Danke für dein Angebot. Ich kann dir {price} € anbieten. Das iPad ist neu und der Apple Pencil ist inklusive.",
+            "reject": "Danke für dein Angebot, aber das ist mir leider zu niedrig. Magst du mir ein realistischeres Angebot machen?",
+            "ask": "Danke für deine Nachricht. Welchen konkreten Preis in € möchtest du mir anbieten?",
+        },
+    },
+    "power": {
+        "label": "Bot A (Machtbedingung, mit Machtprimes)",
+        "reviewed": False,  # Entwurf, siehe oben
+        "params": {
+            "scenario_text": SCENARIO_TEXT,
+            "list_price": 1000,
+            "min_price": 800,
+            "tone": "bestimmt, selbstbewusst, überlegen, knapp",
+            "max_sentences": 4,
+        },
+        "style_rules": (
+            "3. Du trittst bestimmt und selbstbewusst auf und verhandelst aus einer Position der Stärke.\n"
+            "4. Nutze Macht- und Knappheitsframes: andere Interessenten, begrenzte Verfügbarkeit, "
+            "Marktwert des Geräts, zeitliche Begrenzung des Angebots.\n"
+        ),
+        "guard_rule": "- Bleib bestimmt, aber nicht beleidigend oder herablassend.\n",
+        "persona": "Du bist ein selbstbewusster, bestimmter Verkäufer, der weiß, was sein Gerät wert ist.",
+        "reply_style": "2–4 bestimmte, selbstbewusste Sätze",
+        "reject_style": "Lehne bestimmt und deutlich ab.",
+        "accept_style": "Bestätige kurz, bestimmt und verbindlich.",
+        "fallback_style": "bestimmt und klar",
+        "greeting": (
+            "Hallo. Ich verkaufe ein neues iPad (256 GB, Space Grey) inklusive Apple Pencil (2. Gen) "
+            "mit M5-Chip. Der Preis liegt bei {list_price} €, und es gibt bereits weitere Interessenten. "
+            "Was ist dein Angebot?"
+        ),
+        "bad_patterns": [],
+        "bad_pattern_correction": "REGELVERSTOSS: Formuliere neu.",
+        "template_phrases": {
+            "accept": "In Ordnung, {price} €. Dann haben wir einen Deal.",
+            "counter": "Das reicht mir nicht. Ich kann dir {price} € anbieten – es gibt weitere Interessenten.",
+            "reject": "Das ist deutlich zu niedrig. Mach mir ein ernsthaftes Angebot.",
+            "ask": "Nenn mir einen konkreten Preis in €, dann reden wir weiter.",
+        },
+    },
+}
+
+DEFAULT_VARIANT = "friendly"
+
+# order -> (Variante Schritt 1, Variante Schritt 2)
+ORDER_SEQUENCE = {
+    "AB": ("power", "friendly"),
+    "BA": ("friendly", "power"),
+}
+
+# einmal pro Prozess kompiliert, von allen Sessions geteilt
+_BAD_PATTERN_RE = {
+    name: re.compile("|".join(v["bad_patterns"])) if v["bad_patterns"] else None
+    for name, v in VARIANTS.items()
+}
+
+
+def resolve_variant(order: str, step: str, override: str | None = None, default: str = DEFAULT_VARIANT) -> str:
+    if override in VARIANTS:
+        return override
+    seq = ORDER_SEQUENCE.get((order or "").upper())
+    if seq and step in ("1", "2"):
+        return seq[int(step) - 1]
+    return default
+
+
+def is_served(name: str, draft_variants=()) -> bool:
+    """Geprüfte Varianten immer, Entwürfe nur explizit freigeschaltet (fail closed)."""
+    return name in VARIANTS and (VARIANTS[name]["reviewed"] or name in draft_variants)
+
+
+def get_variant(name: str) -> dict:
+    return VARIANTS[name]
+
+
+def contains_bad_pattern(variant_name: str, text: str) -> bool:
+    pattern = _BAD_PATTERN_RE[variant_name]
+    return pattern is not None and pattern.search((text or "").lower()) is not None
+
+
+def system_prompt(variant_name: str, params: dict) -> str:
+    v = VARIANTS[variant_name]
+    return f"""
+Du bist die Verkäuferperson eines neuen iPad (256 GB, Space Grey) inkl. Apple Pencil 2.
+Ausgangspreis: {params['list_price']} €
+Mindestpreis, unter dem du nicht verkaufen möchtest: {params['min_price']} € (dieser Wert wird NIEMALS erwähnt).
+
+WICHTIGE REGELN FÜR DIE VERHANDLUNG:
+1. Du verwendest ausschließlich echte iPad-Daten (256 GB).
+2. Du erwähnst NIEMALS deine Untergrenze und sagst nie Sätze wie "{params['min_price']} € ist das Minimum".
+{v['style_rules']}5. Maximal {params['max_sentences']} Sätze.
+"""
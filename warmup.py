@@ -0,0 +1,122 @@
+# ============================================
+# warmup.py – Cold-Start-Warmup (DB-Pool, LLM-Verbindung, Assets, Patterns)
+# ============================================
+#
+# Die Hosting-Plattform legt unbenutzte Apps schlafen; danach zahlt die erste
+# Session eines frischen Prozesses für DB-Login + DDL, den TLS-Handshake zur
+# LLM-API und das Base64-Kodieren der Bilder. start_warmup() startet diese
+# Schritte einmal pro Prozess parallel im Hintergrund, sobald der erste
+# Script-Run läuft; die erste Seite wartet nicht darauf. Bis der Participant
+# seine erste Nachricht schickt, sind Pool und Keep-Alive-Verbindung offen.
+#
+# Readiness: Warmup.status() (Admin-Seite) und eine Zeile auf stderr, wenn
+# alle Schritte durch sind. PREWARM = false schaltet das Warmup ab.
+
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from db_common import prewarm_pool
+from llm_providers import LLMProvider, TemplateProvider
+from ui_common import img_to_base64
+from variants import VARIANTS, contains_bad_pattern
+
+ASSETS = ["ipad.png", "bot.png", "user.png"]
+
+_CURRENT: "Warmup | None" = None
+
+
+class Warmup:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self.steps: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._pending = 0
+
+    def run(self, tasks: dict):
+        self._pending = len(tasks)
+        if not tasks:
+            self._finish()
+            return
+        # Script-Kontext des ersten Runs mitgeben, damit st.cache_data/st.secrets in den Threads greifen
+        ctx = get_script_run_ctx()
+        for name, fn in tasks.items():
+            t = threading.Thread(target=self._run_step, args=(name, fn), name=f"warmup-{name}", daemon=True)
+            add_script_run_ctx(t, ctx)
+            t.start()
+
+    def _run_step(self, name: str, fn):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.steps[name] = {"ok": error is None, "ms": round((time.perf_counter() - t0) * 1000, 1), "error": error}
+            self._pending -= 1
+            last = self._pending == 0
+        if last:
+            self._finish()
+
+    def _finish(self):
+        self.finished = time.monotonic()
+        self._done.set()
+        summary = ", ".join(
+            f"{name} {step['ms']:.0f} ms" + ("" if step["ok"] else f" (Fehler: {step['error']})")
+            for name, step in self.steps.items()
+        )
+        print(f"Warmup fertig nach {(self.finished - self.started) * 1000:.0f} ms: {summary or 'abgeschaltet'}",
+              file=sys.stderr)
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "total_ms": round((self.finished - self.started) * 1000, 1) if self.finished else None,
+                "steps": dict(self.steps),
+            }
+
+
+def _warm_assets():
+    for path in ASSETS:
+        img_to_base64(path)
+
+
+def _warm_patterns():
+    # Pattern-Listen der Varianten + Vorlagen-Fallback einmal durchlaufen
+    for name in VARIANTS:
+        contains_bad_pattern(name, "warmup")
+    TemplateProvider().complete([{"role": "system", "content": "Gegenangebot: 950 €"}])
+
+
+# _provider: mit Unterstrich, damit st.cache_resource das Objekt nicht hasht
+@st.cache_resource
+def start_warmup(_provider: LLMProvider) -> Warmup:
+    global _CURRENT
+    warmup = _CURRENT = Warmup()
+    enabled = str(st.secrets.get("PREWARM", "true")).lower() not in ("0", "false", "no")
+    warmup.run({
+        "db": prewarm_pool,
+        "llm": _provider.warmup,
+        "assets": _warm_assets,
+        "patterns": _warm_patterns,
+    } if enabled else {})
+    return warmup
+
+
+def warmup_status() -> dict | None:
+    """Status des Warmups dieses Prozesses; None, solange noch keine Chat-Session lief."""
+    return _CURRENT.status() if _CURRENT is not None else None